@@ -5,6 +5,7 @@ from flask_cors import CORS
 # --- IMPORTS PARA ESTRUTURA COM 'SRC' ---
 from .models.user import db
 from .models.data_models import DataSource, CollectedData, BusinessOpportunity, CollectionLog
+from .models.migrations import apply_migrations
 from .routes.user import user_bp
 from .routes.data_routes import data_bp
 from .routes.analysis_routes import analysis_bp
@@ -48,6 +49,7 @@ print("--- DEBUG PASSO 4: db.init_app(app) concluído com sucesso.")
 
 with app.app_context():
     db.create_all()
+    apply_migrations()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,68 @@
+import json
+import zlib
+from typing import Any, Optional
+
+# Primeiro byte das colunas comprimidas: formato do conteúdo
+FORMAT_ZLIB = 1
+FORMAT_ZLIB_ANALYSIS_V1 = 2
+
+COMPRESSION_LEVEL = 6
+
+# Dicionário pré-definido (zlib zdict) com as chaves e textos que se repetem em
+# todo analysis_data; linhas de ~1 KB passam de ~2x para ~6x de compressão.
+# NUNCA alterar: linhas gravadas com FORMAT_ZLIB_ANALYSIS_V1 dependem dele.
+# Um dicionário novo exige um novo formato.
+ANALYSIS_ZDICT_V1 = (
+    '"NÃO RECOMENDADO: Alto risco devido à saturação do mercado ou baixa demanda."'
+    '"BAIXA OPORTUNIDADE: Mercado saturado ou com baixa demanda."'
+    '"OPORTUNIDADE MODERADA: Requer análise mais detalhada e estratégia diferenciada."'
+    '"BOA OPORTUNIDADE: Mercado promissor com potencial de crescimento."'
+    '"EXCELENTE OPORTUNIDADE: Alta demanda, baixa concorrência e boa aceitação do mercado."'
+    '"Oportunidade para preços competitivos", "Oportunidade para serviço mais rápido", '
+    '"Oportunidade para maior variedade"], "Atendimento demorado", "Preços altos", '
+    '"Falta de variedade"], "positive", "negative", "low", "high", '
+    '{"business_type": "", "opportunity_score": , "density_analysis": {"current_count": , '
+    '"ideal_count": , "density_per_1000": , "density_per_10000": , "gap_percentage": , '
+    '"has_opportunity": false}, "demand_analysis": {"demand_score": , "population_factor": , '
+    '"density_factor": , "rent_factor": , "vacancy_adjustment": , "estimated_monthly_customers": }, '
+    '"competition_analysis": {"competition_level": "medium", "competition_score": , '
+    '"market_saturation": , "growth_trend": , "establishment_count": , "density_per_100k": }, '
+    '"sentiment_analysis": {"sentiment_score": , "sentiment_impact": "neutral", "main_complaints": ['
+    '"opportunity_indicators": [], "total_mentions": , "raw_sentiment_score": }, "recommendation": "'
+).encode('utf-8')
+
+_ZDICTS = {
+    FORMAT_ZLIB: None,
+    FORMAT_ZLIB_ANALYSIS_V1: ANALYSIS_ZDICT_V1
+}
+
+
+def compress_json(data: Any, fmt: int = FORMAT_ZLIB) -> Optional[bytes]:
+    """Serializa em JSON e comprime; o primeiro byte identifica o formato"""
+    if data is None:
+        return None
+    raw = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    zdict = _ZDICTS[fmt]
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zdict=zdict) if zdict else zlib.compressobj(COMPRESSION_LEVEL)
+    return bytes([fmt]) + compressor.compress(raw) + compressor.flush()
+
+
+def decompress_text(blob: Optional[bytes], legacy_text: Optional[str] = None) -> Optional[str]:
+    """
+    JSON em texto a partir da coluna comprimida ou, em linhas ainda não
+    migradas, da coluna de texto antiga
+    """
+    if blob:
+        blob = bytes(blob)
+        zdict = _ZDICTS.get(blob[0], False)
+        if zdict is False:
+            raise ValueError(f'Formato de compressão desconhecido: {blob[0]}')
+        decompressor = zlib.decompressobj(zdict=zdict) if zdict else zlib.decompressobj()
+        return (decompressor.decompress(blob[1:]) + decompressor.flush()).decode('utf-8')
+    return legacy_text or None
+
+
+def decompress_json(blob: Optional[bytes], legacy_text: Optional[str] = None) -> Any:
+    """Objeto Python a partir da coluna comprimida ou do texto antigo"""
+    text = decompress_text(blob, legacy_text)
+    return json.loads(text) if text else None
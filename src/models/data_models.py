@@ -1,7 +1,31 @@
 from src.models.user import db
+from src.models.compression import compress_json, decompress_json, FORMAT_ZLIB, FORMAT_ZLIB_ANALYSIS_V1
+from src.services.normalization import fold_name
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 import json
 
+# Documentos JSON: JSONB no PostgreSQL (sub-chaves extraídas no servidor),
+# JSON/texto nos demais bancos
+JSONDocument = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+def native_json() -> bool:
+    """
+    Indica se os documentos são gravados nas colunas JSONB (PostgreSQL);
+    nos demais bancos, continuam no JSON comprimido (LargeBinary)
+    """
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+def _region_key_default(context):
+    """region_key de linhas novas: region sem acentos, em minúsculas"""
+    region = context.get_current_parameters().get('region')
+    return fold_name(region) if region is not None else None
+
+def _city_key_default(context):
+    """city_key de linhas novas: city sem acentos, em minúsculas"""
+    city = context.get_current_parameters().get('city')
+    return fold_name(city) if city is not None else None
+
 class DataSource(db.Model):
     """Modelo para armazenar informações sobre fontes de dados"""
     __tablename__ = 'data_sources'
@@ -20,43 +44,115 @@ class DataSource(db.Model):
 class CollectedData(db.Model):
     """Modelo para armazenar dados coletados de diferentes fontes"""
     __tablename__ = 'collected_data'
+    __table_args__ = (
+        db.Index('ix_collected_data_type_region_key_time', 'data_type', 'region_key', 'collection_timestamp'),
+        # Paginação por cursor (collection_timestamp, id)
+        db.Index('ix_collected_data_time_id', 'collection_timestamp', 'id'),
+        db.Index('ix_collected_data_type_time_id', 'data_type', 'collection_timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     source_id = db.Column(db.Integer, db.ForeignKey('data_sources.id'), nullable=False)
     data_type = db.Column(db.String(50), nullable=False)  # 'demographic', 'commercial', 'social', etc.
     region = db.Column(db.String(100))  # bairro, cidade, estado
+    region_key = db.Column(db.String(100), default=_region_key_default)  # region normalizada (filtros)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
-    raw_data = db.Column(db.Text)  # JSON string dos dados brutos
-    processed_data = db.Column(db.Text)  # JSON string dos dados processados
+    geohash = db.Column(db.BigInteger, index=True)  # geohash inteiro de latitude/longitude
+    # Payloads carregados apenas quando solicitados (um grupo por documento)
+    raw_data = db.deferred(db.Column(db.Text), group='raw_data')  # JSON string dos dados brutos (formato antigo)
+    processed_data = db.deferred(db.Column(db.Text), group='processed_data')  # JSON string (formato antigo)
+    raw_data_compressed = db.deferred(db.Column(db.LargeBinary), group='raw_data')  # JSON comprimido
+    processed_data_compressed = db.deferred(db.Column(db.LargeBinary), group='processed_data')  # JSON comprimido
+    raw_data_json = db.deferred(db.Column(JSONDocument), group='raw_data')  # JSONB (PostgreSQL)
+    processed_data_json = db.deferred(db.Column(JSONDocument), group='processed_data')  # JSONB (PostgreSQL)
     collection_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     def set_raw_data(self, data):
-        """Converte dados para JSON string"""
-        self.raw_data = json.dumps(data, ensure_ascii=False)
+        """Grava os dados em JSONB (PostgreSQL) ou JSON comprimido"""
+        if native_json():
+            self.raw_data_json, self.raw_data_compressed = data, None
+        else:
+            self.raw_data_json, self.raw_data_compressed = None, compress_json(data, FORMAT_ZLIB)
+        self.raw_data = None
     
     def get_raw_data(self):
-        """Retorna dados como objeto Python"""
-        if self.raw_data:
-            return json.loads(self.raw_data)
-        return None
+        """Retorna dados como objeto Python (JSONB, comprimidos ou no texto antigo)"""
+        if self.raw_data_json is not None:
+            return self.raw_data_json
+        return decompress_json(self.raw_data_compressed, self.raw_data)
     
     def set_processed_data(self, data):
-        """Converte dados processados para JSON string"""
-        self.processed_data = json.dumps(data, ensure_ascii=False)
+        """Grava os dados processados em JSONB (PostgreSQL) ou JSON comprimido"""
+        if native_json():
+            self.processed_data_json, self.processed_data_compressed = data, None
+        else:
+            self.processed_data_json, self.processed_data_compressed = None, compress_json(data, FORMAT_ZLIB)
+        self.processed_data = None
     
     def get_processed_data(self):
-        """Retorna dados processados como objeto Python"""
-        if self.processed_data:
-            return json.loads(self.processed_data)
-        return None
+        """Retorna dados processados como objeto Python (JSONB, comprimidos ou no texto antigo)"""
+        if self.processed_data_json is not None:
+            return self.processed_data_json
+        return decompress_json(self.processed_data_compressed, self.processed_data)
+
+class CollectedRecord(db.Model):
+    """Registro individual (localidade/categoria) de uma coleta, com colunas tipadas"""
+    __tablename__ = 'collected_records'
+    __table_args__ = (
+        db.Index('ix_collected_records_type_region_time', 'data_type', 'region', 'collection_timestamp'),
+        db.Index('ix_collected_records_type_city', 'data_type', 'city'),
+        db.Index('ix_collected_records_source_type', 'source_id', 'data_type'),
+        db.Index('ix_collected_records_region_key_type', 'region_key', 'data_type'),
+        db.Index('ix_collected_records_city_key_type', 'city_key', 'data_type'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    collection_id = db.Column(db.Integer, db.ForeignKey('collected_data.id'), nullable=False, index=True)
+    source_id = db.Column(db.Integer, db.ForeignKey('data_sources.id'), nullable=False)
+    data_type = db.Column(db.String(50), nullable=False)
+    region = db.Column(db.String(100))  # localidade do registro (município, cidade, bairro)
+    city = db.Column(db.String(100))
+    state = db.Column(db.String(2))
+    category = db.Column(db.String(100))
+    region_key = db.Column(db.String(100), default=_region_key_default)  # region normalizada (filtros)
+    city_key = db.Column(db.String(100), default=_city_key_default)  # city normalizada (filtros)
+    population = db.Column(db.BigInteger)
+    density = db.Column(db.Float)
+    establishments = db.Column(db.Integer)
+    density_per_100k = db.Column(db.Float)
+    growth_rate = db.Column(db.Float)
+    avg_monthly_revenue = db.Column(db.Float)
+    mentions = db.Column(db.Integer)
+    sentiment_score = db.Column(db.Float)
+    commercial_rent = db.Column(db.Float)
+    residential_rent = db.Column(db.Float)
+    vacancy_rate = db.Column(db.Float)
+    attributes = db.Column(db.Text)  # JSON com os demais campos do registro
+    content_hash = db.Column(db.String(32))  # hash do conteúdo, para a coleta incremental
+    is_deleted = db.Column(db.Boolean, nullable=False, default=False)  # tombstone: registro removido da fonte
+    collection_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def get_attributes(self):
+        """Retorna os demais campos como objeto Python"""
+        if self.attributes:
+            return json.loads(self.attributes)
+        return {}
 
 class BusinessOpportunity(db.Model):
     """Modelo para armazenar oportunidades de negócio identificadas"""
     __tablename__ = 'business_opportunities'
+    __table_args__ = (
+        # Uma oportunidade por região e tipo de negócio (chave do upsert)
+        db.Index('ux_business_opportunities_region_type', 'region', 'business_type', unique=True),
+        db.Index('ix_business_opportunities_region_key_type', 'region_key', 'business_type'),
+        # Gravações recentes (tiles de heatmap de outros processos, histórico)
+        db.Index('ix_business_opportunities_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     region = db.Column(db.String(100), nullable=False)
+    region_key = db.Column(db.String(100), default=_region_key_default)  # region normalizada (filtros)
     business_type = db.Column(db.String(100), nullable=False)  # 'pet_shop', 'barbershop', etc.
     opportunity_score = db.Column(db.Float)  # Score de 0 a 100
     population_density = db.Column(db.Float)
@@ -64,19 +160,77 @@ class BusinessOpportunity(db.Model):
     estimated_demand = db.Column(db.Integer)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
-    analysis_data = db.Column(db.Text)  # JSON com dados da análise
+    geohash = db.Column(db.BigInteger, index=True)  # geohash inteiro de latitude/longitude
+    # Dados da análise carregados apenas quando solicitados
+    analysis_data = db.deferred(db.Column(db.Text), group='analysis_data')  # JSON (formato antigo)
+    analysis_data_compressed = db.deferred(db.Column(db.LargeBinary), group='analysis_data')  # JSON comprimido (zdict)
+    analysis_data_json = db.deferred(db.Column(JSONDocument), group='analysis_data')  # JSONB (PostgreSQL)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def set_analysis_data(self, data):
-        """Converte dados de análise para JSON string"""
-        self.analysis_data = json.dumps(data, ensure_ascii=False)
+        """Grava os dados de análise em JSONB (PostgreSQL) ou JSON comprimido"""
+        if native_json():
+            self.analysis_data_json, self.analysis_data_compressed = data, None
+        else:
+            self.analysis_data_json = None
+            self.analysis_data_compressed = compress_json(data, FORMAT_ZLIB_ANALYSIS_V1)
+        self.analysis_data = None
     
     def get_analysis_data(self):
-        """Retorna dados de análise como objeto Python"""
-        if self.analysis_data:
-            return json.loads(self.analysis_data)
-        return None
+        """Retorna dados de análise como objeto Python (JSONB, comprimidos ou no texto antigo)"""
+        if self.analysis_data_json is not None:
+            return self.analysis_data_json
+        return decompress_json(self.analysis_data_compressed, self.analysis_data)
+
+# Índices de top-K: por categoria e global, ordenados por score decrescente
+db.Index(
+    'ix_business_opportunities_type_score',
+    BusinessOpportunity.business_type, BusinessOpportunity.opportunity_score.desc(), BusinessOpportunity.id
+)
+db.Index(
+    'ix_business_opportunities_score',
+    BusinessOpportunity.opportunity_score.desc(), BusinessOpportunity.id
+)
+
+class Municipality(db.Model):
+    """Municípios do IBGE com a hierarquia micro/mesorregião, UF e grande região"""
+    __tablename__ = 'municipalities'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # código IBGE
+    name = db.Column(db.String(100), nullable=False)
+    microregion_id = db.Column(db.Integer)
+    microregion_name = db.Column(db.String(100))
+    mesoregion_id = db.Column(db.Integer)
+    mesoregion_name = db.Column(db.String(100))
+    state_id = db.Column(db.Integer)
+    state_code = db.Column(db.String(2), index=True)  # sigla da UF
+    state_name = db.Column(db.String(50))
+    macroregion_id = db.Column(db.Integer)
+    macroregion_code = db.Column(db.String(2))  # sigla da grande região
+    macroregion_name = db.Column(db.String(20))
+    latitude = db.Column(db.Float)  # centróide (malhas do IBGE)
+    longitude = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EstablishmentCount(db.Model):
+    """Contagem de estabelecimentos ativos (CNPJ) por município, bairro e categoria"""
+    __tablename__ = 'establishment_counts'
+    __table_args__ = (
+        db.Index(
+            'ux_establishment_counts_import_key',
+            'import_id', 'municipality_code', 'neighborhood', 'category', unique=True
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    import_id = db.Column(db.String(32))  # importação que gerou a linha (só a última publicada é mantida)
+    municipality_code = db.Column(db.String(4), nullable=False)  # código de município da Receita (TOM)
+    state = db.Column(db.String(2))
+    neighborhood = db.Column(db.String(100), nullable=False, default='')  # '' = sem bairro
+    category = db.Column(db.String(100), nullable=False)
+    establishments = db.Column(db.Integer, nullable=False, default=0)
+    opened_last_year = db.Column(db.Integer, nullable=False, default=0)
 
 class CollectionLog(db.Model):
     """Modelo para log de execuções de coleta de dados"""
@@ -91,3 +245,10 @@ class CollectionLog(db.Model):
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
     finished_at = db.Column(db.DateTime)
 
+class SchedulerLock(db.Model):
+    """Lease de instância única do agendador de coletas"""
+    __tablename__ = 'scheduler_locks'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,426 @@
+from src.models.user import db
+from sqlalchemy import text, inspect, LargeBinary
+from src.models.compression import FORMAT_ZLIB, FORMAT_ZLIB_ANALYSIS_V1
+from src.models.data_models import JSONDocument
+import json
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def add_column(table, column, ddl):
+    """
+    Passo de migração que adiciona a coluna apenas se ela ainda não existir.
+    ddl é SQL ou um tipo do SQLAlchemy (compilado para o dialeto do banco).
+    """
+    def step(connection):
+        columns = {c['name'] for c in inspect(connection).get_columns(table)}
+        if column not in columns:
+            column_type = ddl if isinstance(ddl, str) else ddl.compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+    return step
+
+def compress_column(table, text_column, compressed_column, fmt, batch_size=500):
+    """
+    Passo de migração que move o JSON em texto para a coluna comprimida, em
+    lotes, limpando o texto. A leitura aceita os dois formatos durante a transição.
+    No PostgreSQL não faz nada: move_to_jsonb leva o texto direto para JSONB,
+    que o TOAST já comprime.
+    """
+    def step(connection):
+        if connection.dialect.name == 'postgresql':
+            return
+        from src.models.compression import compress_json
+        while True:
+            rows = connection.execute(text(
+                f"SELECT id, {text_column} FROM {table} "
+                f"WHERE {text_column} IS NOT NULL AND {compressed_column} IS NULL "
+                f"ORDER BY id LIMIT {batch_size}"
+            )).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, value in rows:
+                try:
+                    data = json.loads(value)
+                except ValueError:
+                    data = value  # texto que não é JSON é preservado como string
+                updates.append({'id': row_id, 'compressed': compress_json(data, fmt)})
+            connection.execute(text(
+                f"UPDATE {table} SET {compressed_column} = :compressed, {text_column} = NULL WHERE id = :id"
+            ), updates)
+    return step
+
+def backfill_geohash(table):
+    """Passo de migração que calcula o geohash das linhas com coordenadas"""
+    def step(connection):
+        from src.services.geo import geohash
+        rows = connection.execute(text(
+            f"SELECT id, latitude, longitude FROM {table} "
+            f"WHERE geohash IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL"
+        )).all()
+        updates = [{'id': row[0], 'geohash': geohash(row[1], row[2])} for row in rows]
+        if updates:
+            connection.execute(text(f"UPDATE {table} SET geohash = :geohash WHERE id = :id"), updates)
+    return step
+
+def backfill_collected_records(connection):
+    """Passo de migração que explode os payloads já gravados em collected_records"""
+    from src.services.collected_records import explode_payload, RECORD_INSERT_CHUNK_SIZE
+    from src.models.data_models import CollectedRecord
+    pending = connection.execute(text(
+        "SELECT id FROM collected_data "
+        "WHERE id NOT IN (SELECT DISTINCT collection_id FROM collected_records)"
+    )).scalars().all()
+    for collection_id in pending:
+        # Um payload por vez em memória
+        source_id, data_type, raw_data = connection.execute(text(
+            "SELECT source_id, data_type, raw_data FROM collected_data WHERE id = :id"
+        ), {'id': collection_id}).one()
+        try:
+            payload = json.loads(raw_data) if raw_data else None
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            continue
+        records = explode_payload(payload, data_type)
+        for record in records:
+            record['collection_id'] = collection_id
+            record['source_id'] = source_id
+        for start in range(0, len(records), RECORD_INSERT_CHUNK_SIZE):
+            connection.execute(
+                CollectedRecord.__table__.insert(), records[start:start + RECORD_INSERT_CHUNK_SIZE]
+            )
+
+def backfill_content_hash(connection, batch_size=1000):
+    """Passo de migração que calcula content_hash dos registros já gravados"""
+    from src.services.collected_records import HASHED_COLUMNS, record_hash
+    columns = ', '.join(HASHED_COLUMNS)
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            f"SELECT id, {columns} FROM collected_records "
+            f"WHERE id > :last_id AND content_hash IS NULL ORDER BY id LIMIT {batch_size}"
+        ), {'last_id': last_id}).mappings().all()
+        if not rows:
+            break
+        connection.execute(
+            text("UPDATE collected_records SET content_hash = :content_hash WHERE id = :id"),
+            [{'id': row['id'], 'content_hash': record_hash(dict(row))} for row in rows]
+        )
+        last_id = rows[-1]['id']
+
+def backfill_region_key(table, batch_size=1000, source='region', target='region_key'):
+    """Passo de migração que preenche region_key (region sem acentos, minúscula)"""
+    def step(connection):
+        from src.services.normalization import fold_name
+        last_id = 0
+        while True:
+            rows = connection.execute(text(
+                f"SELECT id, {source} FROM {table} "
+                f"WHERE id > :last_id AND {target} IS NULL AND {source} IS NOT NULL "
+                f"ORDER BY id LIMIT {batch_size}"
+            ), {'last_id': last_id}).all()
+            if not rows:
+                break
+            connection.execute(
+                text(f"UPDATE {table} SET {target} = :key WHERE id = :id"),
+                [{'id': row_id, 'key': fold_name(value)} for row_id, value in rows]
+            )
+            last_id = rows[-1][0]
+    return step
+
+def trigram_indexes(connection):
+    """
+    Passo de migração (apenas PostgreSQL) com índices de trigramas para as
+    buscas "contém" em region_key. Sem permissão para criar a extensão
+    pg_trgm, as buscas continuam funcionando sem o índice.
+    """
+    if connection.dialect.name != 'postgresql':
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        logger.warning(f"Extensão pg_trgm indisponível; índices de trigramas não criados: {str(e)}")
+        return
+    for table in ('business_opportunities', 'collected_data'):
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_region_key_trgm "
+            f"ON {table} USING gin (region_key gin_trgm_ops)"
+        ))
+
+def move_to_jsonb(table, json_column, compressed_column, text_column, batch_size=500):
+    """
+    Passo de migração (apenas PostgreSQL) que move os documentos comprimidos
+    ou em texto para a coluna JSONB, em lotes. Nos demais bancos eles
+    continuam no JSON comprimido.
+    """
+    def step(connection):
+        if connection.dialect.name != 'postgresql':
+            return
+        from src.models.compression import decompress_text
+        statement = text(
+            f"UPDATE {table} SET {json_column} = CAST(:document AS JSONB), "
+            f"{compressed_column} = NULL, {text_column} = NULL WHERE id = :id"
+        )
+        while True:
+            rows = connection.execute(text(
+                f"SELECT id, {compressed_column}, {text_column} FROM {table} "
+                f"WHERE {json_column} IS NULL AND ({compressed_column} IS NOT NULL OR {text_column} IS NOT NULL) "
+                f"ORDER BY id LIMIT {batch_size}"
+            )).all()
+            if not rows:
+                break
+            connection.execute(statement, [
+                {'id': row_id, 'document': decompress_text(compressed, legacy) or 'null'}
+                for row_id, compressed, legacy in rows
+            ])
+    return step
+
+# Migrações aplicadas após db.create_all(), registradas em schema_migrations.
+# create_all() só cria tabelas novas; alterações em tabelas existentes ficam aqui.
+# Cada passo é SQL ou uma função que recebe a conexão.
+MIGRATIONS = [
+    (
+        'business_opportunities_unique_region_type',
+        [
+            # Remover duplicatas antigas, mantendo o registro mais recente
+            """
+            DELETE FROM business_opportunities
+            WHERE id NOT IN (
+                SELECT max_id FROM (
+                    SELECT MAX(id) AS max_id
+                    FROM business_opportunities
+                    GROUP BY region, business_type
+                ) AS latest
+            )
+            """,
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_business_opportunities_region_type
+            ON business_opportunities (region, business_type)
+            """
+        ]
+    ),
+    (
+        'business_opportunities_top_k_indexes',
+        [
+            """
+            CREATE INDEX IF NOT EXISTS ix_business_opportunities_type_score
+            ON business_opportunities (business_type, opportunity_score DESC, id)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_business_opportunities_score
+            ON business_opportunities (opportunity_score DESC, id)
+            """
+        ]
+    ),
+    (
+        'geohash_spatial_index',
+        [
+            add_column('collected_data', 'geohash', 'BIGINT'),
+            add_column('business_opportunities', 'geohash', 'BIGINT'),
+            "CREATE INDEX IF NOT EXISTS ix_collected_data_geohash ON collected_data (geohash)",
+            "CREATE INDEX IF NOT EXISTS ix_business_opportunities_geohash ON business_opportunities (geohash)",
+            backfill_geohash('collected_data'),
+            backfill_geohash('business_opportunities')
+        ]
+    ),
+    (
+        'collected_records_backfill',
+        [
+            backfill_collected_records,
+            # Coletas antigas rotuladas como 'Brasil' recebem a localidade comum dos registros
+            """
+            UPDATE collected_data SET region = (
+                SELECT MIN(collected_records.region) FROM collected_records
+                WHERE collected_records.collection_id = collected_data.id
+            )
+            WHERE region = 'Brasil' AND 1 = (
+                SELECT COUNT(DISTINCT collected_records.region) FROM collected_records
+                WHERE collected_records.collection_id = collected_data.id
+            )
+            """,
+            # ... ou, se houver várias localidades, a cidade comum
+            """
+            UPDATE collected_data SET region = (
+                SELECT MIN(collected_records.city) FROM collected_records
+                WHERE collected_records.collection_id = collected_data.id
+            )
+            WHERE region = 'Brasil' AND 1 = (
+                SELECT COUNT(DISTINCT collected_records.city) FROM collected_records
+                WHERE collected_records.collection_id = collected_data.id
+            ) AND NOT EXISTS (
+                SELECT 1 FROM collected_records
+                WHERE collected_records.collection_id = collected_data.id
+                AND collected_records.city IS NULL
+            )
+            """
+        ]
+    ),
+    (
+        'compressed_json_columns',
+        [
+            add_column('collected_data', 'raw_data_compressed', LargeBinary()),
+            add_column('collected_data', 'processed_data_compressed', LargeBinary()),
+            add_column('business_opportunities', 'analysis_data_compressed', LargeBinary()),
+            compress_column('collected_data', 'raw_data', 'raw_data_compressed', FORMAT_ZLIB),
+            compress_column('collected_data', 'processed_data', 'processed_data_compressed', FORMAT_ZLIB),
+            compress_column(
+                'business_opportunities', 'analysis_data', 'analysis_data_compressed', FORMAT_ZLIB_ANALYSIS_V1
+            )
+        ]
+    ),
+    (
+        'collected_records_delta',
+        [
+            add_column('collected_records', 'content_hash', 'VARCHAR(32)'),
+            add_column('collected_records', 'is_deleted', 'BOOLEAN NOT NULL DEFAULT FALSE'),
+            "CREATE INDEX IF NOT EXISTS ix_collected_records_source_type ON collected_records (source_id, data_type)",
+            backfill_content_hash
+        ]
+    ),
+    (
+        'municipality_centroids',
+        [
+            add_column('municipalities', 'latitude', 'FLOAT'),
+            add_column('municipalities', 'longitude', 'FLOAT')
+        ]
+    ),
+    (
+        'region_keys',
+        [
+            add_column('business_opportunities', 'region_key', 'VARCHAR(100)'),
+            add_column('collected_data', 'region_key', 'VARCHAR(100)'),
+            backfill_region_key('business_opportunities'),
+            backfill_region_key('collected_data'),
+            """
+            CREATE INDEX IF NOT EXISTS ix_business_opportunities_region_key_type
+            ON business_opportunities (region_key, business_type)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_collected_data_type_region_key_time
+            ON collected_data (data_type, region_key, collection_timestamp)
+            """,
+            trigram_indexes
+        ]
+    ),
+    (
+        'jsonb_documents',
+        [
+            add_column('collected_data', 'raw_data_json', JSONDocument),
+            add_column('collected_data', 'processed_data_json', JSONDocument),
+            add_column('business_opportunities', 'analysis_data_json', JSONDocument),
+            move_to_jsonb('collected_data', 'raw_data_json', 'raw_data_compressed', 'raw_data'),
+            move_to_jsonb('collected_data', 'processed_data_json', 'processed_data_compressed', 'processed_data'),
+            move_to_jsonb(
+                'business_opportunities', 'analysis_data_json', 'analysis_data_compressed', 'analysis_data'
+            )
+        ]
+    ),
+    (
+        'collected_data_keyset_indexes',
+        [
+            "CREATE INDEX IF NOT EXISTS ix_collected_data_time_id ON collected_data (collection_timestamp, id)",
+            """
+            CREATE INDEX IF NOT EXISTS ix_collected_data_type_time_id
+            ON collected_data (data_type, collection_timestamp, id)
+            """
+        ]
+    ),
+    (
+        'collected_records_keys',
+        [
+            add_column('collected_records', 'region_key', 'VARCHAR(100)'),
+            add_column('collected_records', 'city_key', 'VARCHAR(100)'),
+            backfill_region_key('collected_records'),
+            backfill_region_key('collected_records', source='city', target='city_key'),
+            """
+            CREATE INDEX IF NOT EXISTS ix_collected_records_region_key_type
+            ON collected_records (region_key, data_type)
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS ix_collected_records_city_key_type
+            ON collected_records (city_key, data_type)
+            """
+        ]
+    ),
+    (
+        'establishment_counts_import_id',
+        [
+            add_column('establishment_counts', 'import_id', 'VARCHAR(32)'),
+            "DROP INDEX IF EXISTS ux_establishment_counts_key",
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_establishment_counts_import_key
+            ON establishment_counts (import_id, municipality_code, neighborhood, category)
+            """
+        ]
+    ),
+    (
+        'business_opportunities_updated_at_index',
+        [
+            "CREATE INDEX IF NOT EXISTS ix_business_opportunities_updated_at ON business_opportunities (updated_at)"
+        ]
+    ),
+]
+
+# Chave do advisory lock (PostgreSQL) que serializa as migrações entre workers
+MIGRATION_LOCK_KEY = 0x4D4F42454C
+
+def _lock_migrations(connection):
+    """
+    Serializa apply_migrations entre processos: no PostgreSQL, com um
+    advisory lock de sessão; no SQLite, o lock de escrita do banco já
+    serializa as transações de cada migração.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        connection.commit()
+
+def _unlock_migrations(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': MIGRATION_LOCK_KEY})
+        connection.commit()
+
+def apply_migrations():
+    """
+    Aplica, uma única vez cada e em ordem, as migrações ainda não registradas
+    em schema_migrations. Cada migração registra seu nome na mesma transação
+    em que é aplicada, antes dos passos; a primeira falha interrompe as
+    seguintes (que podem depender dela) e é propagada.
+    """
+    with db.engine.connect() as lock_connection:
+        _lock_migrations(lock_connection)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    "name VARCHAR(100) PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+                ))
+                applied = {row[0] for row in connection.execute(text("SELECT name FROM schema_migrations"))}
+            
+            for name, statements in MIGRATIONS:
+                if name in applied:
+                    continue
+                try:
+                    with db.engine.begin() as connection:
+                        # Reivindica a migração: outro worker que chegue depois
+                        # espera este commit e encontra o registro
+                        claimed = connection.execute(text(
+                            "INSERT INTO schema_migrations (name) "
+                            "SELECT :name WHERE NOT EXISTS (SELECT 1 FROM schema_migrations WHERE name = :name)"
+                        ), {'name': name}).rowcount
+                        if not claimed:
+                            continue
+                        for statement in statements:
+                            if callable(statement):
+                                statement(connection)
+                            else:
+                                connection.execute(text(statement))
+                    logger.info(f"Migração aplicada: {name}")
+                except Exception as e:
+                    logger.error(f"Erro ao aplicar migração {name}; migrações seguintes não aplicadas: {str(e)}")
+                    raise
+        finally:
+            _unlock_migrations(lock_connection)
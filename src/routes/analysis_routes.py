@@ -1,7 +1,15 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 # --- IMPORTS CORRIGIDOS ---
 # Usamos '..' para subir um nível (de 'routes' para 'src') e depois encontrar as outras pastas.
 from ..services.opportunity_analysis import OpportunityAnalysisService
+from ..services.opportunity_persistence import bulk_upsert_opportunities
+from ..services.scenario_engine import ScenarioEngine, parse_top
+from ..services.top_opportunities import top_opportunities_index, serialize_opportunity_summary
+from ..services.spatial_index import SpatialQueryService, MAX_SPATIAL_RESULTS, parse_bbox, parse_limit, parse_point
+from ..services.heatmap_tiles import heatmap_tile_cache, MAX_TILE_ZOOM, ALL_BUSINESS_TYPES
+from ..services.search_filters import region_key_filter, business_type_filter
+from ..services.payload_fields import payload_field_columns, payload_field_values
+import threading
 from ..models.data_models import db, BusinessOpportunity
 import logging
 
@@ -15,6 +23,21 @@ analysis_bp = Blueprint('analysis', __name__)
 # Instanciar serviço de análise
 analysis_service = OpportunityAnalysisService()
 
+# Motor de cenários sobre as componentes de score salvas
+scenario_engine = ScenarioEngine(analysis_service.score_weights)
+
+# Consultas espaciais (raio e viewport)
+spatial_service = SpatialQueryService()
+
+# Limite de regiões aceitas por requisição de análise em lote
+MAX_BATCH_REGIONS = 5000
+
+# Chaves de analysis_data devolvidas na listagem de oportunidades
+OPPORTUNITY_ANALYSIS_FIELDS = ['recommendation', 'demand_analysis', 'competition_analysis']
+
+# Impede recálculos de tiles simultâneos no processo
+_tile_refresh_lock = threading.Lock()
+
 @analysis_bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar saúde da API de análise"""
@@ -36,45 +59,9 @@ def analyze_region(region):
         result = analysis_service.analyze_region_opportunities(region)
         
         if result.get('status') == 'success':
-            # Salvar oportunidades no banco de dados (lógica existente)
-            saved_count = 0
-            for opportunity in result.get('all_opportunities', []):
-                try:
-                    # Verificar se já existe uma oportunidade similar
-                    existing = BusinessOpportunity.query.filter_by(
-                        region=region,
-                        business_type=opportunity['business_type']
-                    ).first()
-                    
-                    if existing:
-                        # Atualizar existente
-                        existing.opportunity_score = opportunity['opportunity_score']
-                        existing.competition_level = opportunity['competition_analysis']['competition_level']
-                        existing.estimated_demand = opportunity['demand_analysis']['estimated_monthly_customers']
-                        existing.set_analysis_data(opportunity)
-                    else:
-                        # Criar nova oportunidade
-                        new_opportunity = BusinessOpportunity(
-                            region=region,
-                            business_type=opportunity['business_type'],
-                            opportunity_score=opportunity['opportunity_score'],
-                            population_density=result['region_summary']['density'],
-                            competition_level=opportunity['competition_analysis']['competition_level'],
-                            estimated_demand=opportunity['demand_analysis']['estimated_monthly_customers'],
-                            latitude=-23.5505,  # Coordenadas padrão (São Paulo)
-                            longitude=-46.6333
-                        )
-                        new_opportunity.set_analysis_data(opportunity)
-                        db.session.add(new_opportunity)
-                    
-                    saved_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao salvar oportunidade {opportunity['business_type']}: {str(e)}")
-                    continue
-            
-            # Commit das mudanças
+            # Salvar oportunidades no banco de dados (upsert em uma instrução)
             try:
+                saved_count = bulk_upsert_opportunities([result])
                 db.session.commit()
                 logger.info(f"Salvou {saved_count} oportunidades no banco de dados")
             except Exception as e:
@@ -93,6 +80,121 @@ def analyze_region(region):
             'error': str(e)
         }), 500
 
+@analysis_bp.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analisa oportunidades para várias regiões em paralelo (pool de processos)"""
+    try:
+        data = request.get_json() or {}
+        regions = data.get('regions', [])
+        persist = data.get('persist', True)
+        include_all = data.get('include_all_opportunities', False)
+        max_workers = data.get('max_workers')
+        
+        if not isinstance(regions, list) or not regions:
+            return jsonify({
+                'success': False,
+                'error': 'É necessário fornecer uma lista de regiões'
+            }), 400
+        
+        if len(regions) > MAX_BATCH_REGIONS:
+            return jsonify({
+                'success': False,
+                'error': f'Máximo de {MAX_BATCH_REGIONS} regiões por requisição'
+            }), 400
+        
+        if max_workers is not None and (
+            isinstance(max_workers, bool) or not isinstance(max_workers, int) or max_workers < 1
+        ):
+            return jsonify({
+                'success': False,
+                'error': 'max_workers deve ser um inteiro maior ou igual a 1'
+            }), 400
+        
+        # Remover duplicadas preservando a ordem
+        regions = list(dict.fromkeys(str(region) for region in regions))
+        logger.info(f"Iniciando análise em lote para {len(regions)} regiões")
+        
+        results = analysis_service.analyze_regions_parallel(
+            regions, max_workers=max_workers
+        )
+        successful = [r for r in results if r.get('status') == 'success']
+        
+        saved_count = 0
+        if persist and successful:
+            # Upsert e commit únicos para todo o lote
+            try:
+                saved_count = bulk_upsert_opportunities(successful)
+                db.session.commit()
+                logger.info(f"Salvou {saved_count} oportunidades no banco de dados")
+            except Exception as e:
+                logger.error(f"Erro ao fazer commit: {str(e)}")
+                db.session.rollback()
+                saved_count = 0
+        
+        if not include_all:
+            results = [
+                {key: value for key, value in r.items() if key != 'all_opportunities'}
+                for r in results
+            ]
+        
+        return jsonify({
+            'success': True,
+            'total_regions': len(regions),
+            'total_success': len(successful),
+            'total_errors': len(results) - len(successful),
+            'saved_opportunities': saved_count,
+            'results': results
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na análise em lote: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@analysis_bp.route('/scenarios', methods=['POST'])
+def run_scenarios():
+    """Reavalia as oportunidades salvas sob pesos alternativos (what-if)"""
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            scenarios = scenario_engine.build_scenarios(data.get('scenarios'), data.get('grid'))
+            top = parse_top(data.get('top', 10))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        result = scenario_engine.run(
+            scenarios,
+            region=data.get('region'),
+            business_type=data.get('business_type'),
+            top=top
+        )
+        
+        return jsonify({
+            'success': True,
+            'result': result
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao executar cenários: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@analysis_bp.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Retorna contadores do cache de features por região"""
+    return jsonify({
+        'success': True,
+        'cache': analysis_service.feature_cache.stats()
+    })
+
 @analysis_bp.route('/opportunities', methods=['GET'])
 def get_opportunities():
     """Retorna oportunidades analisadas com filtros"""
@@ -106,23 +208,26 @@ def get_opportunities():
         query = BusinessOpportunity.query
         
         if region:
-            query = query.filter(BusinessOpportunity.region.ilike(f'%{region}%'))
+            query = query.filter(region_key_filter(BusinessOpportunity.region_key, region))
         
         if business_type:
-            query = query.filter(BusinessOpportunity.business_type.ilike(f'%{business_type}%'))
+            query = query.filter(business_type_filter(BusinessOpportunity.business_type, business_type))
         
         if min_score > 0:
             query = query.filter(BusinessOpportunity.opportunity_score >= min_score)
         
-        # Ordenar por score e aplicar limite
-        opportunities = query.order_by(
+        # Ordenar por score e aplicar limite; de analysis_data, apenas as chaves usadas
+        rows = query.add_columns(
+            *payload_field_columns('analysis_data', OPPORTUNITY_ANALYSIS_FIELDS)
+        ).order_by(
             BusinessOpportunity.opportunity_score.desc()
         ).limit(50).all()
         
         # Formatar resposta
         formatted_opportunities = []
-        for opp in opportunities:
-            analysis_data = opp.get_analysis_data() or {}
+        for row in rows:
+            opp = row[0]
+            analysis_data = payload_field_values(row, 'analysis_data', OPPORTUNITY_ANALYSIS_FIELDS)
             
             formatted_opp = {
                 'id': opp.id,
@@ -136,9 +241,9 @@ def get_opportunities():
                 'longitude': opp.longitude,
                 'created_at': opp.created_at.isoformat(),
                 'updated_at': opp.updated_at.isoformat(),
-                'recommendation': analysis_data.get('recommendation', ''),
-                'demand_analysis': analysis_data.get('demand_analysis', {}),
-                'competition_analysis': analysis_data.get('competition_analysis', {}),
+                'recommendation': analysis_data['recommendation'] or '',
+                'demand_analysis': analysis_data['demand_analysis'] or {},
+                'competition_analysis': analysis_data['competition_analysis'] or {},
             }
             formatted_opportunities.append(formatted_opp)
         
@@ -155,4 +260,204 @@ def get_opportunities():
             'error': str(e)
         }), 500
 
+@analysis_bp.route('/opportunities/top', methods=['GET'])
+def get_top_opportunities():
+    """Retorna as K melhores oportunidades de uma categoria (ou de todas), em todo o país"""
+    try:
+        business_type = request.args.get('business_type')
+        try:
+            k = int(request.args.get('k', 100))
+        except ValueError:
+            k = None
+        if k is None or not 1 <= k <= 10000:
+            return jsonify({
+                'success': False,
+                'error': 'k deve ser um inteiro entre 1 e 10000'
+            }), 400
+        min_score = float(request.args.get('min_score', 0))
+        
+        # Resolver o nome canônico da categoria (o índice usa igualdade exata)
+        if business_type:
+            business_type = next(
+                (category for category in analysis_service.business_categories
+                 if category.lower() == business_type.lower()),
+                business_type
+            )
+        
+        opportunities = top_opportunities_index.top(business_type or None, k, min_score)
+        
+        return jsonify({
+            'success': True,
+            'business_type': business_type,
+            'total': len(opportunities),
+            'opportunities': opportunities
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao buscar top oportunidades: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def _opportunities_query():
+    """Query base de oportunidades com o filtro opcional de tipo de negócio"""
+    query = BusinessOpportunity.query
+    business_type = request.args.get('business_type')
+    if business_type:
+        query = query.filter(BusinessOpportunity.business_type == business_type)
+    return query
+
+@analysis_bp.route('/opportunities/near', methods=['GET'])
+def get_opportunities_near():
+    """Retorna oportunidades a até radius_km de lat/lon, ordenadas por distância"""
+    try:
+        point = parse_point(request.args)
+        if not point:
+            return jsonify({
+                'success': False,
+                'error': 'Parâmetros obrigatórios: lat, lon e radius_km (> 0)'
+            }), 400
+        limit = parse_limit(request.args)
+        if limit is None:
+            return jsonify({
+                'success': False,
+                'error': f'limit deve ser um inteiro entre 1 e {MAX_SPATIAL_RESULTS}'
+            }), 400
+        
+        matches, truncated = spatial_service.near(
+            _opportunities_query(), BusinessOpportunity,
+            point['latitude'], point['longitude'], point['radius_km'],
+            limit=limit
+        )
+        
+        opportunities = [
+            dict(serialize_opportunity_summary(opportunity), distance_km=distance)
+            for opportunity, distance in matches
+        ]
+        
+        return jsonify({
+            'success': True,
+            'total': len(opportunities),
+            'truncated': truncated,
+            'opportunities': opportunities
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na busca por raio: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@analysis_bp.route('/opportunities/bbox', methods=['GET'])
+def get_opportunities_bbox():
+    """Retorna oportunidades dentro de uma caixa (viewport do mapa)"""
+    try:
+        bbox = parse_bbox(request.args)
+        if not bbox:
+            return jsonify({
+                'success': False,
+                'error': 'Parâmetros obrigatórios: min_lat, min_lon, max_lat, max_lon'
+            }), 400
+        limit = parse_limit(request.args)
+        if limit is None:
+            return jsonify({
+                'success': False,
+                'error': f'limit deve ser um inteiro entre 1 e {MAX_SPATIAL_RESULTS}'
+            }), 400
+        
+        records, truncated = spatial_service.within_bbox(
+            _opportunities_query(), BusinessOpportunity,
+            bbox['min_lat'], bbox['min_lon'], bbox['max_lat'], bbox['max_lon'],
+            limit=limit
+        )
+        
+        opportunities = [serialize_opportunity_summary(opportunity) for opportunity in records]
+        
+        return jsonify({
+            'success': True,
+            'total': len(opportunities),
+            'truncated': truncated,
+            'opportunities': opportunities
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na busca por área: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@analysis_bp.route('/tiles/<business_type>/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_heatmap_tile(business_type, z, x, y):
+    """Retorna a grade pré-agregada de scores de um tile (use 'all' para todas as categorias)"""
+    try:
+        if z > MAX_TILE_ZOOM or x >= (1 << z) or y >= (1 << z):
+            return jsonify({
+                'success': False,
+                'error': f'Tile inválido (zoom máximo {MAX_TILE_ZOOM})'
+            }), 400
+        
+        if business_type.lower() == ALL_BUSINESS_TYPES:
+            business_type = ALL_BUSINESS_TYPES
+        else:
+            business_type = next(
+                (category for category in analysis_service.business_categories
+                 if category.lower() == business_type.lower()),
+                business_type
+            )
+        
+        return jsonify({
+            'success': True,
+            'tile': heatmap_tile_cache.get_tile(business_type, z, x, y)
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao gerar tile {z}/{x}/{y}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@analysis_bp.route('/tiles/refresh', methods=['POST'])
+def refresh_heatmap_tiles():
+    """Recalcula os tiles de heatmap em segundo plano (um recálculo por vez)"""
+    data = request.get_json(silent=True) or {}
+    zooms = data.get('zooms')
+    if zooms is not None and not (
+        isinstance(zooms, list)
+        and all(isinstance(z, int) and not isinstance(z, bool) and 0 <= z <= MAX_TILE_ZOOM for z in zooms)
+    ):
+        return jsonify({
+            'success': False,
+            'error': f'zooms deve ser uma lista de inteiros entre 0 e {MAX_TILE_ZOOM}'
+        }), 400
+    
+    if not _tile_refresh_lock.acquire(blocking=False):
+        return jsonify({
+            'success': True,
+            'started': False,
+            'message': 'Recalculo de tiles já em andamento'
+        }), 202
+    
+    app = current_app._get_current_object()
+    
+    def run():
+        with app.app_context():
+            try:
+                heatmap_tile_cache.refresh(zooms)
+            except Exception as e:
+                logger.error(f"Erro ao recalcular tiles: {str(e)}")
+            finally:
+                _tile_refresh_lock.release()
+    
+    threading.Thread(target=run, daemon=True).start()
+    
+    return jsonify({
+        'success': True,
+        'started': True,
+        'message': 'Recalculo de tiles iniciado'
+    }), 202
+
 # Outras rotas (top, summary, business-types) podem ser mantidas como estão.
@@ -1,6 +1,12 @@
 from flask import Blueprint, jsonify, request
+from sqlalchemy.orm import undefer_group, joinedload, contains_eager
 from src.models.data_models import db, DataSource, CollectedData, BusinessOpportunity, CollectionLog
 from src.services.data_collector import DataCollectorService
+from src.services.spatial_index import SpatialQueryService, MAX_SPATIAL_RESULTS, parse_bbox, parse_limit, parse_point
+from src.services.gazetteer import gazetteer, AUTOCOMPLETE_LIMIT
+from src.services.search_filters import region_key_filter, business_type_filter
+from src.services.payload_fields import parse_fields, payload_field_columns, payload_field_values
+from src.services.pagination import keyset_page, collected_data_counts, InvalidCursor, COUNT_MODES
 import logging
 
 # Configurar logging
@@ -13,6 +19,32 @@ data_bp = Blueprint('data', __name__)
 # Instanciar serviço de coleta
 collector_service = DataCollectorService()
 
+# Consultas espaciais (raio e viewport)
+spatial_service = SpatialQueryService()
+
+def _format_collected_location(record, distance=None):
+    """Formata um registro coletado para as consultas espaciais (sem payload)"""
+    formatted = {
+        'id': record.id,
+        'source_id': record.source_id,
+        'data_type': record.data_type,
+        'region': record.region,
+        'latitude': record.latitude,
+        'longitude': record.longitude,
+        'collection_timestamp': record.collection_timestamp.isoformat()
+    }
+    if distance is not None:
+        formatted['distance_km'] = distance
+    return formatted
+
+def _collected_data_query():
+    """Query base de dados coletados com o filtro opcional de tipo"""
+    query = CollectedData.query
+    data_type = request.args.get('type')
+    if data_type:
+        query = query.filter(CollectedData.data_type == data_type)
+    return query
+
 @data_bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar saúde da API"""
@@ -26,10 +58,20 @@ def health_check():
 def get_data_sources():
     """Retorna lista de fontes de dados disponíveis"""
     try:
-        sources = DataSource.query.all()
+        # Total de coletas por fonte em uma única agregação
+        collection_counts = db.session.query(
+            CollectedData.source_id.label('source_id'),
+            db.func.count(CollectedData.id).label('total')
+        ).group_by(CollectedData.source_id).subquery()
+        
+        sources = db.session.query(
+            DataSource, db.func.coalesce(collection_counts.c.total, 0)
+        ).outerjoin(
+            collection_counts, collection_counts.c.source_id == DataSource.id
+        ).order_by(DataSource.id).all()
         sources_data = []
         
-        for source in sources:
+        for source, total_collections in sources:
             source_data = {
                 'id': source.id,
                 'name': source.name,
@@ -37,7 +79,7 @@ def get_data_sources():
                 'description': source.description,
                 'is_active': source.is_active,
                 'last_updated': source.last_updated.isoformat() if source.last_updated else None,
-                'total_collections': len(source.collected_data)
+                'total_collections': total_collections
             }
             sources_data.append(source_data)
         
@@ -61,6 +103,17 @@ def collect_ibge_data():
         data = request.get_json() or {}
         region_code = data.get('region_code')
         
+        if data.get('full'):
+            # Ingestão completa: todos os municípios (ou os da UF em region_code)
+            result = collector_service.ingest_ibge_municipalities(region_code, data.get('centroids', True))
+            db.session.commit()
+            gazetteer.invalidate()
+            return jsonify({
+                'success': True,
+                'message': f"{result['total_records']} municípios do IBGE gravados",
+                'data': result
+            })
+        
         # Executar coleta
         result = collector_service.collect_ibge_demographic_data(region_code)
         
@@ -180,14 +233,38 @@ def collect_all_data():
 
 @data_bp.route('/data', methods=['GET'])
 def get_collected_data():
-    """Retorna dados coletados com filtros opcionais"""
+    """
+    Retorna dados coletados com filtros opcionais, do mais recente para o
+    mais antigo. Paginação por cursor: envie next_cursor da resposta em
+    cursor. count=cached (padrão), exact ou none controla o total.
+    """
     try:
         # Parâmetros de filtro
         data_type = request.args.get('type')
         source_name = request.args.get('source')
         region = request.args.get('region')
-        limit = int(request.args.get('limit', 50))
-        offset = int(request.args.get('offset', 0))
+        try:
+            limit = int(request.args.get('limit', 50))
+            offset = int(request.args.get('offset', 0))
+        except ValueError:
+            limit = offset = None
+        if limit is None or limit < 1 or offset < 0:
+            return jsonify({
+                'success': False,
+                'error': 'limit deve ser um inteiro >= 1 e offset um inteiro >= 0'
+            }), 400
+        cursor = request.args.get('cursor')
+        if cursor and 'offset' in request.args:
+            return jsonify({
+                'success': False,
+                'error': 'Use cursor ou offset, não os dois'
+            }), 400
+        count_mode = request.args.get('count', 'cached')
+        if count_mode not in COUNT_MODES:
+            return jsonify({
+                'success': False,
+                'error': f"count deve ser um de: {', '.join(COUNT_MODES)}"
+            }), 400
         
         # Construir query
         query = CollectedData.query
@@ -196,18 +273,47 @@ def get_collected_data():
             query = query.filter(CollectedData.data_type == data_type)
         
         if source_name:
-            query = query.join(DataSource).filter(DataSource.name.ilike(f'%{source_name}%'))
+            query = query.join(CollectedData.source).filter(DataSource.name.ilike(f'%{source_name}%'))
         
         if region:
-            query = query.filter(CollectedData.region.ilike(f'%{region}%'))
+            query = query.filter(region_key_filter(CollectedData.region_key, region))
+        
+        # Total em cache por filtro (ou estimado), sem COUNT a cada página
+        counted = collected_data_counts.count(
+            (data_type, source_name, region), query, CollectedData.__tablename__, count_mode
+        )
         
-        # Aplicar paginação
-        total = query.count()
-        data_records = query.offset(offset).limit(limit).all()
+        # Fonte carregada no mesmo SELECT (record.source sem uma query por linha)
+        if source_name:
+            query = query.options(contains_eager(CollectedData.source))
+        else:
+            query = query.options(joinedload(CollectedData.source))
+        
+        # fields: apenas essas chaves dos payloads (extraídas no servidor no PostgreSQL)
+        fields = parse_fields(request.args.get('fields'))
+        if fields:
+            query = query.add_columns(
+                *payload_field_columns('raw_data', fields),
+                *payload_field_columns('processed_data', fields)
+            )
+        else:
+            query = query.options(undefer_group('raw_data'), undefer_group('processed_data'))
+        
+        # Paginação por chave (collection_timestamp, id)
+        try:
+            data_records, next_cursor = keyset_page(
+                query, CollectedData.collection_timestamp, CollectedData.id, cursor, limit, offset
+            )
+        except InvalidCursor as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         # Formatar resposta
         formatted_data = []
-        for record in data_records:
+        for row in data_records:
+            record = row[0] if fields else row
             formatted_record = {
                 'id': record.id,
                 'source': record.source.name,
@@ -215,17 +321,23 @@ def get_collected_data():
                 'region': record.region,
                 'latitude': record.latitude,
                 'longitude': record.longitude,
-                'collection_timestamp': record.collection_timestamp.isoformat(),
-                'raw_data': record.get_raw_data(),
-                'processed_data': record.get_processed_data()
+                'collection_timestamp': record.collection_timestamp.isoformat()
             }
+            if fields:
+                formatted_record['raw_data'] = payload_field_values(row, 'raw_data', fields)
+                formatted_record['processed_data'] = payload_field_values(row, 'processed_data', fields)
+            else:
+                formatted_record['raw_data'] = record.get_raw_data()
+                formatted_record['processed_data'] = record.get_processed_data()
             formatted_data.append(formatted_record)
         
         return jsonify({
             'success': True,
-            'total': total,
+            'total': counted['total'],
+            'total_estimated': counted['total_estimated'],
             'limit': limit,
             'offset': offset,
+            'next_cursor': next_cursor,
             'data': formatted_data
         })
         
@@ -236,6 +348,128 @@ def get_collected_data():
             'error': str(e)
         }), 500
 
+@data_bp.route('/data/near', methods=['GET'])
+def get_collected_data_near():
+    """Retorna dados coletados a até radius_km de lat/lon"""
+    try:
+        point = parse_point(request.args)
+        if not point:
+            return jsonify({
+                'success': False,
+                'error': 'Parâmetros obrigatórios: lat, lon e radius_km (> 0)'
+            }), 400
+        limit = parse_limit(request.args)
+        if limit is None:
+            return jsonify({
+                'success': False,
+                'error': f'limit deve ser um inteiro entre 1 e {MAX_SPATIAL_RESULTS}'
+            }), 400
+        
+        matches, truncated = spatial_service.near(
+            _collected_data_query(), CollectedData,
+            point['latitude'], point['longitude'], point['radius_km'],
+            limit=limit
+        )
+        
+        return jsonify({
+            'success': True,
+            'total': len(matches),
+            'truncated': truncated,
+            'data': [_format_collected_location(record, distance) for record, distance in matches]
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na busca de dados por raio: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@data_bp.route('/data/bbox', methods=['GET'])
+def get_collected_data_bbox():
+    """Retorna dados coletados dentro de uma caixa (viewport do mapa)"""
+    try:
+        bbox = parse_bbox(request.args)
+        if not bbox:
+            return jsonify({
+                'success': False,
+                'error': 'Parâmetros obrigatórios: min_lat, min_lon, max_lat, max_lon'
+            }), 400
+        limit = parse_limit(request.args)
+        if limit is None:
+            return jsonify({
+                'success': False,
+                'error': f'limit deve ser um inteiro entre 1 e {MAX_SPATIAL_RESULTS}'
+            }), 400
+        
+        records, truncated = spatial_service.within_bbox(
+            _collected_data_query(), CollectedData,
+            bbox['min_lat'], bbox['min_lon'], bbox['max_lat'], bbox['max_lon'],
+            limit=limit
+        )
+        
+        return jsonify({
+            'success': True,
+            'total': len(records),
+            'truncated': truncated,
+            'data': [_format_collected_location(record) for record in records]
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro na busca de dados por área: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@data_bp.route('/regions/autocomplete', methods=['GET'])
+def autocomplete_regions():
+    """Sugestões de municípios do IBGE pelo prefixo do nome (parâmetro q)"""
+    try:
+        prefix = request.args.get('q', '')
+        limit = min(int(request.args.get('limit', AUTOCOMPLETE_LIMIT)), 50)
+        
+        suggestions = gazetteer.autocomplete(prefix, limit)
+        
+        return jsonify({
+            'success': True,
+            'query': prefix,
+            'total': len(suggestions),
+            'data': suggestions
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro no autocomplete de regiões: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@data_bp.route('/regions/resolve', methods=['GET'])
+def resolve_region():
+    """Código IBGE, centróide e hierarquia de um município pelo nome (parâmetro name)"""
+    try:
+        name = request.args.get('name', '')
+        place = gazetteer.resolve(name)
+        
+        if not place:
+            return jsonify({
+                'success': False,
+                'error': f'Município não encontrado ou ambíguo: {name}'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': place
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao resolver região: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @data_bp.route('/opportunities', methods=['GET'])
 def get_opportunities():
     """Retorna oportunidades de negócio identificadas"""
@@ -250,20 +484,28 @@ def get_opportunities():
         query = BusinessOpportunity.query
         
         if business_type:
-            query = query.filter(BusinessOpportunity.business_type.ilike(f'%{business_type}%'))
+            query = query.filter(business_type_filter(BusinessOpportunity.business_type, business_type))
         
         if region:
-            query = query.filter(BusinessOpportunity.region.ilike(f'%{region}%'))
+            query = query.filter(region_key_filter(BusinessOpportunity.region_key, region))
         
         if min_score > 0:
             query = query.filter(BusinessOpportunity.opportunity_score >= min_score)
         
+        # fields: apenas essas chaves de analysis_data (extraídas no servidor no PostgreSQL)
+        fields = parse_fields(request.args.get('fields'))
+        if fields:
+            query = query.add_columns(*payload_field_columns('analysis_data', fields))
+        else:
+            query = query.options(undefer_group('analysis_data'))
+        
         # Ordenar por score e aplicar limite
         opportunities = query.order_by(BusinessOpportunity.opportunity_score.desc()).limit(limit).all()
         
         # Formatar resposta
         formatted_opportunities = []
-        for opp in opportunities:
+        for row in opportunities:
+            opp = row[0] if fields else row
             formatted_opp = {
                 'id': opp.id,
                 'region': opp.region,
@@ -274,7 +516,9 @@ def get_opportunities():
                 'estimated_demand': opp.estimated_demand,
                 'latitude': opp.latitude,
                 'longitude': opp.longitude,
-                'analysis_data': opp.get_analysis_data(),
+                'analysis_data': (
+                    payload_field_values(row, 'analysis_data', fields) if fields else opp.get_analysis_data()
+                ),
                 'created_at': opp.created_at.isoformat(),
                 'updated_at': opp.updated_at.isoformat()
             }
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, send_file
 from src.services.report_generation import ReportGenerationService
-from src.models.data_models import db, BusinessOpportunity
+from src.services.region_summary import summarize_regions, empty_summary
+from src.services.normalization import fold_name
 import os
 import tempfile
 import subprocess
@@ -17,6 +18,9 @@ reports_bp = Blueprint('reports', __name__)
 # Instanciar serviço de relatórios
 report_service = ReportGenerationService()
 
+# Regiões listadas no histórico
+HISTORY_LIMIT = 20
+
 @reports_bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint para verificar saúde da API de relatórios"""
@@ -165,56 +169,22 @@ def generate_comparison_report():
         
         logger.info(f"Gerando relatório comparativo para regiões: {', '.join(regions)}")
         
-        # Gerar relatório comparativo
-        comparison_data = []
+        # Gerar relatório comparativo (todas as regiões em uma única agregação)
+        summaries = {
+            summary['region_key']: summary
+            for summary in summarize_regions(regions, business_type)
+        }
         
+        comparison_data = []
         for region in regions:
-            # Buscar oportunidades da região
-            query = BusinessOpportunity.query.filter(
-                BusinessOpportunity.region.ilike(f'%{region}%')
-            )
-            
-            if business_type:
-                query = query.filter(
-                    BusinessOpportunity.business_type.ilike(f'%{business_type}%')
-                )
-            
-            opportunities = query.all()
-            
-            if opportunities:
-                avg_score = sum(o.opportunity_score for o in opportunities) / len(opportunities)
-                best_opportunity = max(opportunities, key=lambda x: x.opportunity_score)
-                
-                region_data = {
-                    'region': region,
-                    'total_opportunities': len(opportunities),
-                    'average_score': round(avg_score, 1),
-                    'best_opportunity': {
-                        'business_type': best_opportunity.business_type,
-                        'score': best_opportunity.opportunity_score
-                    },
-                    'score_distribution': {
-                        'excellent': len([o for o in opportunities if o.opportunity_score >= 80]),
-                        'good': len([o for o in opportunities if 65 <= o.opportunity_score < 80]),
-                        'moderate': len([o for o in opportunities if 50 <= o.opportunity_score < 65]),
-                        'low': len([o for o in opportunities if o.opportunity_score < 50])
-                    }
-                }
-            else:
-                region_data = {
-                    'region': region,
-                    'total_opportunities': 0,
-                    'average_score': 0,
-                    'best_opportunity': None,
-                    'score_distribution': {
-                        'excellent': 0,
-                        'good': 0,
-                        'moderate': 0,
-                        'low': 0
-                    }
-                }
-            
-            comparison_data.append(region_data)
+            summary = summaries.get(fold_name(region)) or empty_summary(region)
+            comparison_data.append({
+                'region': region,
+                'total_opportunities': summary['total_opportunities'],
+                'average_score': summary['average_score'],
+                'best_opportunity': summary['best_opportunity'],
+                'score_distribution': summary['score_distribution']
+            })
         
         # Ordenar por score médio
         comparison_data.sort(key=lambda x: x['average_score'], reverse=True)
@@ -301,26 +271,16 @@ def get_report_templates():
 def get_report_history():
     """Lista histórico de relatórios gerados"""
     try:
-        # Buscar oportunidades recentes como proxy para relatórios
-        recent_opportunities = BusinessOpportunity.query.order_by(
-            BusinessOpportunity.updated_at.desc()
-        ).limit(20).all()
-        
-        history = []
-        regions_processed = set()
-        
-        for opp in recent_opportunities:
-            if opp.region not in regions_processed:
-                history.append({
-                    'region': opp.region,
-                    'last_analysis': opp.updated_at.isoformat(),
-                    'opportunities_count': BusinessOpportunity.query.filter_by(region=opp.region).count(),
-                    'avg_score': round(
-                        sum(o.opportunity_score for o in BusinessOpportunity.query.filter_by(region=opp.region).all()) / 
-                        BusinessOpportunity.query.filter_by(region=opp.region).count(), 1
-                    )
-                })
-                regions_processed.add(opp.region)
+        # Regiões analisadas mais recentemente, agregadas em uma única query
+        history = [
+            {
+                'region': summary['region'],
+                'last_analysis': summary['last_analysis'].isoformat() if summary['last_analysis'] else None,
+                'opportunities_count': summary['total_opportunities'],
+                'avg_score': summary['average_score']
+            }
+            for summary in summarize_regions(limit=HISTORY_LIMIT)
+        ]
         
         return jsonify({
             'success': True,
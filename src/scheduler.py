@@ -0,0 +1,216 @@
+"""
+Agendador de coletas: executa cada coleta do DataCollectorService no seu
+próprio intervalo, fora dos workers web.
+
+Uso: python -m src.scheduler [--once]
+"""
+import os
+import random
+import signal
+import socket
+import argparse
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+from sqlalchemy import func, update, insert
+from sqlalchemy.exc import IntegrityError
+from src.main import app
+from src.models.data_models import db, DataSource, CollectionLog, SchedulerLock
+from src.services.data_collector import DataCollectorService
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Intervalo (segundos) entre coletas bem-sucedidas de cada fonte
+COLLECTION_INTERVALS = {
+    'IBGE Demographics': 24 * 3600,
+    'CNPJ Business Data': 6 * 3600,
+    'Social Media Sentiment': 3600,
+    'Rental Market Data': 12 * 3600
+}
+
+# Variação aleatória (fração do intervalo) para não alinhar execuções
+JITTER_RATIO = 0.1
+
+# Backoff após falhas: BACKOFF_BASE * 2^(falhas-1), limitado ao intervalo
+BACKOFF_BASE_SECONDS = 60
+
+# Lease do lock de instância única (renovado a cada ciclo)
+LOCK_NAME = 'collection_scheduler'
+LOCK_TTL_SECONDS = 600
+
+# Espera máxima entre ciclos
+POLL_SECONDS = 30
+
+
+class CollectionScheduler:
+    """
+    Executa as coletas vencidas em sequência. Apenas a instância que detém o
+    lease em scheduler_locks coleta; as demais ficam em espera até o lease
+    expirar. O próximo horário de cada fonte parte do último CollectionLog
+    de sucesso, de modo que reinícios não repetem coletas recentes.
+    """
+
+    def __init__(self, collector: Optional[DataCollectorService] = None,
+                 intervals: Optional[Dict[str, float]] = None, owner: Optional[str] = None):
+        self.collector = collector or DataCollectorService()
+        self.intervals = intervals or COLLECTION_INTERVALS
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.stop_event = threading.Event()
+        self.next_run = {}  # fonte -> datetime (UTC)
+        self.failures = {}  # fonte -> falhas consecutivas
+
+    def run_forever(self):
+        """Laço principal até receber stop()"""
+        logger.info(f"Agendador iniciado ({self.owner})")
+        try:
+            while not self.stop_event.is_set():
+                if self.acquire_lock():
+                    self.run_due()
+                    wait = self.seconds_until_next()
+                else:
+                    wait = POLL_SECONDS
+                self.stop_event.wait(wait)
+        finally:
+            self.release_lock()
+            logger.info("Agendador finalizado")
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+    def run_due(self) -> Dict[str, Any]:
+        """Executa as coletas vencidas; retorna {fonte: resumo}"""
+        if not self.next_run:
+            self._load_schedule()
+
+        results = {}
+        for name in self.intervals:
+            if self.stop_event.is_set():
+                break
+            if self.next_run[name] > datetime.utcnow():
+                continue
+            # Renovar o lease antes de cada coleta (TTL maior que o timeout da fonte)
+            if not self.acquire_lock():
+                logger.warning("Lease do agendador perdido; interrompendo ciclo")
+                break
+            results[name] = self._run(name)
+        return results
+
+    def seconds_until_next(self) -> float:
+        if not self.next_run:
+            return 0
+        wait = (min(self.next_run.values()) - datetime.utcnow()).total_seconds()
+        return min(max(wait, 1), POLL_SECONDS)
+
+    def _run(self, name: str) -> Dict[str, Any]:
+        """Executa uma coleta e agenda a próxima (intervalo ou backoff)"""
+        logger.info(f"Coleta agendada: {name}")
+        try:
+            result = self.collector.run_collection(name)
+        except Exception as e:
+            logger.error(f"Erro na coleta agendada {name}: {str(e)}")
+            result = {'name': name, 'status': 'error', 'error': str(e)}
+
+        if result['status'] == 'success':
+            self.failures[name] = 0
+            delay = self._jitter(self.intervals[name])
+        else:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            delay = min(BACKOFF_BASE_SECONDS * 2 ** (self.failures[name] - 1), self.intervals[name])
+            delay = self._jitter(delay)
+            logger.warning(f"{name}: falha {self.failures[name]}, nova tentativa em {delay:.0f}s")
+
+        self.next_run[name] = datetime.utcnow() + timedelta(seconds=delay)
+        return result
+
+    def _load_schedule(self):
+        """Agenda cada fonte a partir do último sucesso registrado em CollectionLog"""
+        last_success = dict(
+            db.session.query(DataSource.name, func.max(CollectionLog.finished_at))
+            .join(CollectionLog, CollectionLog.source_id == DataSource.id)
+            .filter(CollectionLog.status == 'success', DataSource.name.in_(list(self.intervals)))
+            .group_by(DataSource.name)
+            .all()
+        )
+        db.session.commit()
+
+        now = datetime.utcnow()
+        for name, interval in self.intervals.items():
+            finished_at = last_success.get(name)
+            if finished_at is None:
+                # Nunca coletada: executar no primeiro ciclo
+                self.next_run[name] = now
+            else:
+                self.next_run[name] = finished_at + timedelta(seconds=self._jitter(interval))
+
+    @staticmethod
+    def _jitter(seconds: float) -> float:
+        return seconds * (1 + random.uniform(-JITTER_RATIO, JITTER_RATIO))
+
+    def acquire_lock(self) -> bool:
+        """Obtém ou renova o lease de instância única"""
+        table = SchedulerLock.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=LOCK_TTL_SECONDS)
+        try:
+            renewed = db.session.execute(
+                update(table)
+                .where(table.c.name == LOCK_NAME)
+                .where((table.c.owner == self.owner) | (table.c.expires_at < now))
+                .values(owner=self.owner, expires_at=expires_at)
+            ).rowcount
+            if not renewed:
+                db.session.execute(insert(table).values(name=LOCK_NAME, owner=self.owner, expires_at=expires_at))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Lease ativo de outra instância
+            db.session.rollback()
+            return False
+        except Exception as e:
+            logger.error(f"Erro ao obter lock do agendador: {str(e)}")
+            db.session.rollback()
+            return False
+
+    def release_lock(self):
+        """Libera o lease, se for desta instância"""
+        table = SchedulerLock.__table__
+        try:
+            db.session.execute(
+                update(table)
+                .where(table.c.name == LOCK_NAME, table.c.owner == self.owner)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Erro ao liberar lock do agendador: {str(e)}")
+            db.session.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agendador de coletas do Mapa de Oportunidades')
+    parser.add_argument('--once', action='store_true', help='executa as coletas vencidas e encerra')
+    args = parser.parse_args()
+
+    with app.app_context():
+        scheduler = CollectionScheduler()
+        if args.once:
+            if not scheduler.acquire_lock():
+                logger.info("Outra instância do agendador está ativa")
+                return
+            try:
+                for name, result in scheduler.run_due().items():
+                    logger.info(f"{name}: {result['status']}")
+            finally:
+                scheduler.release_lock()
+            return
+
+        signal.signal(signal.SIGTERM, scheduler.stop)
+        signal.signal(signal.SIGINT, scheduler.stop)
+        scheduler.run_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+import io
+import csv
+import uuid
+import zipfile
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Tuple
+from sqlalchemy import func, delete, select, or_
+from src.models.data_models import db, EstablishmentCount, Municipality, CollectedRecord
+from src.services.normalization import fold_name
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Linhas do CSV agregadas em memória antes de cada gravação
+CNPJ_CHUNK_ROWS = 200_000
+
+# Linhas de collected_records por instrução na publicação
+PUBLISH_CHUNK_ROWS = 5000
+
+# Colunas do arquivo de estabelecimentos da Receita Federal (sem cabeçalho)
+COL_TRADE_NAME = 4
+COL_STATUS = 5
+COL_START_DATE = 10
+COL_MAIN_CNAE = 11
+COL_NEIGHBORHOOD = 17
+COL_STATE = 19
+COL_MUNICIPALITY = 20
+
+# Situação cadastral "ativa"
+ACTIVE_STATUS = '02'
+
+# CNAE fiscal principal (subclasse) -> categoria de business_categories
+CNAE_CATEGORIES = {
+    '4789004': 'Pet Shop',             # Comércio varejista de animais e artigos para animais
+    '9609208': 'Pet Shop',             # Higiene e embelezamento de animais domésticos
+    '9602501': 'Salão de Beleza',      # Cabeleireiros, manicure e pedicure (barbearias pelo nome)
+    '9602502': 'Salão de Beleza',      # Estética e outros serviços de beleza
+    '4771701': 'Farmácia',             # Produtos farmacêuticos sem manipulação
+    '4771702': 'Farmácia',             # Produtos farmacêuticos com manipulação
+    '4771703': 'Farmácia',             # Produtos farmacêuticos homeopáticos
+    '1091102': 'Padaria',              # Padaria e confeitaria com produção própria
+    '4721102': 'Padaria',              # Padaria e confeitaria com predominância de revenda
+    '5611201': 'Restaurante',          # Restaurantes e similares
+    '5611203': 'Restaurante',          # Lanchonetes, casas de chá, de sucos e similares
+    '4781400': 'Loja de Roupas',       # Artigos do vestuário e acessórios
+    '4711301': 'Supermercado',         # Hipermercados
+    '4711302': 'Supermercado',         # Supermercados
+    '4712100': 'Supermercado',         # Minimercados, mercearias e armazéns
+    '9313100': 'Academia',             # Condicionamento físico
+    '4751201': 'Loja de Eletrônicos',  # Equipamentos e suprimentos de informática
+    '4752100': 'Loja de Eletrônicos',  # Equipamentos de telefonia e comunicação
+    '4753900': 'Loja de Eletrônicos',  # Eletrodomésticos e equipamentos de áudio e vídeo
+    '4731800': 'Posto de Gasolina',    # Combustíveis para veículos automotores
+    '6421200': 'Banco',                # Bancos comerciais
+    '6422100': 'Banco',                # Bancos múltiplos com carteira comercial
+    '6423900': 'Banco'                 # Caixas econômicas
+}
+
+# Barbearias não têm CNAE próprio: identificadas pelo nome fantasia
+BARBERSHOP_CNAE = '9602501'
+BARBERSHOP_TERMS = ('barbearia', 'barber', 'barbeiro')
+
+
+def _iter_csv_rows(path: str) -> Iterator[List[str]]:
+    """Linhas dos CSVs (Latin-1, ';') de um .zip da Receita, ou de um CSV solto"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                with archive.open(member) as raw:
+                    text = io.TextIOWrapper(raw, encoding='latin-1', newline='')
+                    yield from csv.reader(text, delimiter=';', quotechar='"')
+    else:
+        with open(path, encoding='latin-1', newline='') as text:
+            yield from csv.reader(text, delimiter=';', quotechar='"')
+
+
+def load_municipality_names(path: str) -> Dict[str, str]:
+    """Lê o arquivo de municípios da Receita (código TOM;nome)"""
+    names = {}
+    for row in _iter_csv_rows(path):
+        if len(row) >= 2:
+            names[row[0].strip()] = row[1].strip()
+    return names
+
+
+def classify_establishment(row: List[str], opened_since: str) -> Optional[Tuple[str, bool]]:
+    """
+    Categoria do estabelecimento ativo e se abriu desde opened_since
+    (AAAAMMDD); None para inativos ou CNAEs fora das categorias
+    """
+    if len(row) <= COL_MUNICIPALITY or row[COL_STATUS] != ACTIVE_STATUS:
+        return None
+    cnae = row[COL_MAIN_CNAE].strip()
+    category = CNAE_CATEGORIES.get(cnae)
+    if category is None:
+        return None
+    if cnae == BARBERSHOP_CNAE:
+        trade_name = row[COL_TRADE_NAME].lower()
+        if any(term in trade_name for term in BARBERSHOP_TERMS):
+            category = 'Barbearia'
+    return category, row[COL_START_DATE] >= opened_since
+
+
+class CNPJEstablishmentImporter:
+    """
+    Importa os arquivos de estabelecimentos do CNPJ (dados abertos da Receita
+    Federal) em streaming: as linhas são classificadas por CNAE e agregadas
+    por município, bairro e categoria em blocos de chunk_rows, somados em
+    establishment_counts. A memória depende do bloco, não do arquivo.
+
+    As linhas de cada importação levam seu import_id: as contagens da
+    importação anterior só são removidas (discard_previous_imports) na
+    mesma transação que publica a nova, e uma importação que falha no
+    meio remove apenas as próprias linhas (discard_import).
+    """
+
+    def __init__(self, chunk_rows: int = CNPJ_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.import_id = uuid.uuid4().hex
+
+    def aggregate(self, paths: Iterable[str], reference_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Calcula as contagens desta importação em establishment_counts a partir
+        dos arquivos. Cada bloco é confirmado separadamente, ao lado das
+        contagens da importação anterior; a publicação é feita depois, de uma vez.
+        """
+        reference_date = reference_date or datetime.utcnow()
+        opened_since = (reference_date - timedelta(days=365)).strftime('%Y%m%d')
+
+        stats = {'import_id': self.import_id, 'rows_read': 0, 'establishments': 0, 'chunks': 0}
+        counts = Counter()
+        opened = Counter()
+        rows_in_chunk = 0
+
+        for path in paths:
+            logger.info(f"Importando estabelecimentos de {path}")
+            for row in _iter_csv_rows(path):
+                stats['rows_read'] += 1
+                rows_in_chunk += 1
+                classified = classify_establishment(row, opened_since)
+                if classified is not None:
+                    category, is_new = classified
+                    key = (
+                        row[COL_MUNICIPALITY].strip(), row[COL_STATE].strip(),
+                        ' '.join(row[COL_NEIGHBORHOOD].split())[:100].title(), category
+                    )
+                    counts[key] += 1
+                    if is_new:
+                        opened[key] += 1
+                    stats['establishments'] += 1
+
+                if rows_in_chunk >= self.chunk_rows:
+                    self._flush(self.import_id, counts, opened)
+                    stats['chunks'] += 1
+                    counts, opened, rows_in_chunk = Counter(), Counter(), 0
+
+        if counts:
+            self._flush(self.import_id, counts, opened)
+            stats['chunks'] += 1
+
+        logger.info(
+            f"CNPJ: {stats['rows_read']} linhas lidas, {stats['establishments']} estabelecimentos "
+            f"em {stats['chunks']} blocos"
+        )
+        return stats
+
+    def discard_previous_imports(self):
+        """Remove as contagens de outras importações. Não faz commit."""
+        db.session.execute(delete(EstablishmentCount).where(or_(
+            EstablishmentCount.import_id != self.import_id, EstablishmentCount.import_id.is_(None)
+        )))
+
+    def discard_import(self):
+        """Remove as contagens (já confirmadas) desta importação, após uma falha"""
+        db.session.rollback()
+        db.session.execute(delete(EstablishmentCount).where(EstablishmentCount.import_id == self.import_id))
+        db.session.commit()
+
+    @staticmethod
+    def _flush(import_id: str, counts: Counter, opened: Counter):
+        """Soma as contagens do bloco em establishment_counts e confirma"""
+        rows = [
+            {
+                'import_id': import_id,
+                'municipality_code': municipality_code,
+                'state': state,
+                'neighborhood': neighborhood,
+                'category': category,
+                'establishments': count,
+                'opened_last_year': opened.get(key, 0)
+            }
+            for key, count in counts.items()
+            for municipality_code, state, neighborhood, category in (key,)
+        ]
+
+        table = EstablishmentCount.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            statement = dialect_insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=['import_id', 'municipality_code', 'neighborhood', 'category'],
+                set_={
+                    'establishments': table.c.establishments + statement.excluded.establishments,
+                    'opened_last_year': table.c.opened_last_year + statement.excluded.opened_last_year
+                }
+            )
+            db.session.execute(statement, rows)
+        else:
+            # Fallback: uma consulta de chaves e instruções em lote
+            existing = {
+                (row.municipality_code, row.neighborhood, row.category): row
+                for row in db.session.query(EstablishmentCount).filter(
+                    EstablishmentCount.import_id == import_id,
+                    EstablishmentCount.municipality_code.in_({row['municipality_code'] for row in rows})
+                )
+            }
+            for row in rows:
+                current = existing.get((row['municipality_code'], row['neighborhood'], row['category']))
+                if current is None:
+                    db.session.add(EstablishmentCount(**row))
+                else:
+                    current.establishments += row['establishments']
+                    current.opened_last_year += row['opened_last_year']
+        db.session.commit()
+
+    def iter_records(self, municipality_names: Dict[str, str]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Linhas de collected_records (tipo commercial) em blocos: uma por
+        município e categoria e uma por bairro e categoria. Os nomes da Receita
+        são trocados pelos do IBGE (municipalities) quando disponíveis.
+        """
+        ibge_names = {
+            (state, fold_name(name)): name
+            for name, state in db.session.query(Municipality.name, Municipality.state_code)
+        }
+        populations = self._populations()
+
+        def municipality_name(code, state):
+            name = municipality_names.get(code, code)
+            return ibge_names.get((state, fold_name(name)), name.title())
+
+        def record(region, city, state, category, establishments, opened_last_year, population):
+            return {
+                'data_type': 'commercial',
+                'region': region,
+                'city': city,
+                'state': state,
+                'category': category,
+                'establishments': establishments,
+                'density_per_100k': round(establishments / population * 100000, 2) if population else None,
+                'growth_rate': round(opened_last_year / establishments * 100, 1) if establishments else None
+            }
+
+        totals = db.session.execute(
+            select(
+                EstablishmentCount.municipality_code, EstablishmentCount.state, EstablishmentCount.category,
+                func.sum(EstablishmentCount.establishments), func.sum(EstablishmentCount.opened_last_year)
+            ).where(
+                EstablishmentCount.import_id == self.import_id
+            ).group_by(
+                EstablishmentCount.municipality_code, EstablishmentCount.state, EstablishmentCount.category
+            ).execution_options(yield_per=PUBLISH_CHUNK_ROWS)
+        )
+        for partition in totals.partitions():
+            chunk = []
+            for code, state, category, establishments, opened_last_year in partition:
+                city = municipality_name(code, state)
+                chunk.append(record(
+                    city, city, state, category, int(establishments), int(opened_last_year),
+                    populations.get(fold_name(city))
+                ))
+            yield chunk
+
+        neighborhoods = db.session.execute(
+            select(
+                EstablishmentCount.municipality_code, EstablishmentCount.state,
+                EstablishmentCount.neighborhood, EstablishmentCount.category,
+                EstablishmentCount.establishments, EstablishmentCount.opened_last_year
+            ).where(
+                EstablishmentCount.import_id == self.import_id, EstablishmentCount.neighborhood != ''
+            ).execution_options(yield_per=PUBLISH_CHUNK_ROWS)
+        )
+        for partition in neighborhoods.partitions():
+            yield [
+                record(
+                    neighborhood, municipality_name(code, state), state, category,
+                    establishments, opened_last_year, None
+                )
+                for code, state, neighborhood, category, establishments, opened_last_year in partition
+            ]
+
+    @staticmethod
+    def _populations() -> Dict[str, int]:
+        """População mais recente coletada por município (nome normalizado)"""
+        rows = db.session.query(CollectedRecord.region, CollectedRecord.population).filter(
+            CollectedRecord.data_type == 'demographic', CollectedRecord.population.isnot(None)
+        ).order_by(CollectedRecord.collection_timestamp)
+        return {fold_name(region): population for region, population in rows}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Importa estabelecimentos do CNPJ (Receita Federal)')
+    parser.add_argument('files', nargs='+', help='arquivos Estabelecimentos*.zip (ou CSV)')
+    parser.add_argument('--municipios', help='arquivo Municipios.zip da Receita (código;nome)')
+    parser.add_argument('--chunk-rows', type=int, default=CNPJ_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    from src.main import app
+    from src.services.data_collector import DataCollectorService
+
+    with app.app_context():
+        result = DataCollectorService(http_cache=None).import_cnpj_establishments(
+            args.files, args.municipios, chunk_rows=args.chunk_rows
+        )
+        logger.info(f"Importação concluída: {result}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import insert, select, func, or_, literal
+from src.models.data_models import db, CollectedRecord
+from src.services.normalization import fold_name
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Região usada quando a coleta abrange várias localidades
+NATIONAL_REGION = 'Brasil'
+
+# Registros por instrução INSERT (executemany)
+RECORD_INSERT_CHUNK_SIZE = 1000
+
+# Coluna tipada -> campo(s) do payload, por tipo de dado. Os demais campos
+# do registro vão para attributes (JSON).
+RECORD_COLUMNS = {
+    'demographic': {
+        'region': ('nome',),
+        'state': ('uf',),
+        'population': ('population', 'populacao'),
+        'density': ('density', 'densidade')
+    },
+    'commercial': {
+        'region': ('cidade',),
+        'city': ('cidade',),
+        'category': ('categoria',),
+        'establishments': ('total_estabelecimentos',),
+        'density_per_100k': ('densidade_por_100k_hab',),
+        'growth_rate': ('crescimento_ultimo_ano',),
+        'avg_monthly_revenue': ('faturamento_medio_mensal',)
+    },
+    'social': {
+        'region': ('regiao',),
+        'category': ('categoria',),
+        'mentions': ('total_mencoes',),
+        'sentiment_score': ('score_sentimento',)
+    },
+    'real_estate': {
+        'region': ('bairro',),
+        'city': ('cidade',),
+        'commercial_rent': ('aluguel_medio_comercial',),
+        'residential_rent': ('aluguel_medio_residencial',),
+        'vacancy_rate': ('taxa_vacancia',),
+        'growth_rate': ('crescimento_preco_ano',),
+        'density': ('densidade_populacional',)
+    }
+}
+
+# Identidade de um registro entre coletas da mesma fonte e tipo
+RECORD_KEY_COLUMNS = ('region', 'city', 'state', 'category')
+
+# Colunas que compõem o hash de conteúdo
+HASHED_COLUMNS = (
+    'data_type', 'region', 'city', 'state', 'category', 'population', 'density',
+    'establishments', 'density_per_100k', 'growth_rate', 'avg_monthly_revenue', 'mentions',
+    'sentiment_score', 'commercial_rent', 'residential_rent', 'vacancy_rate', 'attributes'
+)
+
+_NUMERIC_COLUMNS = {
+    'population': int, 'establishments': int, 'mentions': int,
+    'density': float, 'density_per_100k': float, 'growth_rate': float,
+    'avg_monthly_revenue': float, 'sentiment_score': float,
+    'commercial_rent': float, 'residential_rent': float, 'vacancy_rate': float
+}
+
+
+def _typed(column: str, value: Any) -> Any:
+    """Converte o valor para o tipo da coluna (None se inválido)"""
+    if value is None or value == '':
+        return None
+    cast = _NUMERIC_COLUMNS.get(column)
+    if cast is None:
+        return str(value)
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def explode_payload(data: Dict[str, Any], data_type: str) -> List[Dict[str, Any]]:
+    """
+    Converte o payload de uma coleta ({'data': [...]}) em linhas de
+    collected_records, uma por registro, sem source_id/collection_id
+    """
+    columns = RECORD_COLUMNS.get(data_type, {})
+    default_region = data.get('region')
+    timestamp = data.get('collection_timestamp')
+    try:
+        timestamp = datetime.fromisoformat(timestamp) if timestamp else datetime.utcnow()
+    except (TypeError, ValueError):
+        timestamp = datetime.utcnow()
+
+    rows = []
+    for record in data.get('data') or []:
+        if not isinstance(record, dict):
+            continue
+
+        row = {'data_type': data_type, 'collection_timestamp': timestamp}
+        used = set()
+        for column, fields in columns.items():
+            value = None
+            for field in fields:
+                if record.get(field) is not None:
+                    value = record[field]
+                    break
+            row[column] = _typed(column, value)
+            used.update(fields)
+        row.setdefault('region', default_region)
+
+        attributes = {key: value for key, value in record.items() if key not in used}
+        row['attributes'] = json.dumps(attributes, ensure_ascii=False) if attributes else None
+        row['content_hash'] = record_hash(row)
+        row['is_deleted'] = False
+        rows.append(row)
+
+    return rows
+
+
+def record_key(row: Any) -> Tuple:
+    """Chave do registro (dict ou linha do banco) entre coletas"""
+    if isinstance(row, dict):
+        return tuple(row.get(column) for column in RECORD_KEY_COLUMNS)
+    return tuple(getattr(row, column) for column in RECORD_KEY_COLUMNS)
+
+
+def record_hash(row: Any) -> str:
+    """Hash do conteúdo do registro (dict ou linha do banco)"""
+    if isinstance(row, dict):
+        values = [row.get(column) for column in HASHED_COLUMNS]
+    else:
+        values = [getattr(row, column) for column in HASHED_COLUMNS]
+    encoded = json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def previous_snapshot(source_id: int, data_type: str, scope: str) -> Dict[Tuple, Optional[str]]:
+    """
+    Estado atual da fonte: hash do registro mais recente de cada chave, sem
+    as chaves removidas (tombstones). Fora de NATIONAL_REGION, apenas os
+    registros da localidade (região ou cidade) da coleta, comparada pelas
+    chaves normalizadas (region_key/city_key, indexadas).
+    """
+    ranked = db.session.query(
+        *(getattr(CollectedRecord, column) for column in RECORD_KEY_COLUMNS),
+        CollectedRecord.content_hash,
+        CollectedRecord.is_deleted,
+        func.row_number().over(
+            partition_by=tuple(getattr(CollectedRecord, column) for column in RECORD_KEY_COLUMNS),
+            order_by=(CollectedRecord.collection_timestamp.desc(), CollectedRecord.id.desc())
+        ).label('record_rank')
+    ).filter(
+        CollectedRecord.source_id == source_id,
+        CollectedRecord.data_type == data_type
+    )
+    if scope != NATIONAL_REGION:
+        scope_key = fold_name(scope)
+        ranked = ranked.filter(or_(CollectedRecord.region_key == scope_key, CollectedRecord.city_key == scope_key))
+    ranked = ranked.subquery()
+
+    rows = db.session.query(ranked).filter(ranked.c.record_rank == 1, ranked.c.is_deleted.is_(False))
+    return {record_key(row): row.content_hash for row in rows}
+
+
+def diff_records(rows: List[Dict[str, Any]], previous: Dict[Tuple, Optional[str]],
+                 data_type: str, timestamp: datetime) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Compara a coleta com o estado anterior. Retorna os índices dos registros
+    novos ou alterados e os tombstones das chaves que deixaram de existir.
+    Uma coleta sem registros não remove nada.
+    """
+    changed = []
+    seen = set()
+    for index, row in enumerate(rows):
+        key = record_key(row)
+        seen.add(key)
+        if previous.get(key) != row['content_hash']:
+            changed.append(index)
+
+    if not rows:
+        return changed, []
+
+    tombstones = [
+        dict(zip(RECORD_KEY_COLUMNS, key), data_type=data_type, is_deleted=True, collection_timestamp=timestamp)
+        for key in previous
+        if key not in seen
+    ]
+    return changed, tombstones
+
+
+def tombstone_missing(source_id: int, data_type: str, collection_id: int, timestamp: datetime) -> int:
+    """
+    Para coletas completas gravadas sem diferença (importações em lote):
+    grava, no próprio banco, tombstones das chaves cujo registro mais recente
+    não pertence à coleta collection_id. Não faz commit.
+    """
+    key_columns = [getattr(CollectedRecord, column) for column in RECORD_KEY_COLUMNS]
+    ranked = select(
+        *key_columns,
+        CollectedRecord.region_key,
+        CollectedRecord.city_key,
+        CollectedRecord.collection_id,
+        CollectedRecord.is_deleted,
+        func.row_number().over(
+            partition_by=tuple(key_columns),
+            order_by=(CollectedRecord.collection_timestamp.desc(), CollectedRecord.id.desc())
+        ).label('record_rank')
+    ).where(
+        CollectedRecord.source_id == source_id,
+        CollectedRecord.data_type == data_type
+    ).subquery()
+
+    missing = select(
+        *(ranked.c[column] for column in RECORD_KEY_COLUMNS),
+        ranked.c.region_key, ranked.c.city_key,
+        literal(data_type), literal(source_id), literal(collection_id), literal(True), literal(timestamp)
+    ).where(
+        ranked.c.record_rank == 1,
+        ranked.c.is_deleted.is_(False),
+        ranked.c.collection_id != collection_id
+    )
+    result = db.session.execute(insert(CollectedRecord).from_select(
+        [*RECORD_KEY_COLUMNS, 'region_key', 'city_key', 'data_type', 'source_id', 'collection_id', 'is_deleted', 'collection_timestamp'],
+        missing
+    ))
+    return result.rowcount
+
+
+def payload_region(data: Dict[str, Any], rows: List[Dict[str, Any]]) -> str:
+    """
+    Região do cabeçalho da coleta: a informada no payload, a localidade
+    comum a todos os registros ou, se houver várias, a cidade comum;
+    caso contrário, NATIONAL_REGION
+    """
+    if data.get('region'):
+        return data['region']
+    for column in ('region', 'city'):
+        values = {row.get(column) for row in rows}
+        if len(values) == 1 and None not in values:
+            return values.pop()
+    return NATIONAL_REGION
+
+
+def bulk_insert_records(rows: List[Dict[str, Any]]) -> int:
+    """
+    Insere os registros em lote (executemany) na sessão atual. Não faz
+    commit nem dispara eventos do ORM.
+    """
+    for start in range(0, len(rows), RECORD_INSERT_CHUNK_SIZE):
+        db.session.execute(insert(CollectedRecord), rows[start:start + RECORD_INSERT_CHUNK_SIZE])
+    return len(rows)
+
+
+def record_localities(rows: List[Dict[str, Any]]) -> List[str]:
+    """Localidades (região e cidade) distintas dos registros"""
+    localities = {row.get(column) for row in rows for column in ('region', 'city')}
+    localities.discard(None)
+    return sorted(localities)
@@ -1,22 +1,51 @@
+import os
 import requests
 import time
+import threading
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from sqlalchemy import update
 from src.models.data_models import db, DataSource, CollectedData, CollectionLog
+from src.services.ibge_ingestion import IBGEMunicipalityIngestion
+from src.services.http_cache import HTTPDiskCache, mount_http_cache
+from src.services.collected_records import (
+    NATIONAL_REGION, RECORD_KEY_COLUMNS, explode_payload, payload_region, previous_snapshot,
+    diff_records, record_hash, tombstone_missing, bulk_insert_records, record_localities
+)
+from src.services.cnpj_import import CNPJ_CHUNK_ROWS, CNPJEstablishmentImporter, load_municipality_names
+from src.services.feature_cache import region_feature_cache
+from src.services.gazetteer import gazetteer
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Timeout padrão (segundos) de cada fonte na coleta completa
+DEFAULT_COLLECTION_TIMEOUT = 60
+
+# Cache do processo: nome da fonte -> id (apenas fontes já confirmadas no banco)
+_source_ids = {}
+_source_ids_lock = threading.Lock()
+
 class DataCollectorService:
     """Serviço responsável pela coleta de dados de diferentes fontes"""
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 4, http_cache: Optional[HTTPDiskCache] = None):
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'MapaOportunidades/1.0 (Data Collection Service)'
         })
+        
+        # Cache HTTP em disco com revalidação condicional (ETag/Last-Modified)
+        self.http_cache = mount_http_cache(self.session, http_cache)
+        
+        # Coleta completa: threads simultâneas e timeout por fonte (segundos)
+        self.max_workers = max_workers
+        self.collection_timeouts = {
+            'IBGE Demographics': 45
+        }
     
     def collect_ibge_demographic_data(self, region_code: str = None) -> Dict[str, Any]:
         """
@@ -61,6 +90,82 @@ class DataCollectorService:
             logger.error(f"Erro ao coletar dados do IBGE: {str(e)}")
             raise
     
+    def ingest_ibge_municipalities(self, state: str = None, centroids: bool = True) -> Dict[str, Any]:
+        """
+        Ingestão completa dos municípios do IBGE (ou de uma UF) com a hierarquia
+        micro/mesorregião, UF e grande região na tabela municipalities e,
+        opcionalmente, os centróides das malhas. A resposta é lida em
+        streaming e gravada em lotes; não faz commit.
+        """
+        try:
+            ingestion = IBGEMunicipalityIngestion(self.session)
+            result = ingestion.ingest(state)
+            if centroids:
+                result['centroids'] = ingestion.ingest_centroids(state)
+            return result
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Erro na ingestão de municípios do IBGE: {str(e)}")
+            raise
+
+    def import_cnpj_establishments(self, paths: List[str], municipios_path: Optional[str] = None,
+                                   chunk_rows: int = CNPJ_CHUNK_ROWS) -> Dict[str, Any]:
+        """
+        Importa os arquivos locais de estabelecimentos do CNPJ (Receita Federal):
+        agrega por município/bairro e categoria em establishment_counts e
+        publica o resultado como uma coleta 'commercial' em collected_records.
+        Se algo falhar, as contagens e a coleta anteriores continuam valendo.
+        """
+        start_time = time.time()
+        importer = CNPJEstablishmentImporter(chunk_rows)
+        try:
+            stats = importer.aggregate(paths)
+            municipality_names = load_municipality_names(municipios_path) if municipios_path else {}
+
+            pending_sources = {}
+            source_id = self._get_source_id('Receita Federal CNPJ', pending_sources)
+            collected_data = CollectedData(source_id=source_id, data_type='commercial', region=NATIONAL_REGION)
+            collected_data.set_raw_data({
+                'source': 'Receita Federal CNPJ',
+                'files': [os.path.basename(path) for path in paths],
+                'collection_timestamp': datetime.utcnow().isoformat(),
+                **stats
+            })
+            db.session.add(collected_data)
+            db.session.flush()
+
+            records = 0
+            for chunk in importer.iter_records(municipality_names):
+                for record in chunk:
+                    record['collection_id'] = collected_data.id
+                    record['source_id'] = source_id
+                    record['collection_timestamp'] = collected_data.collection_timestamp
+                    record['content_hash'] = record_hash(record)
+                records += bulk_insert_records(chunk)
+
+            # Importação completa: chaves ausentes do arquivo viram tombstones
+            removed = tombstone_missing(
+                source_id, 'commercial', collected_data.id, collected_data.collection_timestamp
+            )
+
+            # Contagens anteriores trocadas pelas novas no mesmo commit da publicação
+            importer.discard_previous_imports()
+            db.session.execute(
+                update(DataSource).where(DataSource.id == source_id).values(last_updated=datetime.utcnow())
+            )
+            self._log_collection(source_id, 'success', records, time.time() - start_time)
+            db.session.commit()
+            self._remember_sources(pending_sources)
+        except Exception as e:
+            logger.error(f"Erro na importação do CNPJ: {str(e)}")
+            # Blocos já confirmados desta importação; a anterior continua intacta
+            importer.discard_import()
+            raise
+
+        # Todas as cidades e bairros podem ter mudado
+        region_feature_cache.invalidate(None)
+        return {'collection_id': collected_data.id, 'records': records, 'removed': removed, **stats}
+
     def collect_cnpj_business_data(self, city: str = "São Paulo") -> Dict[str, Any]:
         """
         Simula coleta de dados de empresas (CNPJ)
@@ -198,44 +303,94 @@ class DataCollectorService:
             logger.error(f"Erro ao simular dados imobiliários: {str(e)}")
             raise
     
-    def save_collected_data(self, data: Dict[str, Any], source_name: str, data_type: str) -> bool:
+    def collections(self) -> List[Tuple[str, Any, str]]:
+        """Coletas disponíveis: (nome da fonte, coletor, tipo de dado)"""
+        return [
+            ('IBGE Demographics', self.collect_ibge_demographic_data, 'demographic'),
+            ('CNPJ Business Data', self.collect_cnpj_business_data, 'commercial'),
+            ('Social Media Sentiment', self.collect_social_media_sentiment, 'social'),
+            ('Rental Market Data', self.collect_rental_market_data, 'real_estate')
+        ]
+    
+    def run_collection(self, name: str) -> Dict[str, Any]:
         """
-        Salva dados coletados no banco de dados
+        Executa e grava uma única coleta (pelo nome da fonte) com o timeout da
+        fonte, registrando o CollectionLog de sucesso ou erro em um único commit.
+        Retorna o resumo no formato de run_full_collection()['collections'].
         """
+        collections = {collection[0]: collection for collection in self.collections()}
+        if name not in collections:
+            raise ValueError(f'Coleta desconhecida: {name}')
+        _, collector_func, data_type = collections[name]
+        timeout = self.collection_timeouts.get(name, DEFAULT_COLLECTION_TIMEOUT)
+        
+        pending_sources = {}
+        localities = []
+        executor = ThreadPoolExecutor(max_workers=1)
+        start_time = time.time()
         try:
-            # Buscar ou criar fonte de dados
-            source = DataSource.query.filter_by(name=source_name).first()
-            if not source:
-                source = DataSource(
-                    name=source_name,
-                    type='api' if 'API' in source_name else 'simulation',
-                    description=f"Fonte de dados: {source_name}"
-                )
-                db.session.add(source)
-                db.session.commit()
-            
-            # Criar registro de dados coletados
-            collected_data = CollectedData(
-                source_id=source.id,
-                data_type=data_type,
-                region=data.get('region', 'Brasil'),
-                raw_data=data
-            )
-            
-            db.session.add(collected_data)
+            source_id = self._get_source_id(name, pending_sources)
+            try:
+                data, execution_time = executor.submit(self._timed_collect, collector_func).result(timeout=timeout)
+                with db.session.begin_nested():
+                    localities = self._persist_collection(data, source_id, data_type, execution_time)
+                result = {
+                    'name': name,
+                    'status': 'success',
+                    'records_collected': data.get('total_records', 0),
+                    'execution_time': round(execution_time, 2)
+                }
+            except Exception as e:
+                error = f'Timeout após {timeout}s' if isinstance(e, FutureTimeoutError) else str(e)
+                execution_time = time.time() - start_time
+                logger.error(f"Erro na coleta {name}: {error}")
+                self._log_collection(source_id, 'error', 0, execution_time, error)
+                result = {
+                    'name': name,
+                    'status': 'error',
+                    'error': error,
+                    'execution_time': round(execution_time, 2)
+                }
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        self._remember_sources(pending_sources)
+        self._invalidate_localities(localities)
+        return result
+    
+    def save_collected_data(self, data: Dict[str, Any], source_name: str, data_type: str,
+                            execution_time: Optional[float] = None) -> bool:
+        """
+        Salva dados coletados no banco de dados, com last_updated da fonte e
+        o log da coleta, em uma única transação
+        """
+        pending_sources = {}
+        try:
+            source_id = self._get_source_id(source_name, pending_sources)
+            localities = self._persist_collection(data, source_id, data_type, execution_time)
             db.session.commit()
-            
-            logger.info(f"Dados salvos com sucesso: {source_name} - {data_type}")
-            return True
             
         except Exception as e:
             logger.error(f"Erro ao salvar dados: {str(e)}")
             db.session.rollback()
             return False
+        
+        self._remember_sources(pending_sources)
+        self._invalidate_localities(localities)
+        logger.info(f"Dados salvos com sucesso: {source_name} - {data_type}")
+        return True
     
     def run_full_collection(self) -> Dict[str, Any]:
         """
-        Executa coleta completa de todas as fontes
+        Executa coleta completa de todas as fontes.
+        Os coletores rodam em paralelo em um pool de threads limitado, cada um
+        com seu próprio timeout; a gravação é feita em seguida, nesta thread
+        (que tem o contexto da aplicação), na ordem original das fontes, e
+        toda a execução (dados, last_updated e logs) é confirmada em um único commit.
         """
         results = {
             'started_at': datetime.utcnow().isoformat(),
@@ -245,55 +400,201 @@ class DataCollectorService:
         }
         
         # Lista de coletas a executar
-        collections = [
-            ('IBGE Demographics', self.collect_ibge_demographic_data, 'demographic'),
-            ('CNPJ Business Data', self.collect_cnpj_business_data, 'commercial'),
-            ('Social Media Sentiment', self.collect_social_media_sentiment, 'social'),
-            ('Rental Market Data', self.collect_rental_market_data, 'real_estate')
-        ]
+        collections = self.collections()
         
-        for name, collector_func, data_type in collections:
-            try:
+        pending_sources = {}
+        localities = []
+        
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(collections)))
+        try:
+            futures = []
+            for name, collector_func, data_type in collections:
                 logger.info(f"Iniciando coleta: {name}")
-                start_time = time.time()
-                
-                # Executar coleta
-                if name == 'IBGE Demographics':
-                    data = collector_func()
-                else:
-                    data = collector_func()
-                
-                execution_time = time.time() - start_time
-                
-                # Salvar dados
-                saved = self.save_collected_data(data, name, data_type)
-                
-                collection_result = {
-                    'name': name,
-                    'status': 'success' if saved else 'error',
-                    'records_collected': data.get('total_records', 0),
-                    'execution_time': round(execution_time, 2)
-                }
-                
-                results['collections'].append(collection_result)
-                
-                if saved:
+                futures.append(executor.submit(self._timed_collect, collector_func))
+            started = time.time()
+            
+            for (name, collector_func, data_type), future in zip(collections, futures):
+                timeout = self.collection_timeouts.get(name, DEFAULT_COLLECTION_TIMEOUT)
+                execution_time = 0
+                source_id = None
+                try:
+                    source_id = self._get_source_id(name, pending_sources)
+                    
+                    # O prazo de cada fonte conta a partir do disparo conjunto
+                    data, execution_time = future.result(timeout=max(0, started + timeout - time.time()))
+                    
+                    # Salvar dados (savepoint: uma fonte com erro não descarta as demais)
+                    with db.session.begin_nested():
+                        localities += self._persist_collection(data, source_id, data_type, execution_time)
+                    
+                    results['collections'].append({
+                        'name': name,
+                        'status': 'success',
+                        'records_collected': data.get('total_records', 0),
+                        'execution_time': round(execution_time, 2)
+                    })
                     results['total_success'] += 1
-                else:
+                    
+                    logger.info(f"Coleta concluída: {name} - success")
+                    
+                except Exception as e:
+                    if isinstance(e, FutureTimeoutError):
+                        future.cancel()
+                        error = f'Timeout após {timeout}s'
+                        execution_time = time.time() - started
+                    else:
+                        error = str(e)
+                    logger.error(f"Erro na coleta {name}: {error}")
+                    
+                    results['collections'].append({
+                        'name': name,
+                        'status': 'error',
+                        'error': error,
+                        'execution_time': round(execution_time, 2)
+                    })
                     results['total_errors'] += 1
-                
-                logger.info(f"Coleta concluída: {name} - {collection_result['status']}")
-                
-            except Exception as e:
-                logger.error(f"Erro na coleta {name}: {str(e)}")
-                results['collections'].append({
-                    'name': name,
-                    'status': 'error',
-                    'error': str(e),
-                    'execution_time': 0
-                })
-                results['total_errors'] += 1
+                    
+                    if source_id is not None:
+                        self._log_collection(source_id, 'error', 0, execution_time, error)
+        finally:
+            # Não esperar coletores que estouraram o prazo
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        try:
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Erro ao salvar coleta completa: {str(e)}")
+            db.session.rollback()
+            for collection in results['collections']:
+                if collection['status'] == 'success':
+                    collection['status'] = 'error'
+                    collection['error'] = str(e)
+            results['total_errors'] += results['total_success']
+            results['total_success'] = 0
+            pending_sources = {}
+            localities = []
+        
+        self._remember_sources(pending_sources)
+        self._invalidate_localities(localities)
         
         results['finished_at'] = datetime.utcnow().isoformat()
         return results
+    
+    def _get_source_id(self, source_name: str, pending_sources: Dict[str, int]) -> int:
+        """
+        Id da fonte pelo nome: cache do processo, fontes criadas na transação
+        atual (pending_sources) ou banco; fontes novas são criadas sem commit
+        """
+        with _source_ids_lock:
+            source_id = _source_ids.get(source_name)
+        if source_id is None:
+            source_id = pending_sources.get(source_name)
+        if source_id is not None:
+            return source_id
+        
+        source_id = db.session.query(DataSource.id).filter_by(name=source_name).scalar()
+        if source_id is None:
+            source = DataSource(
+                name=source_name,
+                type='api' if 'API' in source_name else 'simulation',
+                description=f"Fonte de dados: {source_name}"
+            )
+            db.session.add(source)
+            db.session.flush()
+            source_id = source.id
+        
+        pending_sources[source_name] = source_id
+        return source_id
+    
+    @staticmethod
+    def _remember_sources(pending_sources: Dict[str, int]):
+        """Guarda no cache do processo os ids de fontes confirmadas pelo commit"""
+        with _source_ids_lock:
+            _source_ids.update(pending_sources)
+    
+    def _persist_collection(self, data: Dict[str, Any], source_id: int, data_type: str,
+                            execution_time: Optional[float]) -> List[str]:
+        """
+        Grava a coleta de forma incremental: apenas registros novos ou
+        alterados em relação ao estado anterior da fonte, mais tombstones dos
+        removidos. Atualiza last_updated da fonte e registra o log, sem
+        commit. Retorna as localidades alteradas.
+        """
+        # Um registro tipado por localidade/categoria do payload
+        records = explode_payload(data, data_type)
+        region = payload_region(data, records)
+        timestamp = records[0]['collection_timestamp'] if records else datetime.utcnow()
+
+        changed, tombstones = diff_records(
+            records, previous_snapshot(source_id, data_type, region), data_type, timestamp
+        )
+
+        db.session.execute(
+            update(DataSource).where(DataSource.id == source_id).values(last_updated=datetime.utcnow())
+        )
+        self._log_collection(source_id, 'success', data.get('total_records', len(records)), execution_time)
+
+        if not changed and not tombstones:
+            logger.info(f"Coleta {data_type} ({region}) sem alterações")
+            return []
 
+        # Cabeçalho da coleta com apenas a diferença em relação ao estado anterior
+        payload_records = [record for record in data.get('data') or [] if isinstance(record, dict)]
+        delta = {key: value for key, value in data.items() if key != 'data'}
+        delta.update({
+            'data': [payload_records[index] for index in changed],
+            'removed': [
+                {column: tombstone[column] for column in RECORD_KEY_COLUMNS} for tombstone in tombstones
+            ],
+            'unchanged_records': len(records) - len(changed)
+        })
+        collected_data = CollectedData(source_id=source_id, data_type=data_type, region=region)
+        collected_data.set_raw_data(delta)
+        place = gazetteer.resolve(region)
+        if place:
+            collected_data.latitude = place['latitude']
+            collected_data.longitude = place['longitude']
+
+        db.session.add(collected_data)
+        db.session.flush()
+
+        written = [records[index] for index in changed]
+        for record in written + tombstones:
+            record['collection_id'] = collected_data.id
+            record['source_id'] = source_id
+        bulk_insert_records(written)
+        bulk_insert_records(tombstones)
+
+        logger.info(
+            f"Coleta {data_type} ({region}): {len(written)} registros novos ou alterados, "
+            f"{len(tombstones)} removidos"
+        )
+        return record_localities(written + tombstones)
+    
+    @staticmethod
+    def _log_collection(source_id: int, status: str, records_collected: int,
+                        execution_time: Optional[float], error_message: Optional[str] = None):
+        """Adiciona à sessão o log de uma execução de coleta"""
+        finished_at = datetime.utcnow()
+        db.session.add(CollectionLog(
+            source_id=source_id,
+            status=status,
+            records_collected=records_collected,
+            error_message=error_message,
+            execution_time=round(execution_time, 2) if execution_time is not None else None,
+            started_at=finished_at - timedelta(seconds=execution_time or 0),
+            finished_at=finished_at
+        ))
+    
+    @staticmethod
+    def _invalidate_localities(localities: List[str]):
+        """A inserção em lote não dispara eventos do ORM: invalidar o cache de features aqui"""
+        for locality in set(localities):
+            region_feature_cache.invalidate(locality)
+    
+    @staticmethod
+    def _timed_collect(collector_func) -> Tuple[Dict[str, Any], float]:
+        """Executa um coletor e mede seu tempo de execução"""
+        start_time = time.time()
+        data = collector_func()
+        return data, time.time() - start_time
@@ -0,0 +1,151 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from flask import has_app_context
+from sqlalchemy import event
+from src.models.data_models import db, CollectedData, DataSource
+from src.services.normalization import fold_name
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Configurações padrão do cache de features por região
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 900
+
+# Intervalo mínimo entre verificações de coletas feitas por outros processos
+COLLECTION_CHECK_SECONDS = 10
+
+# Regiões que representam coletas nacionais (invalidam o cache inteiro)
+NATIONAL_REGIONS = {'', 'brasil'}
+
+# Marca de coleta ainda não lida do banco
+_UNCHECKED = object()
+
+
+class RegionFeatureCache:
+    """
+    Cache em memória (por processo) das features de entrada de cada região,
+    com despejo LRU limitado por tamanho, expiração por TTL e contadores
+    de acerto/falha. Gravações do próprio processo invalidam as regiões
+    afetadas; coletas de outros processos (workers, scheduler) são
+    detectadas pelo maior DataSource.last_updated, verificado no máximo a
+    cada check_seconds, e descartam o cache inteiro.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 check_seconds: float = COLLECTION_CHECK_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._entries = OrderedDict()  # region -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._collection_stamp = _UNCHECKED  # maior last_updated já refletido no cache
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, region: str) -> Optional[Any]:
+        """Retorna o valor em cache ou None se ausente/expirado"""
+        now = time.monotonic()
+        self._check_collections(now)
+        with self._lock:
+            entry = self._entries.get(region)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[region]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(region)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, region: str, value: Any):
+        """Armazena o valor, despejando as entradas menos usadas se necessário"""
+        with self._lock:
+            self._entries[region] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(region)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, region: str, loader: Callable[[str], Any]) -> Any:
+        """Retorna o valor em cache ou carrega com loader(region) e armazena"""
+        value = self.get(region)
+        if value is None:
+            value = loader(region)
+            self.set(region, value)
+        return value
+
+    def invalidate(self, region: Optional[str] = None):
+        """
+        Invalida as entradas da região (comparadas sem acentos e maiúsculas,
+        como region_key/city_key). Sem região, ou para coletas nacionais,
+        limpa o cache inteiro.
+        """
+        key = fold_name(region or '')
+        with self._lock:
+            if key in NATIONAL_REGIONS:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [cached for cached in self._entries if fold_name(cached) == key]
+                for cached in stale:
+                    del self._entries[cached]
+                removed = len(stale)
+            self.invalidations += removed
+
+    def clear(self):
+        """Remove todas as entradas"""
+        self.invalidate(None)
+
+    def _check_collections(self, now: float):
+        """Descarta o cache se alguma fonte recebeu coleta desde a última verificação"""
+        if not has_app_context():
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_seconds:
+                return
+            self._checked_at = now
+
+        try:
+            with db.session.no_autoflush:
+                stamp = db.session.query(db.func.max(DataSource.last_updated)).scalar()
+        except Exception as e:
+            logger.error(f"Erro ao verificar coletas recentes: {str(e)}")
+            return
+
+        with self._lock:
+            seen, self._collection_stamp = self._collection_stamp, stamp
+        if seen is not _UNCHECKED and stamp != seen:
+            self.invalidate(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores do cache"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+# Cache compartilhado pelos serviços do processo
+region_feature_cache = RegionFeatureCache()
+
+
+@event.listens_for(CollectedData, 'after_insert')
+def _invalidate_on_collected_data(mapper, connection, target):
+    """Invalida o cache quando novos dados coletados são gravados"""
+    region_feature_cache.invalidate(target.region)
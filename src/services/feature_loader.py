@@ -0,0 +1,172 @@
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Iterable
+from sqlalchemy import func, or_
+from src.models.data_models import db, CollectedRecord
+from src.services.normalization import fold_name
+from src.services.collected_records import RECORD_KEY_COLUMNS
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tipos de dados usados pelo motor de scoring -> chave em region inputs
+FEATURE_DATA_TYPES = {
+    'demographic': 'demographic',
+    'commercial': 'business',
+    'social': 'social',
+    'real_estate': 'rental'
+}
+
+# Máximo de regiões por consulta (limite de parâmetros do banco)
+MAX_REGIONS_PER_QUERY = 5000
+
+
+def _normalize(value: Any) -> str:
+    """Normaliza nomes de região como region_key/city_key (sem acentos, minúsculas)"""
+    return fold_name(str(value or ''))
+
+
+class RegionFeatureLoader:
+    """
+    Carrega de collected_records os registros mais recentes de demographic,
+    commercial, social e real_estate para uma lista de regiões em uma única
+    consulta com janela (ROW_NUMBER por fonte, tipo e chave do registro),
+    filtrada pelas colunas indexadas region_key/city_key e lendo apenas as
+    colunas tipadas usadas pelo scoring.
+    """
+
+    def load(self, regions: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Retorna {região: {'demographic', 'business', 'social', 'rental'}}; tipos
+        sem dados ficam como None
+        """
+        regions = list(dict.fromkeys(regions))
+        features = {region: dict.fromkeys(FEATURE_DATA_TYPES.values()) for region in regions}
+
+        for start in range(0, len(regions), MAX_REGIONS_PER_QUERY):
+            chunk = regions[start:start + MAX_REGIONS_PER_QUERY]
+            records = self._latest_records({_normalize(region) for region in chunk})
+
+            for region in chunk:
+                key = _normalize(region)
+                features[region] = {
+                    'demographic': self._project_demographic(records[('demographic', 'region', key)], region),
+                    'business': self._project_business(records[('commercial', 'region', key)]),
+                    'social': self._project_social(records[('social', 'region', key)]),
+                    'rental': self._project_rental(
+                        records[('real_estate', 'region', key)] or records[('real_estate', 'city', key)],
+                        region
+                    )
+                }
+
+        return features
+
+    def _latest_records(self, keys: set) -> Dict[tuple, List[Any]]:
+        """
+        Busca o registro mais recente de cada (fonte, tipo, chave do registro)
+        das regiões, agrupados por (tipo, 'region'|'city', chave normalizada).
+        A partição usa a mesma chave da coleta incremental, então o tombstone
+        de uma fonte não esconde o registro de outra.
+        """
+        ranked = db.session.query(
+            CollectedRecord.data_type,
+            CollectedRecord.region_key,
+            CollectedRecord.city_key,
+            CollectedRecord.category,
+            CollectedRecord.population,
+            CollectedRecord.density,
+            CollectedRecord.establishments,
+            CollectedRecord.density_per_100k,
+            CollectedRecord.growth_rate,
+            CollectedRecord.mentions,
+            CollectedRecord.sentiment_score,
+            CollectedRecord.commercial_rent,
+            CollectedRecord.vacancy_rate,
+            CollectedRecord.attributes,
+            CollectedRecord.is_deleted,
+            func.row_number().over(
+                partition_by=(
+                    CollectedRecord.source_id, CollectedRecord.data_type,
+                    *(getattr(CollectedRecord, column) for column in RECORD_KEY_COLUMNS)
+                ),
+                order_by=(CollectedRecord.collection_timestamp.desc(), CollectedRecord.id.desc())
+            ).label('record_rank')
+        ).filter(
+            CollectedRecord.data_type.in_(list(FEATURE_DATA_TYPES)),
+            or_(
+                CollectedRecord.region_key.in_(keys),
+                CollectedRecord.city_key.in_(keys)
+            )
+        ).subquery()
+
+        # Registros cuja versão mais recente é um tombstone foram removidos da fonte
+        rows = db.session.query(ranked).filter(ranked.c.record_rank == 1, ranked.c.is_deleted.is_(False)).all()
+
+        records = defaultdict(list)
+        for row in rows:
+            records[(row.data_type, 'region', row.region_key)].append(row)
+            if row.city_key is not None:
+                records[(row.data_type, 'city', row.city_key)].append(row)
+        return records
+
+    @staticmethod
+    def _project_demographic(records: List[Any], region: str) -> Optional[Dict[str, Any]]:
+        """População e densidade da localidade com o nome da região"""
+        for record in records:
+            if record.population is None:
+                continue
+            return {
+                'population': record.population,
+                'density': record.density or 0,
+                'region': region
+            }
+        return None
+
+    @staticmethod
+    def _project_business(records: List[Any]) -> Optional[List[Dict[str, Any]]]:
+        """Contagens por categoria da região"""
+        business_data = [
+            {
+                'categoria': record.category or '',
+                'total_estabelecimentos': record.establishments or 0,
+                'densidade_por_100k_hab': record.density_per_100k or 0,
+                'crescimento_ultimo_ano': record.growth_rate or 0
+            }
+            for record in records
+        ]
+        return business_data or None
+
+    @staticmethod
+    def _project_social(records: List[Any]) -> Optional[List[Dict[str, Any]]]:
+        """Métricas de sentimento por categoria da região"""
+        social_data = []
+        for record in records:
+            try:
+                attributes = json.loads(record.attributes) if record.attributes else {}
+            except (TypeError, ValueError):
+                attributes = {}
+            social_data.append({
+                'categoria': record.category or '',
+                'total_mencoes': record.mentions or 0,
+                'score_sentimento': record.sentiment_score or 0,
+                'principais_reclamacoes': attributes.get('principais_reclamacoes', [])
+            })
+        return social_data or None
+
+    @staticmethod
+    def _project_rental(records: List[Any], region: str) -> Optional[Dict[str, Any]]:
+        """Aluguel médio e vacância do bairro, ou a média dos bairros da cidade"""
+        if not records:
+            return None
+
+        return {
+            'aluguel_medio_comercial': round(
+                sum(record.commercial_rent or 0 for record in records) / len(records)
+            ),
+            'taxa_vacancia': round(
+                sum(record.vacancy_rate or 0 for record in records) / len(records), 1
+            ),
+            'regiao': region
+        }
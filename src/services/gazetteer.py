@@ -0,0 +1,182 @@
+import re
+import time
+import threading
+import logging
+from typing import Dict, List, Any, Optional
+from src.models.data_models import db, Municipality
+from src.services.normalization import fold_name
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Recarga periódica (ingestões feitas por outros workers não chegam aqui)
+GAZETTEER_TTL_SECONDS = 3600
+
+# Sugestões retornadas pelo autocomplete
+AUTOCOMPLETE_LIMIT = 10
+
+# "Nome - UF", "Nome/UF", "Nome, UF" ou "Nome (UF)"
+_NAME_WITH_STATE = re.compile(r'^(.+?)\s*[-/,(]\s*([A-Za-z]{2})\s*\)?$')
+
+
+class _TrieNode:
+    __slots__ = ('children', 'codes')
+
+    def __init__(self):
+        self.children = {}
+        self.codes = []
+
+
+def _trie_insert(root: _TrieNode, key: str, code: int):
+    node = root
+    for char in key:
+        node = node.children.setdefault(char, _TrieNode())
+    node.codes.append(code)
+
+
+def _trie_collect(root: _TrieNode, prefix: str, limit: int, found: List[int], seen: set):
+    """Códigos sob o prefixo, em ordem alfabética, até completar limit"""
+    node = root
+    for char in prefix:
+        node = node.children.get(char)
+        if node is None:
+            return
+
+    stack = [node]
+    while stack and len(found) < limit:
+        node = stack.pop()
+        for code in node.codes:
+            if code not in seen:
+                seen.add(code)
+                found.append(code)
+                if len(found) >= limit:
+                    return
+        stack.extend(node.children[char] for char in sorted(node.children, reverse=True))
+
+
+def _entry(municipality: Municipality) -> Dict[str, Any]:
+    """Município com centróide e hierarquia (micro/mesorregião, UF e grande região)"""
+    return {
+        'code': municipality.id,
+        'name': municipality.name,
+        'state_code': municipality.state_code,
+        'latitude': municipality.latitude,
+        'longitude': municipality.longitude,
+        'hierarchy': {
+            'microregion': {'id': municipality.microregion_id, 'name': municipality.microregion_name},
+            'mesoregion': {'id': municipality.mesoregion_id, 'name': municipality.mesoregion_name},
+            'state': {
+                'id': municipality.state_id, 'code': municipality.state_code, 'name': municipality.state_name
+            },
+            'macroregion': {
+                'id': municipality.macroregion_id, 'code': municipality.macroregion_code,
+                'name': municipality.macroregion_name
+            }
+        }
+    }
+
+
+class Gazetteer:
+    """
+    Índice em memória dos municípios do IBGE (tabela municipalities): nome
+    normalizado -> municípios por hash, código IBGE -> município, e tries
+    de prefixo do nome completo e de cada palavra do nome para o
+    autocomplete. É montado por inteiro a cada carga e trocado de uma vez.
+    """
+
+    def __init__(self, ttl_seconds: float = GAZETTEER_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._by_code = {}
+        self._by_name = {}
+        self._name_trie = _TrieNode()
+        self._word_trie = _TrieNode()
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def resolve(self, name: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Município pelo nome (sem diferenciar acentos e maiúsculas), aceitando
+        a UF após o nome ("Bom Jesus - PI"). Nomes ambíguos sem UF e nomes
+        desconhecidos retornam None.
+        """
+        if not name:
+            return None
+        self._ensure_loaded()
+
+        codes = self._by_name.get(fold_name(name), [])
+        state = None
+        if not codes:
+            match = _NAME_WITH_STATE.match(name.strip())
+            if match:
+                codes = self._by_name.get(fold_name(match.group(1)), [])
+                state = match.group(2).upper()
+
+        if state:
+            codes = [code for code in codes if self._by_code[code]['state_code'] == state]
+        if len(codes) != 1:
+            return None
+        return self._by_code[codes[0]]
+
+    def get(self, code: int) -> Optional[Dict[str, Any]]:
+        """Município pelo código IBGE"""
+        self._ensure_loaded()
+        return self._by_code.get(code)
+
+    def autocomplete(self, prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[Dict[str, Any]]:
+        """
+        Municípios cujo nome começa com o prefixo e, em seguida, os que têm
+        uma palavra começando com ele ("pau" -> Paulínia, ..., São Paulo)
+        """
+        key = fold_name(prefix)
+        if not key or limit <= 0:
+            return []
+        self._ensure_loaded()
+
+        found, seen = [], set()
+        _trie_collect(self._name_trie, key, limit, found, seen)
+        if len(found) < limit:
+            _trie_collect(self._word_trie, key, limit, found, seen)
+        return [self._by_code[code] for code in found]
+
+    def invalidate(self):
+        """Força a recarga na próxima consulta (após nova ingestão do IBGE)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'municipalities': len(self._by_code),
+            'names': len(self._by_name),
+            'with_centroid': sum(1 for entry in self._by_code.values() if entry['latitude'] is not None),
+            'ttl_seconds': self.ttl_seconds
+        }
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return
+            self._load()
+
+    def _load(self):
+        by_code, by_name = {}, {}
+        name_trie, word_trie = _TrieNode(), _TrieNode()
+
+        for municipality in db.session.query(Municipality).order_by(Municipality.id):
+            entry = _entry(municipality)
+            key = fold_name(municipality.name)
+            by_code[entry['code']] = entry
+            by_name.setdefault(key, []).append(entry['code'])
+            _trie_insert(name_trie, key, entry['code'])
+            words = key.split(' ')
+            for position in range(1, len(words)):
+                _trie_insert(word_trie, ' '.join(words[position:]), entry['code'])
+
+        self._by_code, self._by_name = by_code, by_name
+        self._name_trie, self._word_trie = name_trie, word_trie
+        self._loaded_at = time.monotonic()
+        logger.info(f"Gazetteer carregado: {len(by_code)} municípios")
+
+
+# Instância compartilhada pelo processo
+gazetteer = Gazetteer()
@@ -0,0 +1,122 @@
+import math
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Bits do geohash inteiro (26 para longitude + 26 para latitude, ~0,6 m)
+GEOHASH_BITS = 52
+_AXIS_BITS = GEOHASH_BITS // 2
+
+# Máximo de células usadas para cobrir uma área de busca
+MAX_COVER_CELLS = 16
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _interleave(x: int, y: int, axis_bits: int) -> int:
+    """Intercala os bits de x (longitude) e y (latitude), longitude primeiro"""
+    code = 0
+    for i in range(axis_bits - 1, -1, -1):
+        code = (code << 2) | (((x >> i) & 1) << 1) | ((y >> i) & 1)
+    return code
+
+
+def _axis_index(value: float, minimum: float, span: float, axis_bits: int) -> int:
+    """Posição da coordenada na grade de 2**axis_bits divisões"""
+    cells = 1 << axis_bits
+    index = int((value - minimum) / span * cells)
+    return min(max(index, 0), cells - 1)
+
+
+def geohash(latitude: Optional[float], longitude: Optional[float]) -> Optional[int]:
+    """
+    Geohash inteiro de 52 bits. Prefixos de bits correspondem às mesmas
+    células do geohash em base32, então uma célula vira um intervalo contínuo
+    de inteiros, indexável por B-tree em qualquer banco.
+    """
+    if latitude is None or longitude is None:
+        return None
+    x = _axis_index(longitude, -180.0, 360.0, _AXIS_BITS)
+    y = _axis_index(latitude, -90.0, 180.0, _AXIS_BITS)
+    return _interleave(x, y, _AXIS_BITS)
+
+
+def cover_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               max_cells: int = MAX_COVER_CELLS) -> List[Tuple[int, int]]:
+    """
+    Intervalos [início, fim) de geohash que cobrem a caixa, usando a maior
+    precisão que não ultrapasse max_cells células. Intervalos contíguos são unidos.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+
+    axis_bits = _AXIS_BITS
+    while axis_bits > 0:
+        x0 = _axis_index(min_lon, -180.0, 360.0, axis_bits)
+        x1 = _axis_index(max_lon, -180.0, 360.0, axis_bits)
+        y0 = _axis_index(min_lat, -90.0, 180.0, axis_bits)
+        y1 = _axis_index(max_lat, -90.0, 180.0, axis_bits)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_cells:
+            break
+        axis_bits -= 1
+
+    if axis_bits == 0:
+        return [(0, 1 << GEOHASH_BITS)]
+
+    shift = GEOHASH_BITS - 2 * axis_bits
+    codes = sorted(
+        _interleave(x, y, axis_bits)
+        for x in range(x0, x1 + 1)
+        for y in range(y0, y1 + 1)
+    )
+
+    ranges = []
+    for code in codes:
+        start, end = code << shift, (code + 1) << shift
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Caixa (min_lat, min_lon, max_lat, max_lon) que contém o círculo"""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    delta_lon = 180.0 if cos_lat < 1e-6 else min(180.0, delta_lat / cos_lat)
+    return latitude - delta_lat, longitude - delta_lon, latitude + delta_lat, longitude + delta_lon
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distância em km entre dois pontos"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+# Latitude máxima da projeção Web Mercator
+MERCATOR_MAX_LAT = 85.05112878
+
+
+def mercator_xy(latitude, longitude):
+    """
+    Coordenadas Web Mercator normalizadas em [0, 1) (x para leste, y para sul).
+    Aceita escalares ou arrays NumPy.
+    """
+    latitude = np.clip(latitude, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)
+    x = (np.asarray(longitude, dtype=float) + 180.0) / 360.0
+    sin_lat = np.sin(np.radians(latitude))
+    y = 0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Caixa (min_lat, min_lon, max_lat, max_lon) do tile z/x/y"""
+    n = 1 << z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0
@@ -0,0 +1,295 @@
+import time
+import threading
+import logging
+import numpy as np
+from typing import Dict, List, Any, Iterable, Optional
+from src.models.data_models import db, BusinessOpportunity
+from src.services.geo import mercator_xy, tile_bounds
+from src.services.spatial_index import SpatialQueryService
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Células por lado de cada tile (payload máximo de GRID_SIZE² células)
+GRID_SIZE = 16
+
+# Zoom máximo servido
+MAX_TILE_ZOOM = 16
+
+# Chave do agregado de todas as categorias
+ALL_BUSINESS_TYPES = 'all'
+
+# Intervalo mínimo entre verificações de gravações feitas por outros processos
+TILE_CHECK_SECONDS = 30
+
+# Recalculo completo periódico (cobre mudanças de posição vindas de outros processos)
+TILE_TTL_SECONDS = 900
+
+
+def _aggregate(business_types: np.ndarray, latitudes: np.ndarray, longitudes: np.ndarray,
+               scores: np.ndarray, z: int) -> Dict[tuple, Dict[str, Any]]:
+    """
+    Agrega pontos em grades GRID_SIZE × GRID_SIZE por tile do zoom z, para
+    cada tipo de negócio e para todos. Retorna {(tipo, x, y): tile}.
+    """
+    tiles = {}
+    if len(scores) == 0:
+        return tiles
+
+    n = (1 << z) * GRID_SIZE
+    px, py = mercator_xy(latitudes, longitudes)
+    gx = np.minimum((px * n).astype(np.int64), n - 1)
+    gy = np.minimum((py * n).astype(np.int64), n - 1)
+    cell_ids = gy * n + gx
+
+    groups = [(ALL_BUSINESS_TYPES, np.ones(len(scores), dtype=bool))]
+    groups += [(business_type, business_types == business_type) for business_type in np.unique(business_types)]
+
+    for key, mask in groups:
+        cells, inverse = np.unique(cell_ids[mask], return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=scores[mask])
+        maxima = np.full(len(cells), -np.inf)
+        np.maximum.at(maxima, inverse, scores[mask])
+
+        cell_x, cell_y = cells % n, cells // n
+        tile_x, tile_y = cell_x // GRID_SIZE, cell_y // GRID_SIZE
+        for i in range(len(cells)):
+            tile = tiles.setdefault((key, int(tile_x[i]), int(tile_y[i])), {'count': 0, 'cells': []})
+            tile['count'] += int(counts[i])
+            tile['cells'].append([
+                int(cell_x[i] % GRID_SIZE), int(cell_y[i] % GRID_SIZE), int(counts[i]),
+                round(float(sums[i] / counts[i]), 1), round(float(maxima[i]), 1)
+            ])
+
+    return tiles
+
+
+class HeatmapTileCache:
+    """
+    Grades pré-agregadas de score por tile (z/x/y) e tipo de negócio. Cada
+    zoom é calculado em uma passada vetorizada sobre business_opportunities
+    e mantido em cache; gravações marcam apenas os tiles que contêm as linhas
+    alteradas, que são recalculados sob demanda pelo índice espacial.
+
+    Gravações de outros processos (workers, scheduler) são detectadas pela
+    geração da tabela (total de linhas e maior updated_at), verificada no
+    máximo a cada check_seconds; o cache inteiro expira após ttl_seconds.
+    As leituras do banco são feitas fora do lock global.
+    """
+
+    def __init__(self, check_seconds: float = TILE_CHECK_SECONDS, ttl_seconds: float = TILE_TTL_SECONDS):
+        self.check_seconds = check_seconds
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._zoom_locks = {}  # z -> lock da construção do zoom
+        self._points = None
+        self._zooms = {}  # z -> {(tipo, x, y): tile}
+        self._dirty = {}  # z -> {(x, y)}
+        self._epoch = 0  # incrementado a cada descarte do cache
+        self._generation = None  # (linhas, maior updated_at) já refletidos no cache
+        self._checked_at = 0.0
+        self._reset_at = time.monotonic()
+        self.spatial_service = SpatialQueryService()
+
+    def get_tile(self, business_type: str, z: int, x: int, y: int) -> Dict[str, Any]:
+        """Retorna a grade do tile (vazia se não houver oportunidades)"""
+        self._sync()
+        tiles = self._zoom(z)
+
+        with self._lock:
+            dirty = (x, y) in self._dirty.get(z, ())
+        if dirty:
+            self._rebuild_tile(z, x, y)
+        tile = tiles.get((business_type, x, y))
+
+        return {
+            'z': z,
+            'x': x,
+            'y': y,
+            'business_type': business_type,
+            'grid_size': GRID_SIZE,
+            'count': tile['count'] if tile else 0,
+            # Cada célula: [coluna, linha, quantidade, score médio, score máximo]
+            'cells': tile['cells'] if tile else []
+        }
+
+    def apply_writes(self, rows: Iterable[Dict[str, Any]]):
+        """Marca como sujos os tiles (de cada zoom em cache) que contêm as linhas gravadas"""
+        rows = [row for row in rows if row.get('latitude') is not None and row.get('longitude') is not None]
+        if not rows:
+            return
+
+        px, py = mercator_xy(
+            np.array([row['latitude'] for row in rows]), np.array([row['longitude'] for row in rows])
+        )
+        with self._lock:
+            self._points = None
+            for z, dirty in self._dirty.items():
+                n = 1 << z
+                tile_x = np.minimum((px * n).astype(np.int64), n - 1)
+                tile_y = np.minimum((py * n).astype(np.int64), n - 1)
+                dirty.update(zip(tile_x.tolist(), tile_y.tolist()))
+
+    def refresh(self, zooms: Optional[List[int]] = None):
+        """Recalcula do zero os zooms informados (ou os já em cache)"""
+        with self._lock:
+            zooms = zooms if zooms is not None else list(self._zooms)
+        generation = self._read_generation()
+        points = self._load_points()
+        built = {z: self._aggregate_points(points, z) for z in zooms}
+
+        with self._lock:
+            self._epoch += 1
+            self._points = points
+            self._zooms = built
+            self._dirty = {z: set() for z in built}
+            self._generation = generation
+            self._checked_at = self._reset_at = time.monotonic()
+        logger.info(f"Tiles de heatmap recalculados para zooms: {zooms}")
+
+    def _sync(self):
+        """Incorpora gravações feitas por outros processos desde a última verificação"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._reset_at > self.ttl_seconds:
+                self._reset(now)
+            if now - self._checked_at < self.check_seconds:
+                return
+            self._checked_at = now
+            seen = self._generation
+
+        generation = self._read_generation()
+        if seen is None or generation == seen:
+            with self._lock:
+                self._generation = generation
+            return
+
+        if generation[0] < seen[0] or seen[1] is None:
+            # Linhas removidas: não há como saber quais tiles mudaram
+            with self._lock:
+                self._reset(now)
+                self._generation = generation
+            return
+
+        # Linhas novas ou atualizadas (>=: relógios de workers diferentes)
+        changed = db.session.query(
+            BusinessOpportunity.latitude, BusinessOpportunity.longitude
+        ).filter(
+            BusinessOpportunity.updated_at >= seen[1],
+            BusinessOpportunity.latitude.isnot(None),
+            BusinessOpportunity.longitude.isnot(None)
+        ).all()
+        self.apply_writes({'latitude': latitude, 'longitude': longitude} for latitude, longitude in changed)
+        with self._lock:
+            self._generation = generation
+
+    def _reset(self, now: float):
+        """Descarta todos os zooms (chamado com o lock adquirido)"""
+        self._epoch += 1
+        self._points = None
+        self._zooms = {}
+        self._dirty = {}
+        self._reset_at = now
+
+    @staticmethod
+    def _read_generation():
+        """Total de linhas e maior updated_at de business_opportunities"""
+        return tuple(db.session.query(
+            db.func.count(BusinessOpportunity.id), db.func.max(BusinessOpportunity.updated_at)
+        ).one())
+
+    def _zoom(self, z: int) -> Dict[tuple, Dict[str, Any]]:
+        """Tiles do zoom z, construindo-o (uma vez por processo) se necessário"""
+        with self._lock:
+            tiles = self._zooms.get(z)
+            if tiles is not None:
+                return tiles
+            zoom_lock = self._zoom_locks.setdefault(z, threading.Lock())
+
+        # Só quem pede o mesmo zoom frio espera; os demais tiles continuam servidos
+        with zoom_lock:
+            with self._lock:
+                tiles = self._zooms.get(z)
+                if tiles is not None:
+                    return tiles
+                epoch, points = self._epoch, self._points
+
+            if points is None:
+                points = self._load_points()
+            tiles = self._aggregate_points(points, z)
+
+            with self._lock:
+                if self._epoch == epoch:
+                    self._points = points
+                    self._zooms[z] = tiles
+                    self._dirty[z] = set()
+        return tiles
+
+    def _load_points(self):
+        """Lê tipo, coordenadas e score de todas as oportunidades georreferenciadas"""
+        rows = db.session.query(
+            BusinessOpportunity.business_type,
+            BusinessOpportunity.latitude,
+            BusinessOpportunity.longitude,
+            BusinessOpportunity.opportunity_score
+        ).filter(
+            BusinessOpportunity.latitude.isnot(None),
+            BusinessOpportunity.longitude.isnot(None)
+        ).all()
+        return self._to_arrays(rows)
+
+    @staticmethod
+    def _to_arrays(rows) -> Dict[str, np.ndarray]:
+        """Converte linhas (tipo, lat, lon, score) em arrays"""
+        return {
+            'business_types': np.array([row[0] for row in rows], dtype=object),
+            'latitudes': np.array([row[1] for row in rows], dtype=float),
+            'longitudes': np.array([row[2] for row in rows], dtype=float),
+            'scores': np.array([row[3] or 0 for row in rows], dtype=float)
+        }
+
+    @staticmethod
+    def _aggregate_points(points: Dict[str, np.ndarray], z: int) -> Dict[tuple, Dict[str, Any]]:
+        return _aggregate(
+            points['business_types'], points['latitudes'], points['longitudes'], points['scores'], z
+        )
+
+    def _rebuild_tile(self, z: int, x: int, y: int):
+        """Recalcula um tile sujo (todas as categorias) a partir do banco"""
+        with self._lock:
+            epoch = self._epoch
+            dirty = self._dirty.get(z)
+            if dirty is None:
+                # Zoom descartado por um reset/refresh concorrente
+                return
+            dirty.discard((x, y))
+
+        min_lat, min_lon, max_lat, max_lon = tile_bounds(z, x, y)
+        query = db.session.query(
+            BusinessOpportunity.business_type,
+            BusinessOpportunity.latitude,
+            BusinessOpportunity.longitude,
+            BusinessOpportunity.opportunity_score
+        )
+        rows = self.spatial_service.filter_bbox(
+            query, BusinessOpportunity, min_lat, min_lon, max_lat, max_lon
+        ).all()
+        # Pontos na borda também caem nos tiles vizinhos; manter só este
+        rebuilt = {
+            key: tile for key, tile in self._aggregate_points(self._to_arrays(rows), z).items()
+            if key[1:] == (x, y)
+        }
+
+        with self._lock:
+            tiles = self._zooms.get(z)
+            if tiles is None or self._epoch != epoch:
+                return
+            for key in [key for key in tiles if key[1:] == (x, y)]:
+                del tiles[key]
+            tiles.update(rebuilt)
+
+
+# Cache compartilhado pelas rotas do processo
+heatmap_tile_cache = HeatmapTileCache()
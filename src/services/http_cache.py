@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import logging
+from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3._collections import HTTPHeaderDict
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Diretório e tamanho máximo (bytes) do cache; 0 desativa o cache
+HTTP_CACHE_DIR = os.environ.get('HTTP_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'mobel_http_cache'))
+HTTP_CACHE_MAX_BYTES = int(os.environ.get('HTTP_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+# Bytes copiados por vez entre a resposta e o disco
+CACHE_CHUNK_SIZE = 64 * 1024
+
+# Cabeçalhos que não se aplicam ao corpo já decodificado guardado em disco
+_DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection', 'keep-alive'}
+
+
+class HTTPDiskCache:
+    """
+    Respostas HTTP em disco (corpo + metadados com ETag/Last-Modified) com
+    limite de tamanho total e descarte LRU. O último uso de cada entrada é
+    o mtime do arquivo de metadados, de modo que a ordem sobrevive a reinícios.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}  # chave -> [tamanho, último uso]
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _scan(self):
+        """Reconstrói o índice a partir dos arquivos existentes"""
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            try:
+                size = os.path.getsize(self._path(key, '.body'))
+                last_used = os.path.getmtime(self._path(key, '.json'))
+            except OSError:
+                self._remove(key)
+                continue
+            self._entries[key] = [size, last_used]
+        self._evict()
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """Metadados da entrada (ou None)"""
+        key = self.key(url)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                with open(self._path(key, '.json'), encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+
+    def open_body(self, url: str):
+        """Abre o corpo da entrada e a marca como usada agora (None se foi descartada)"""
+        key = self.key(url)
+        with self._lock:
+            try:
+                body = open(self._path(key, '.body'), 'rb')
+            except OSError:
+                self._remove(key)
+                return None
+            self._touch(key)
+            return body
+
+    def refresh(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """Atualiza os validadores informados em uma resposta 304"""
+        metadata = self.lookup(url)
+        if metadata is None:
+            return
+        metadata['etag'] = etag or metadata.get('etag')
+        metadata['last_modified'] = last_modified or metadata.get('last_modified')
+        with self._lock:
+            self._write_metadata(self.key(url), metadata)
+
+    def store(self, url: str, headers: Dict[str, str], chunks) -> str:
+        """
+        Grava o corpo (lido em pedaços, sem carregá-lo em memória) e os
+        metadados. Retorna o caminho do corpo; acima do limite, o corpo fica
+        em um arquivo temporário fora do cache.
+        """
+        key = self.key(url)
+        temp_path = self._path(f'{key}.{uuid.uuid4().hex}', '.tmp')
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        if size > self.max_bytes:
+            return temp_path  # servido uma vez e descartado pelo chamador
+
+        headers = {name: value for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS}
+        headers['Content-Length'] = str(size)
+        metadata = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'headers': headers,
+            'size': size,
+            'stored_at': time.time()
+        }
+
+        with self._lock:
+            os.replace(temp_path, self._path(key, '.body'))
+            self._write_metadata(key, metadata)
+            self._entries[key] = [size, time.time()]
+            self._evict(keep=key)
+        return self._path(key, '.body')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'total_bytes': sum(size for size, _ in self._entries.values()),
+                'max_bytes': self.max_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def _write_metadata(self, key: str, metadata: Dict[str, Any]):
+        temp_path = self._path(f'{key}.{uuid.uuid4().hex}', '.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        os.replace(temp_path, self._path(key, '.json'))
+
+    def _touch(self, key: str):
+        now = time.time()
+        self._entries[key][1] = now
+        os.utime(self._path(key, '.json'), (now, now))
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        for suffix in ('.json', '.body'):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def _evict(self, keep: Optional[str] = None):
+        """Descarta as entradas menos usadas até caber no limite"""
+        total = sum(size for size, _ in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries[key][0]
+            self._remove(key)
+            logger.info(f"Cache HTTP: entrada descartada ({key[:12]})")
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    """
+    Adaptador do requests que revalida GETs em cache com If-None-Match /
+    If-Modified-Since. Em 304 o corpo é servido do disco; em 200 com ETag ou
+    Last-Modified o corpo é gravado em disco e servido a partir do arquivo.
+    """
+
+    def __init__(self, cache: HTTPDiskCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET' or 'Range' in request.headers:
+            return super().send(request, **kwargs)
+
+        url = request.url
+        cached = self.cache.lookup(url)
+        if cached and not ('If-None-Match' in request.headers or 'If-Modified-Since' in request.headers):
+            if cached.get('etag'):
+                request.headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                request.headers['If-Modified-Since'] = cached['last_modified']
+
+        kwargs['stream'] = True
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and cached:
+            response.close()
+            body = self.cache.open_body(url)
+            if body is None:
+                # Entrada descartada durante a requisição: repetir sem validadores
+                request.headers.pop('If-None-Match', None)
+                request.headers.pop('If-Modified-Since', None)
+                return self.send(request, **kwargs)
+            self.cache.refresh(url, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            logger.info(f"Cache HTTP: {url} não modificado (304)")
+            return self._from_disk(request, cached['headers'], body, from_cache=True)
+
+        if not self._cacheable(response):
+            return response
+
+        try:
+            body_path = self.cache.store(
+                url, dict(response.headers),
+                response.raw.stream(CACHE_CHUNK_SIZE, decode_content=True)
+            )
+        finally:
+            response.close()
+
+        body = open(body_path, 'rb')
+        if body_path.endswith('.tmp'):
+            os.remove(body_path)  # maior que o limite: não fica em cache
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _DROPPED_HEADERS}
+        headers['Content-Length'] = str(os.fstat(body.fileno()).st_size)
+        return self._from_disk(request, headers, body, from_cache=False)
+
+    @staticmethod
+    def _cacheable(response) -> bool:
+        if response.status_code != 200:
+            return False
+        if 'no-store' in response.headers.get('Cache-Control', ''):
+            return False
+        return bool(response.headers.get('ETag') or response.headers.get('Last-Modified'))
+
+    def _from_disk(self, request, headers: Dict[str, str], body, from_cache: bool):
+        """Resposta 200 cujo corpo é lido do arquivo em disco"""
+        raw = HTTPResponse(
+            body=body,
+            headers=HTTPHeaderDict(headers),
+            status=200,
+            reason='OK',
+            preload_content=False,
+            decode_content=False,
+            request_method='GET',
+            request_url=request.url
+        )
+        response = self.build_response(request, raw)
+        response.from_cache = from_cache
+        return response
+
+
+def mount_http_cache(session, cache: Optional[HTTPDiskCache] = None):
+    """Instala o cache em disco na sessão (se o limite de tamanho for positivo)"""
+    if cache is None:
+        if HTTP_CACHE_MAX_BYTES <= 0:
+            return None
+        cache = HTTPDiskCache()
+    adapter = CachingHTTPAdapter(cache)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return cache
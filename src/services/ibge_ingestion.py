@@ -0,0 +1,230 @@
+import codecs
+import json
+import time
+import logging
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Iterator, Optional
+from sqlalchemy import insert, update
+from src.models.data_models import db, Municipality
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+IBGE_LOCALIDADES_URL = "https://servicodados.ibge.gov.br/api/v1/localidades"
+IBGE_MALHAS_URL = "https://servicodados.ibge.gov.br/api/v3/malhas"
+
+# Municípios gravados por instrução
+INGESTION_BATCH_SIZE = 500
+
+# Municípios por requisição de metadados das malhas (códigos separados por "|")
+CENTROID_BATCH_SIZE = 100
+
+# Bytes lidos por vez da resposta
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Colunas atualizadas quando o município já existe
+MUNICIPALITY_UPDATE_COLUMNS = [
+    'name', 'microregion_id', 'microregion_name', 'mesoregion_id', 'mesoregion_name',
+    'state_id', 'state_code', 'state_name', 'macroregion_id', 'macroregion_code',
+    'macroregion_name', 'updated_at'
+]
+
+_JSON_SEPARATORS = ' \t\r\n,'
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Decodifica incrementalmente um array JSON (UTF-8) recebido em pedaços,
+    produzindo um elemento por vez. Só o elemento em leitura fica em memória.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position] in _JSON_SEPARATORS:
+                position += 1
+            if position >= len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError('Resposta não é um array JSON')
+                started = True
+                position += 1
+                continue
+
+            if buffer[position] == ']':
+                return
+
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # elemento incompleto: aguardar o próximo pedaço
+            yield element
+
+    raise ValueError('Array JSON incompleto')
+
+
+def flatten_municipality(municipality: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converte um município de /localidades/municipios em uma linha de
+    municipalities. Municípios sem microrregião (criados após a divisão de
+    2017) herdam UF e grande região da região imediata.
+    """
+    microregion = municipality.get('microrregiao') or {}
+    mesoregion = microregion.get('mesorregiao') or {}
+    state = mesoregion.get('UF')
+    if not state:
+        immediate = municipality.get('regiao-imediata') or {}
+        state = (immediate.get('regiao-intermediaria') or {}).get('UF') or {}
+    macroregion = state.get('regiao') or {}
+
+    return {
+        'id': int(municipality['id']),
+        'name': municipality.get('nome'),
+        'microregion_id': microregion.get('id'),
+        'microregion_name': microregion.get('nome'),
+        'mesoregion_id': mesoregion.get('id'),
+        'mesoregion_name': mesoregion.get('nome'),
+        'state_id': state.get('id'),
+        'state_code': state.get('sigla'),
+        'state_name': state.get('nome'),
+        'macroregion_id': macroregion.get('id'),
+        'macroregion_code': macroregion.get('sigla'),
+        'macroregion_name': macroregion.get('nome')
+    }
+
+
+class IBGEMunicipalityIngestion:
+    """
+    Ingestão completa dos municípios do IBGE: a resposta é lida em streaming,
+    decodificada município a município e gravada em lotes, com memória
+    constante independentemente do tamanho do país ou da UF.
+    """
+
+    def __init__(self, session, batch_size: int = INGESTION_BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+
+    def ingest(self, state: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Baixa e grava todos os municípios (ou os de uma UF, por sigla ou
+        código). Não faz commit.
+        """
+        url = f"{IBGE_LOCALIDADES_URL}/municipios"
+        if state:
+            url = f"{IBGE_LOCALIDADES_URL}/estados/{state}/municipios"
+
+        start_time = time.time()
+        total_records = 0
+        batches = 0
+
+        with self.session.get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            municipalities = iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+
+            batch = []
+            for municipality in municipalities:
+                batch.append(flatten_municipality(municipality))
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch)
+                    total_records += len(batch)
+                    batches += 1
+                    batch = []
+            if batch:
+                self.write_batch(batch)
+                total_records += len(batch)
+                batches += 1
+
+        execution_time = time.time() - start_time
+        logger.info(f"Municípios do IBGE gravados: {total_records} em {batches} lotes ({execution_time:.1f}s)")
+
+        return {
+            'source': 'IBGE',
+            'data_type': 'demographic',
+            'collection_timestamp': datetime.utcnow().isoformat(),
+            'total_records': total_records,
+            'batches': batches,
+            'execution_time': round(execution_time, 2)
+        }
+
+    def ingest_centroids(self, state: Optional[str] = None) -> int:
+        """
+        Grava latitude/longitude dos municípios já ingeridos (ou dos de uma
+        UF) a partir do centróide dos metadados das malhas do IBGE. Não faz
+        commit. Retorna o número de municípios atualizados.
+        """
+        query = db.session.query(Municipality.id).order_by(Municipality.id)
+        if state:
+            state = str(state).upper()
+            query = query.filter(
+                Municipality.state_id == int(state) if state.isdigit() else Municipality.state_code == state
+            )
+        codes = [code for (code,) in query]
+
+        updated = 0
+        for start in range(0, len(codes), CENTROID_BATCH_SIZE):
+            batch = codes[start:start + CENTROID_BATCH_SIZE]
+            url = f"{IBGE_MALHAS_URL}/municipios/{'|'.join(str(code) for code in batch)}/metadados"
+            response = self.session.get(url, timeout=30)
+            response.raise_for_status()
+
+            rows = []
+            for metadata in response.json():
+                centroid = metadata.get('centroide') or {}
+                if centroid.get('latitude') is None or centroid.get('longitude') is None:
+                    continue
+                rows.append({
+                    'id': int(metadata['id']),
+                    'latitude': float(centroid['latitude']),
+                    'longitude': float(centroid['longitude'])
+                })
+            if rows:
+                db.session.execute(update(Municipality), rows)
+                updated += len(rows)
+
+        logger.info(f"Centróides do IBGE gravados: {updated} de {len(codes)} municípios")
+        return updated
+
+    @staticmethod
+    def write_batch(rows: List[Dict[str, Any]]):
+        """Upsert de um lote de municípios pelo código IBGE"""
+        now = datetime.utcnow()
+        rows = [dict(row, updated_at=now) for row in rows]
+
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+            # Instrução única executada em lote (executemany), compilada uma só vez
+            statement = dialect_insert(Municipality.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=['id'],
+                set_={column: statement.excluded[column] for column in MUNICIPALITY_UPDATE_COLUMNS}
+            )
+            db.session.execute(statement, rows)
+            return
+
+        # Fallback para bancos sem ON CONFLICT
+        existing = {
+            municipality_id for (municipality_id,) in db.session.query(Municipality.id).filter(
+                Municipality.id.in_([row['id'] for row in rows])
+            )
+        }
+        updates = [row for row in rows if row['id'] in existing]
+        inserts = [row for row in rows if row['id'] not in existing]
+        if updates:
+            db.session.execute(update(Municipality), updates)
+        if inserts:
+            db.session.execute(insert(Municipality), inserts)
@@ -0,0 +1,12 @@
+import unicodedata
+from typing import Any
+
+
+def fold_name(value: Any) -> str:
+    """
+    Forma canônica de nomes de localidades para comparação: sem acentos,
+    minúscula e com espaços simples ("SAO  PAULO" e "São Paulo" -> "sao paulo")
+    """
+    text = unicodedata.normalize('NFKD', str(value or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
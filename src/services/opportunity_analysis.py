@@ -4,23 +4,96 @@ from typing import Dict, List, Tuple, Any, Optional
 from datetime import datetime
 import logging
 from src.models.data_models import db, CollectedData, BusinessOpportunity, DataSource
+from src.services.scoring_engine import ScoringEngine
+from src.services.feature_cache import region_feature_cache
+from src.services.feature_loader import RegionFeatureLoader
+from flask import has_app_context
 import json
 import math
+import os
+import atexit
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Chave do digest de regiões (estável entre processos, ao contrário de hash())
+REGION_HASH_KEY = b'mapa-oportunidades-region'
+
+def stable_region_hash(region: str, salt: str = '') -> int:
+    """
+    Digest de 64 bits da região, idêntico em todos os workers e reinícios.
+    O salt separa os fluxos de variação de cada loader.
+    """
+    digest = hashlib.blake2b(
+        f"{salt}:{region}".encode('utf-8'), key=REGION_HASH_KEY, digest_size=8
+    ).digest()
+    return int.from_bytes(digest, 'big')
+
+# Categorias de negócio analisadas (valores de BusinessOpportunity.business_type)
+BUSINESS_CATEGORIES = [
+    'Pet Shop', 'Barbearia', 'Farmácia', 'Padaria', 'Restaurante',
+    'Loja de Roupas', 'Supermercado', 'Academia', 'Salão de Beleza',
+    'Loja de Eletrônicos', 'Posto de Gasolina', 'Banco'
+]
+
+# Regiões por tarefa enviada ao pool de processos
+BATCH_CHUNK_SIZE = 64
+
+# Abaixo disso o lote é pontuado no próprio processo: o scoring vetorizado
+# custa menos que serializar entradas e resultados entre processos
+PARALLEL_MIN_REGIONS = 1024
+
+# Instância do serviço reutilizada dentro de cada processo do pool
+_worker_service = None
+
+# Pool compartilhado pelo processo, criado no primeiro lote grande
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def _get_analysis_pool() -> ProcessPoolExecutor:
+    """
+    Pool de processos de longa duração, um por processo da aplicação. Usa
+    forkserver (ou spawn) em vez de fork: o worker web tem threads e
+    conexões de banco abertas, que não devem ser copiadas para os filhos.
+    """
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _analysis_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(method)
+            )
+            atexit.register(_analysis_pool.shutdown, wait=False)
+        return _analysis_pool
+
+def _discard_analysis_pool():
+    """Descarta um pool quebrado (processo filho encerrado); o próximo lote cria outro"""
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is not None:
+            _analysis_pool.shutdown(wait=False)
+            _analysis_pool = None
+
+def _analyze_regions_chunk(task) -> List[Dict[str, Any]]:
+    """Analisa um bloco (regiões, dados de entrada) dentro de um processo do pool"""
+    global _worker_service
+    if _worker_service is None:
+        _worker_service = OpportunityAnalysisService()
+    regions, region_inputs = task
+    return _worker_service.analyze_regions_opportunities(regions, region_inputs)
+
 class OpportunityAnalysisService:
     """Serviço responsável pela análise de oportunidades de negócio"""
     
     def __init__(self):
         # Configurações padrão para análise
-        self.business_categories = [
-            'Pet Shop', 'Barbearia', 'Farmácia', 'Padaria', 'Restaurante',
-            'Loja de Roupas', 'Supermercado', 'Academia', 'Salão de Beleza',
-            'Loja de Eletrônicos', 'Posto de Gasolina', 'Banco'
-        ]
+        self.business_categories = list(BUSINESS_CATEGORIES)
         
         # Parâmetros de análise
         self.population_thresholds = {
@@ -46,386 +119,210 @@ class OpportunityAnalysisService:
             'economic_indicators': 0.15, # Indicadores econômicos
             'sentiment_score': 0.1    # Score de sentimento
         }
+        
+        # Motor vetorizado usado por analyze_region_opportunities
+        self.scoring_engine = ScoringEngine(
+            self.business_categories, self.population_thresholds, self.score_weights
+        )
+        
+        # Cache de features por região (compartilhado no processo)
+        self.feature_cache = region_feature_cache
+        
+        # Leitura dos snapshots coletados no banco
+        self.feature_loader = RegionFeatureLoader()
     
-    def calculate_business_density(self, business_data: List[Dict], population: int, 
-                                 business_type: str) -> Dict[str, float]:
+    def analyze_region_opportunities(self, region: str) -> Dict[str, Any]:
         """
-        Calcula a densidade de negócios por tipo em relação à população
+        Analisa oportunidades para uma região específica
         """
-        try:
-            # Filtrar dados do tipo de negócio específico
-            business_count = 0
-            for business in business_data:
-                if business.get('categoria', '').lower() == business_type.lower():
-                    business_count = business.get('total_estabelecimentos', 0)
-                    break
-            
-            # Calcular densidade
-            if population > 0:
-                density_per_1000 = (business_count / population) * 1000
-                density_per_10000 = (business_count / population) * 10000
-            else:
-                density_per_1000 = 0
-                density_per_10000 = 0
-            
-            # Calcular lacuna baseada no threshold ideal
-            ideal_count = population / self.population_thresholds.get(business_type, 5000)
-            gap_percentage = max(0, (ideal_count - business_count) / ideal_count * 100) if ideal_count > 0 else 0
-            
-            return {
-                'current_count': business_count,
-                'ideal_count': round(ideal_count, 1),
-                'density_per_1000': round(density_per_1000, 2),
-                'density_per_10000': round(density_per_10000, 2),
-                'gap_percentage': round(gap_percentage, 1),
-                'has_opportunity': gap_percentage > 20  # Oportunidade se gap > 20%
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao calcular densidade de negócios: {str(e)}")
-            return {
-                'current_count': 0,
-                'ideal_count': 0,
-                'density_per_1000': 0,
-                'density_per_10000': 0,
-                'gap_percentage': 0,
-                'has_opportunity': False
-            }
+        return self.analyze_regions_opportunities([region])[0]
     
-    def analyze_demand_potential(self, demographic_data: Dict, rental_data: Dict, 
-                               business_type: str) -> Dict[str, Any]:
+    def analyze_regions_opportunities(self, regions: List[str],
+                                      all_inputs: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
-        Analisa o potencial de demanda baseado em dados demográficos e imobiliários
+        Analisa oportunidades para várias regiões de uma vez.
+        Todas as categorias de todas as regiões são pontuadas em uma única
+        passada do ScoringEngine; os dicionários por categoria só são montados
+        na saída. all_inputs permite passar dados de entrada já carregados.
         """
-        try:
-            # Fatores demográficos
-            population = demographic_data.get('population', 0)
-            density = demographic_data.get('density', 0)
-            
-            # Fatores econômicos do mercado imobiliário
-            avg_rent = rental_data.get('aluguel_medio_comercial', 0)
-            vacancy_rate = rental_data.get('taxa_vacancia', 0)
-            
-            # Calcular score de demanda baseado no tipo de negócio
-            demand_factors = {
-                'Pet Shop': {
-                    'population_factor': min(population / 10000, 1.0),
-                    'density_factor': min(density / 15000, 1.0),
-                    'rent_factor': max(0, 1 - (avg_rent / 20000))  # Menor aluguel = melhor
-                },
-                'Barbearia': {
-                    'population_factor': min(population / 5000, 1.0),
-                    'density_factor': min(density / 10000, 1.0),
-                    'rent_factor': max(0, 1 - (avg_rent / 15000))
-                },
-                'Restaurante': {
-                    'population_factor': min(population / 8000, 1.0),
-                    'density_factor': min(density / 12000, 1.0),
-                    'rent_factor': max(0, 1 - (avg_rent / 25000))
+        results = [None] * len(regions)
+        region_inputs = []
+        scored_positions = []
+        
+        # Buscar dados coletados para todas as regiões de uma vez
+        if all_inputs is None:
+            all_inputs = self._get_regions_inputs(regions)
+        
+        for position, region in enumerate(regions):
+            try:
+                logger.info(f"Iniciando análise de oportunidades para região: {region}")
+                
+                inputs = all_inputs[position]
+                
+                if not any(inputs.values()):
+                    logger.warning(f"Nenhum dado encontrado para região: {region}")
+                    results[position] = {
+                        'region': region,
+                        'status': 'no_data',
+                        'message': 'Dados insuficientes para análise'
+                    }
+                    continue
+                
+                region_inputs.append(inputs)
+                scored_positions.append(position)
+                
+            except Exception as e:
+                logger.error(f"Erro na análise de oportunidades para {region}: {str(e)}")
+                results[position] = {
+                    'region': region,
+                    'status': 'error',
+                    'error': str(e)
                 }
-            }
-            
-            # Usar fatores padrão se o tipo não estiver definido
-            factors = demand_factors.get(business_type, {
-                'population_factor': min(population / 8000, 1.0),
-                'density_factor': min(density / 12000, 1.0),
-                'rent_factor': max(0, 1 - (avg_rent / 18000))
-            })
-            
-            # Calcular score de demanda (0-100)
-            demand_score = (
-                factors['population_factor'] * 40 +
-                factors['density_factor'] * 35 +
-                factors['rent_factor'] * 25
-            )
-            
-            # Ajustar baseado na taxa de vacância
-            vacancy_adjustment = max(0, (20 - vacancy_rate) / 20)  # Menor vacância = melhor
-            demand_score *= vacancy_adjustment
-            
-            return {
-                'demand_score': round(demand_score, 1),
-                'population_factor': round(factors['population_factor'], 2),
-                'density_factor': round(factors['density_factor'], 2),
-                'rent_factor': round(factors['rent_factor'], 2),
-                'vacancy_adjustment': round(vacancy_adjustment, 2),
-                'estimated_monthly_customers': round(population * factors['population_factor'] * 0.1)
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao analisar potencial de demanda: {str(e)}")
-            return {
-                'demand_score': 0,
-                'population_factor': 0,
-                'density_factor': 0,
-                'rent_factor': 0,
-                'vacancy_adjustment': 0,
-                'estimated_monthly_customers': 0
-            }
-    
-    def analyze_competition_level(self, business_data: List[Dict], 
-                                business_type: str) -> Dict[str, Any]:
-        """
-        Analisa o nível de concorrência para um tipo de negócio
-        """
+        
+        if not region_inputs:
+            return results
+        
         try:
-            # Encontrar dados do tipo de negócio
-            target_business = None
-            for business in business_data:
-                if business.get('categoria', '').lower() == business_type.lower():
-                    target_business = business
-                    break
-            
-            if not target_business:
-                return {
-                    'competition_level': 'unknown',
-                    'competition_score': 50,
-                    'market_saturation': 0,
-                    'growth_trend': 0
-                }
-            
-            # Analisar métricas de concorrência
-            establishment_count = target_business.get('total_estabelecimentos', 0)
-            density_per_100k = target_business.get('densidade_por_100k_hab', 0)
-            growth_rate = target_business.get('crescimento_ultimo_ano', 0)
-            
-            # Calcular saturação do mercado
-            # Baseado na densidade em relação à média nacional (estimativa)
-            avg_density_national = 50  # Estimativa de densidade média nacional
-            saturation_ratio = density_per_100k / avg_density_national if avg_density_national > 0 else 0
-            
-            # Determinar nível de concorrência
-            if saturation_ratio < 0.5:
-                competition_level = 'low'
-                competition_score = 80
-            elif saturation_ratio < 1.0:
-                competition_level = 'medium'
-                competition_score = 60
-            elif saturation_ratio < 1.5:
-                competition_level = 'high'
-                competition_score = 40
-            else:
-                competition_level = 'very_high'
-                competition_score = 20
-            
-            # Ajustar score baseado no crescimento
-            if growth_rate > 10:
-                competition_score -= 10  # Mercado em crescimento = mais concorrência
-            elif growth_rate < 0:
-                competition_score += 10  # Mercado em declínio = menos concorrência
-            
-            competition_score = max(0, min(100, competition_score))
-            
-            return {
-                'competition_level': competition_level,
-                'competition_score': round(competition_score, 1),
-                'market_saturation': round(saturation_ratio, 2),
-                'growth_trend': growth_rate,
-                'establishment_count': establishment_count,
-                'density_per_100k': density_per_100k
-            }
-            
+            features = self.scoring_engine.build_features(region_inputs)
+            scores = self.scoring_engine.score(features)
         except Exception as e:
-            logger.error(f"Erro ao analisar concorrência: {str(e)}")
-            return {
-                'competition_level': 'unknown',
-                'competition_score': 50,
-                'market_saturation': 0,
-                'growth_trend': 0,
-                'establishment_count': 0,
-                'density_per_100k': 0
-            }
+            logger.error(f"Erro no cálculo vetorizado de oportunidades: {str(e)}")
+            for position in scored_positions:
+                results[position] = {
+                    'region': regions[position],
+                    'status': 'error',
+                    'error': str(e)
+                }
+            return results
+        
+        for r, position in enumerate(scored_positions):
+            region = regions[position]
+            try:
+                results[position] = self._build_region_result(
+                    region, region_inputs[r], self.scoring_engine.region_opportunities(features, scores, r)
+                )
+                logger.info(f"Análise concluída para {region}. "
+                            f"{results[position]['total_opportunities']} oportunidades identificadas.")
+            except Exception as e:
+                logger.error(f"Erro na análise de oportunidades para {region}: {str(e)}")
+                results[position] = {
+                    'region': region,
+                    'status': 'error',
+                    'error': str(e)
+                }
+        
+        return results
     
-    def analyze_sentiment_impact(self, social_data: List[Dict], 
-                               business_type: str) -> Dict[str, Any]:
+    def analyze_regions_parallel(self, regions: List[str], max_workers: Optional[int] = None,
+                                 chunk_size: int = BATCH_CHUNK_SIZE) -> List[Dict[str, Any]]:
         """
-        Analisa o impacto do sentimento das redes sociais
+        Analisa muitas regiões distribuindo blocos entre o pool de processos
+        compartilhado, com até max_workers blocos simultâneos (limitado ao
+        número de núcleos). Lotes pequenos são pontuados no próprio processo.
+        Os resultados mantêm a ordem de entrada.
         """
+        cpu_count = os.cpu_count() or 1
+        max_workers = min(max_workers or cpu_count, cpu_count)
+        
+        # Os dados de entrada são carregados aqui (uma consulta, com contexto da
+        # aplicação) e enviados aos processos junto com as regiões
+        all_inputs = self._get_regions_inputs(regions)
+        if len(regions) < PARALLEL_MIN_REGIONS or max_workers <= 1:
+            return self.analyze_regions_opportunities(regions, all_inputs)
+        
+        # Um bloco por processo usado, com pelo menos chunk_size regiões
+        chunk_size = max(chunk_size, math.ceil(len(regions) / max_workers))
+        tasks = [
+            (regions[start:start + chunk_size], all_inputs[start:start + chunk_size])
+            for start in range(0, len(regions), chunk_size)
+        ]
+        logger.info(f"Analisando {len(regions)} regiões em {len(tasks)} blocos no pool de processos")
+        
         try:
-            # Encontrar dados de sentimento para o tipo de negócio
-            sentiment_data = None
-            for data in social_data:
-                if data.get('categoria', '').lower() == business_type.lower():
-                    sentiment_data = data
-                    break
-            
-            if not sentiment_data:
-                return {
-                    'sentiment_score': 50,
-                    'sentiment_impact': 'neutral',
-                    'main_complaints': [],
-                    'opportunity_indicators': []
-                }
-            
-            # Extrair métricas de sentimento
-            sentiment_score = sentiment_data.get('score_sentimento', 0)
-            complaints = sentiment_data.get('principais_reclamacoes', [])
-            total_mentions = sentiment_data.get('total_mencoes', 0)
-            
-            # Determinar impacto do sentimento
-            if sentiment_score > 20:
-                sentiment_impact = 'positive'
-            elif sentiment_score > -20:
-                sentiment_impact = 'neutral'
-            else:
-                sentiment_impact = 'negative'
-            
-            # Identificar indicadores de oportunidade baseados nas reclamações
-            opportunity_indicators = []
-            if 'Atendimento demorado' in complaints:
-                opportunity_indicators.append('Oportunidade para serviço mais rápido')
-            if 'Preços altos' in complaints:
-                opportunity_indicators.append('Oportunidade para preços competitivos')
-            if 'Falta de variedade' in complaints:
-                opportunity_indicators.append('Oportunidade para maior variedade')
-            
-            # Converter score de sentimento para escala 0-100
-            normalized_score = max(0, min(100, (sentiment_score + 100) / 2))
-            
-            return {
-                'sentiment_score': round(normalized_score, 1),
-                'sentiment_impact': sentiment_impact,
-                'main_complaints': complaints,
-                'opportunity_indicators': opportunity_indicators,
-                'total_mentions': total_mentions,
-                'raw_sentiment_score': sentiment_score
-            }
-            
-        except Exception as e:
-            logger.error(f"Erro ao analisar sentimento: {str(e)}")
-            return {
-                'sentiment_score': 50,
-                'sentiment_impact': 'neutral',
-                'main_complaints': [],
-                'opportunity_indicators': [],
-                'total_mentions': 0,
-                'raw_sentiment_score': 0
-            }
+            results = []
+            for chunk_results in _get_analysis_pool().map(_analyze_regions_chunk, tasks):
+                results.extend(chunk_results)
+            return results
+        except BrokenProcessPool as e:
+            logger.error(f"Pool de processos indisponível, analisando no próprio processo: {str(e)}")
+            _discard_analysis_pool()
+            return self.analyze_regions_opportunities(regions, all_inputs)
     
-    def calculate_opportunity_score(self, density_analysis: Dict, demand_analysis: Dict,
-                                  competition_analysis: Dict, sentiment_analysis: Dict) -> float:
+    def _get_regions_inputs(self, regions: List[str]) -> List[Dict[str, Any]]:
         """
-        Calcula o score final de oportunidade baseado em todos os fatores
+        Reúne os dados de entrada de cada região, servindo do cache quando
+        possível e carregando as faltantes de uma só vez
         """
-        try:
-            # Extrair scores individuais
-            density_score = density_analysis.get('gap_percentage', 0)
-            demand_score = demand_analysis.get('demand_score', 0)
-            competition_score = competition_analysis.get('competition_score', 50)
-            sentiment_score = sentiment_analysis.get('sentiment_score', 50)
-            
-            # Normalizar density_score (gap_percentage) para escala 0-100
-            normalized_density_score = min(100, density_score)
-            
-            # Calcular score ponderado
-            final_score = (
-                normalized_density_score * self.score_weights['density_gap'] +
-                demand_score * self.score_weights['demand_potential'] +
-                competition_score * self.score_weights['competition_level'] +
-                demand_score * self.score_weights['economic_indicators'] +  # Usar demand como proxy
-                sentiment_score * self.score_weights['sentiment_score']
-            )
-            
-            return round(final_score, 1)
-            
-        except Exception as e:
-            logger.error(f"Erro ao calcular score de oportunidade: {str(e)}")
-            return 0.0
+        inputs = {}
+        missing = []
+        for region in dict.fromkeys(regions):
+            cached = self.feature_cache.get(region)
+            if cached is None:
+                missing.append(region)
+            else:
+                inputs[region] = cached
+        
+        if missing:
+            for region, loaded in self._load_regions_inputs(missing).items():
+                self.feature_cache.set(region, loaded)
+                inputs[region] = loaded
+        
+        return [inputs[region] for region in regions]
     
-    def analyze_region_opportunities(self, region: str) -> Dict[str, Any]:
+    def _load_regions_inputs(self, regions: List[str]) -> Dict[str, Dict[str, Any]]:
         """
-        Analisa oportunidades para uma região específica
+        Carrega os dados de entrada das regiões a partir dos snapshots no banco
+        (uma consulta para todas); tipos sem dados coletados são simulados
         """
-        try:
-            logger.info(f"Iniciando análise de oportunidades para região: {region}")
-            
-            # Buscar dados coletados para a região
-            demographic_data = self._get_demographic_data(region)
-            business_data = self._get_business_data(region)
-            social_data = self._get_social_data(region)
-            rental_data = self._get_rental_data(region)
-            
-            if not any([demographic_data, business_data, social_data, rental_data]):
-                logger.warning(f"Nenhum dado encontrado para região: {region}")
-                return {
-                    'region': region,
-                    'status': 'no_data',
-                    'message': 'Dados insuficientes para análise'
-                }
-            
-            # Analisar oportunidades para cada categoria de negócio
-            opportunities = []
-            
-            for business_type in self.business_categories:
-                logger.info(f"Analisando oportunidades para: {business_type}")
-                
-                # Executar análises individuais
-                density_analysis = self.calculate_business_density(
-                    business_data, demographic_data.get('population', 50000), business_type
-                )
-                
-                demand_analysis = self.analyze_demand_potential(
-                    demographic_data, rental_data, business_type
-                )
-                
-                competition_analysis = self.analyze_competition_level(
-                    business_data, business_type
-                )
-                
-                sentiment_analysis = self.analyze_sentiment_impact(
-                    social_data, business_type
-                )
-                
-                # Calcular score final
-                opportunity_score = self.calculate_opportunity_score(
-                    density_analysis, demand_analysis, competition_analysis, sentiment_analysis
-                )
-                
-                # Compilar resultado
-                opportunity = {
-                    'business_type': business_type,
-                    'opportunity_score': opportunity_score,
-                    'density_analysis': density_analysis,
-                    'demand_analysis': demand_analysis,
-                    'competition_analysis': competition_analysis,
-                    'sentiment_analysis': sentiment_analysis,
-                    'recommendation': self._generate_recommendation(
-                        opportunity_score, density_analysis, demand_analysis, 
-                        competition_analysis, sentiment_analysis
-                    )
-                }
-                
-                opportunities.append(opportunity)
-            
-            # Ordenar por score de oportunidade
-            opportunities.sort(key=lambda x: x['opportunity_score'], reverse=True)
-            
-            # Compilar resultado final
-            result = {
-                'region': region,
-                'status': 'success',
-                'analysis_timestamp': datetime.utcnow().isoformat(),
-                'total_opportunities': len(opportunities),
-                'top_opportunities': opportunities[:5],  # Top 5
-                'all_opportunities': opportunities,
-                'region_summary': {
-                    'population': demographic_data.get('population', 0),
-                    'density': demographic_data.get('density', 0),
-                    'avg_commercial_rent': rental_data.get('aluguel_medio_comercial', 0),
-                    'vacancy_rate': rental_data.get('taxa_vacancia', 0)
-                }
+        stored = {}
+        if has_app_context():
+            try:
+                stored = self.feature_loader.load(regions)
+            except Exception as e:
+                logger.error(f"Erro ao carregar dados coletados: {str(e)}")
+                db.session.rollback()
+        
+        loaded = {}
+        for region in regions:
+            region_stored = stored.get(region, {})
+            loaded[region] = {
+                'demographic': region_stored.get('demographic') or self._get_demographic_data(region),
+                'business': region_stored.get('business') or self._get_business_data(region),
+                'social': region_stored.get('social') or self._get_social_data(region),
+                'rental': region_stored.get('rental') or self._get_rental_data(region)
             }
-            
-            logger.info(f"Análise concluída para {region}. {len(opportunities)} oportunidades identificadas.")
-            return result
-            
-        except Exception as e:
-            logger.error(f"Erro na análise de oportunidades para {region}: {str(e)}")
-            return {
-                'region': region,
-                'status': 'error',
-                'error': str(e)
+        return loaded
+    
+    def _build_region_result(self, region: str, inputs: Dict[str, Any],
+                             opportunities: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Compila o resultado final de uma região a partir das oportunidades pontuadas"""
+        demographic_data = inputs['demographic'] or {}
+        rental_data = inputs['rental'] or {}
+        
+        for opportunity in opportunities:
+            opportunity['recommendation'] = self._generate_recommendation(
+                opportunity['opportunity_score'], opportunity['density_analysis'],
+                opportunity['demand_analysis'], opportunity['competition_analysis'],
+                opportunity['sentiment_analysis']
+            )
+        
+        # Ordenar por score de oportunidade
+        opportunities.sort(key=lambda x: x['opportunity_score'], reverse=True)
+        
+        return {
+            'region': region,
+            'status': 'success',
+            'analysis_timestamp': datetime.utcnow().isoformat(),
+            'total_opportunities': len(opportunities),
+            'top_opportunities': opportunities[:5],  # Top 5
+            'all_opportunities': opportunities,
+            'region_summary': {
+                'population': demographic_data.get('population', 0),
+                'density': demographic_data.get('density', 0),
+                'avg_commercial_rent': rental_data.get('aluguel_medio_comercial', 0),
+                'vacancy_rate': rental_data.get('taxa_vacancia', 0)
             }
+        }
     
     def _get_demographic_data(self, region: str) -> Dict[str, Any]:
         """Busca dados demográficos para a região"""
@@ -454,14 +351,15 @@ class OpportunityAnalysisService:
         try:
             # Simular dados de empresas
             # Em um sistema real, isso viria do banco de dados
+            region_hash = stable_region_hash(region, 'business')
             business_data = []
             for i, category in enumerate(self.business_categories):
-                count = (i * 15) + 10 + (hash(region) % 20)  # Variação por região
+                count = (i * 15) + 10 + (region_hash % 20)  # Variação por região
                 business_data.append({
                     'categoria': category,
                     'total_estabelecimentos': count,
                     'densidade_por_100k_hab': round((count / 50000) * 100000, 2),
-                    'crescimento_ultimo_ano': round((i * 2.5) - 5 + (hash(region) % 10), 1)
+                    'crescimento_ultimo_ano': round((i * 2.5) - 5 + (region_hash % 10), 1)
                 })
             return business_data
         except Exception as e:
@@ -471,14 +369,15 @@ class OpportunityAnalysisService:
     def _get_social_data(self, region: str) -> List[Dict[str, Any]]:
         """Busca dados de redes sociais para a região"""
         try:
-            import random
-            random.seed(hash(region))  # Seed baseado na região para consistência
+            # Gerador próprio com seed estável da região (sem estado global)
+            rng = np.random.default_rng(stable_region_hash(region, 'social'))
+            complaints = ['Atendimento demorado', 'Preços altos', 'Falta de variedade']
             
             social_data = []
             for category in self.business_categories[:9]:  # Primeiras 9 categorias
-                positive = random.randint(50, 500)
-                negative = random.randint(10, 100)
-                neutral = random.randint(20, 200)
+                positive = int(rng.integers(50, 501))
+                negative = int(rng.integers(10, 101))
+                neutral = int(rng.integers(20, 201))
                 total = positive + negative + neutral
                 score = round((positive - negative) / total * 100, 2)
                 
@@ -486,9 +385,9 @@ class OpportunityAnalysisService:
                     'categoria': category,
                     'total_mencoes': total,
                     'score_sentimento': score,
-                    'principais_reclamacoes': random.sample([
-                        'Atendimento demorado', 'Preços altos', 'Falta de variedade'
-                    ], random.randint(1, 3))
+                    'principais_reclamacoes': [
+                        complaints[j] for j in rng.permutation(len(complaints))[:int(rng.integers(1, 4))]
+                    ]
                 })
             return social_data
         except Exception as e:
@@ -498,8 +397,7 @@ class OpportunityAnalysisService:
     def _get_rental_data(self, region: str) -> Dict[str, Any]:
         """Busca dados imobiliários para a região"""
         try:
-            import random
-            random.seed(hash(region))
+            rng = np.random.default_rng(stable_region_hash(region, 'rental'))
             
             base_rent = 5000
             if 'São Paulo' in region:
@@ -508,8 +406,8 @@ class OpportunityAnalysisService:
                 base_rent = 8000
             
             return {
-                'aluguel_medio_comercial': base_rent + random.randint(-2000, 5000),
-                'taxa_vacancia': round(random.uniform(5.0, 15.0), 1),
+                'aluguel_medio_comercial': base_rent + int(rng.integers(-2000, 5001)),
+                'taxa_vacancia': round(float(rng.uniform(5.0, 15.0)), 1),
                 'regiao': region
             }
         except Exception as e:
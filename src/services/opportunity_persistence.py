@@ -0,0 +1,209 @@
+from datetime import datetime
+from typing import Dict, List, Any
+import logging
+from sqlalchemy import event, insert, update, tuple_
+from src.models.data_models import db, BusinessOpportunity, CollectedRecord, native_json
+from src.models.compression import compress_json, FORMAT_ZLIB_ANALYSIS_V1
+from src.services.top_opportunities import top_opportunities_index
+from src.services.geo import geohash
+from src.services.gazetteer import gazetteer
+from src.services.normalization import fold_name
+from src.services.heatmap_tiles import heatmap_tile_cache
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Linhas por instrução INSERT ... ON CONFLICT (limite de parâmetros do PostgreSQL)
+UPSERT_CHUNK_SIZE = 1000
+
+# Colunas atualizadas quando a oportunidade já existe
+UPSERT_UPDATE_COLUMNS = [
+    'opportunity_score', 'competition_level', 'estimated_demand', 'latitude', 'longitude',
+    'geohash', 'analysis_data', 'analysis_data_compressed', 'analysis_data_json', 'updated_at'
+]
+
+# Colunas de posição mantidas quando a nova análise não tem coordenadas
+POSITION_COLUMNS = ('latitude', 'longitude', 'geohash')
+
+# Regiões sem coordenadas listadas no log
+UNRESOLVED_LOG_LIMIT = 10
+
+def region_coordinates(regions: List[str]) -> Dict[str, tuple]:
+    """
+    Coordenadas (latitude, longitude) das regiões: o centróide do município
+    com o mesmo nome (gazetteer) ou, para bairros, o do município que os
+    registros coletados informam como cidade do bairro (quando é um só).
+    Regiões sem município conhecido ficam de fora e são registradas no log.
+    """
+    coordinates = {}
+    unresolved = {}
+    for region in dict.fromkeys(regions):
+        place = gazetteer.resolve(region)
+        if place and place['latitude'] is not None:
+            coordinates[region] = (place['latitude'], place['longitude'])
+        else:
+            unresolved[fold_name(region)] = region
+    
+    if unresolved:
+        parents = {}
+        for region_key, city in db.session.query(
+            CollectedRecord.region_key, CollectedRecord.city
+        ).filter(
+            CollectedRecord.region_key.in_(list(unresolved)),
+            CollectedRecord.city.isnot(None)
+        ).distinct():
+            place = gazetteer.resolve(city)
+            if place and place['latitude'] is not None:
+                parents.setdefault(region_key, set()).add((place['latitude'], place['longitude']))
+        for region_key, places in parents.items():
+            if len(places) == 1:
+                coordinates[unresolved.pop(region_key)] = places.pop()
+    
+    if unresolved:
+        names = list(unresolved.values())
+        logger.warning(
+            f"{len(names)} regiões sem coordenadas (município não encontrado no gazetteer; "
+            f"execute a ingestão completa do IBGE): {', '.join(names[:UNRESOLVED_LOG_LIMIT])}"
+        )
+    return coordinates
+
+def build_opportunity_rows(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Converte resultados de analyze_region_opportunities em linhas de
+    business_opportunities, uma por (region, business_type)
+    """
+    now = datetime.utcnow()
+    rows = {}
+    use_jsonb = native_json()
+    coordinates = region_coordinates([
+        result['region'] for result in results if result.get('status') == 'success'
+    ])
+    
+    for result in results:
+        if result.get('status') != 'success':
+            continue
+        
+        region = result['region']
+        latitude, longitude = coordinates.get(region, (None, None))
+        for opportunity in result.get('all_opportunities', []):
+            rows[(region, opportunity['business_type'])] = {
+                'region': region,
+                'region_key': fold_name(region),
+                'business_type': opportunity['business_type'],
+                'opportunity_score': opportunity['opportunity_score'],
+                'population_density': result['region_summary']['density'],
+                'competition_level': opportunity['competition_analysis']['competition_level'],
+                'estimated_demand': opportunity['demand_analysis']['estimated_monthly_customers'],
+                'latitude': latitude,  # centróide do município (gazetteer); None mantém a posição anterior
+                'longitude': longitude,
+                'geohash': geohash(latitude, longitude),
+                'analysis_data': None,  # formato antigo (texto) é limpo no update
+                # JSONB no PostgreSQL; JSON comprimido nos demais bancos
+                'analysis_data_compressed': None if use_jsonb else compress_json(opportunity, FORMAT_ZLIB_ANALYSIS_V1),
+                'analysis_data_json': opportunity if use_jsonb else None,
+                'created_at': now,
+                'updated_at': now
+            }
+    
+    return list(rows.values())
+
+def bulk_upsert_opportunities(results: List[Dict[str, Any]]) -> int:
+    """
+    Grava as oportunidades de uma ou mais regiões com INSERT ... ON CONFLICT
+    (PostgreSQL/SQLite) ou, em outros bancos, com uma leitura das chaves
+    existentes seguida de insert/update em lote. Não faz commit; as listas
+    de top-K e os tiles de heatmap afetados são atualizados quando a
+    transação é confirmada.
+    """
+    rows = build_opportunity_rows(results)
+    if not rows:
+        return 0
+    
+    dialect = db.session.get_bind().dialect.name
+    moved = []
+    
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+        moved.extend(_previous_positions(chunk))
+        if dialect in ('postgresql', 'sqlite'):
+            _upsert_on_conflict(chunk, dialect)
+        else:
+            _upsert_portable(chunk)
+    
+    event.listen(db.session(), 'after_commit', lambda session: _apply_writes(rows, moved), once=True)
+    
+    logger.info(f"Upsert de {len(rows)} oportunidades ({dialect})")
+    return len(rows)
+
+def _apply_writes(rows: List[Dict[str, Any]], moved: List[Dict[str, Any]]):
+    """Propaga as linhas gravadas para os caches derivados de business_opportunities"""
+    top_opportunities_index.apply_writes(rows)
+    # Tiles das posições novas e das antigas de oportunidades que mudaram de coordenadas
+    heatmap_tile_cache.apply_writes(rows + moved)
+
+def _previous_positions(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Coordenadas atuais das linhas que serão gravadas em outra posição"""
+    positions = {(row['region'], row['business_type']): row for row in rows if row['latitude'] is not None}
+    previous = db.session.query(
+        BusinessOpportunity.region, BusinessOpportunity.business_type,
+        BusinessOpportunity.latitude, BusinessOpportunity.longitude
+    ).filter(
+        tuple_(BusinessOpportunity.region, BusinessOpportunity.business_type).in_(list(positions)),
+        BusinessOpportunity.latitude.isnot(None)
+    )
+    return [
+        {'latitude': latitude, 'longitude': longitude}
+        for region, business_type, latitude, longitude in previous
+        if (positions[(region, business_type)]['latitude'], positions[(region, business_type)]['longitude'])
+        != (latitude, longitude)
+    ]
+
+def _upsert_on_conflict(rows: List[Dict[str, Any]], dialect: str):
+    """Upsert nativo em uma única instrução"""
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    
+    statement = dialect_insert(BusinessOpportunity.__table__).values(rows)
+    set_ = {column: statement.excluded[column] for column in UPSERT_UPDATE_COLUMNS}
+    for column in POSITION_COLUMNS:
+        # Análise sem coordenadas não apaga a posição já gravada
+        set_[column] = db.func.coalesce(statement.excluded[column], BusinessOpportunity.__table__.c[column])
+    statement = statement.on_conflict_do_update(
+        index_elements=['region', 'business_type'],
+        set_=set_
+    )
+    db.session.execute(statement)
+
+def _upsert_portable(rows: List[Dict[str, Any]]):
+    """Fallback para bancos sem ON CONFLICT: uma consulta de chaves e duas instruções em lote"""
+    keys = [(row['region'], row['business_type']) for row in rows]
+    existing = {
+        (current.region, current.business_type): current
+        for current in db.session.query(
+            BusinessOpportunity.id, BusinessOpportunity.region, BusinessOpportunity.business_type,
+            *(getattr(BusinessOpportunity, column) for column in POSITION_COLUMNS)
+        ).filter(
+            tuple_(BusinessOpportunity.region, BusinessOpportunity.business_type).in_(keys)
+        )
+    }
+    
+    updates = []
+    inserts = []
+    for key, row in zip(keys, rows):
+        if key in existing:
+            current = existing[key]
+            values = {column: row[column] for column in UPSERT_UPDATE_COLUMNS}
+            if row['latitude'] is None:
+                # Análise sem coordenadas não apaga a posição já gravada
+                values.update({column: getattr(current, column) for column in POSITION_COLUMNS})
+            updates.append(dict(values, id=current.id))
+        else:
+            inserts.append(row)
+    
+    if updates:
+        db.session.execute(update(BusinessOpportunity), updates)
+    if inserts:
+        db.session.execute(insert(BusinessOpportunity), inserts)
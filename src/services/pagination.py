@@ -0,0 +1,134 @@
+import json
+import time
+import base64
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Dict, Hashable, Optional, Tuple
+from sqlalchemy import event, text, tuple_
+from src.models.data_models import db, CollectedData
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Validade das contagens em cache
+COUNT_TTL_SECONDS = 60
+
+# Filtros distintos mantidos em cache
+COUNT_MAX_ENTRIES = 256
+
+# Modos do parâmetro count
+COUNT_MODES = ('cached', 'exact', 'none')
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginação malformado"""
+
+
+def encode_cursor(timestamp: datetime, record_id: int) -> str:
+    """Cursor opaco com a chave (collection_timestamp, id) do último item da página"""
+    raw = json.dumps([timestamp.isoformat(), record_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, record_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Cursor inválido: {cursor}') from e
+
+
+def keyset_page(query, timestamp_column, id_column, cursor: Optional[str], limit: int, offset: int = 0):
+    """
+    Página em ordem decrescente de (timestamp, id) a partir do cursor,
+    percorrendo o índice em vez de pular offset linhas (offset continua
+    aceito para clientes antigos). Retorna (itens, next_cursor);
+    next_cursor é None na última página.
+    """
+    if cursor:
+        query = query.filter(tuple_(timestamp_column, id_column) < tuple_(*decode_cursor(cursor)))
+
+    query = query.order_by(timestamp_column.desc(), id_column.desc())
+    if offset and not cursor:
+        query = query.offset(offset)
+    items = query.limit(limit + 1).all()
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    last = items[-1]
+    if hasattr(last, '_mapping'):  # linha (entidade, colunas extras)
+        last = last[0]
+    return items, encode_cursor(getattr(last, timestamp_column.key), getattr(last, id_column.key))
+
+
+class CountCache:
+    """
+    Contagens de resultados por filtro, em memória e com TTL, para que cada
+    página não refaça um COUNT sobre a tabela inteira. Sem filtros, no
+    PostgreSQL, usa a estimativa do planejador (pg_class.reltuples).
+    """
+
+    def __init__(self, ttl_seconds: float = COUNT_TTL_SECONDS, max_entries: int = COUNT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = {}  # filtro -> (expira_em, total, estimado)
+        self._lock = threading.Lock()
+
+    def count(self, key: Hashable, query, table_name: Optional[str] = None,
+              mode: str = 'cached') -> Dict[str, Any]:
+        """
+        Total da query: 'cached' (cache ou estimativa), 'exact' (COUNT e
+        atualiza o cache) ou 'none' (sem total)
+        """
+        if mode == 'none':
+            return {'total': None, 'total_estimated': False}
+
+        now = time.monotonic()
+        if mode == 'cached':
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                return {'total': entry[1], 'total_estimated': entry[2]}
+
+        estimated = False
+        total = None
+        if mode == 'cached' and table_name and not any(key):
+            total = self._estimate(table_name)
+            estimated = total is not None
+        if total is None:
+            total = query.order_by(None).count()
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (now + self.ttl_seconds, total, estimated)
+        return {'total': total, 'total_estimated': estimated}
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _estimate(table_name: str) -> Optional[int]:
+        """Número estimado de linhas (PostgreSQL, tabelas já analisadas)"""
+        if db.session.get_bind().dialect.name != 'postgresql':
+            return None
+        estimate = db.session.execute(
+            text("SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass(:table)"),
+            {'table': table_name}
+        ).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+
+
+# Instância compartilhada pelo processo
+collected_data_counts = CountCache()
+
+
+@event.listens_for(CollectedData, 'after_insert')
+def _invalidate_counts(mapper, connection, target):
+    """Novas coletas alteram os totais deste processo"""
+    collected_data_counts.invalidate()
@@ -0,0 +1,66 @@
+import re
+from typing import Dict, List, Any, Sequence
+from src.models.data_models import CollectedData, BusinessOpportunity, native_json
+from src.models.compression import decompress_json
+
+# Documento JSON -> (coluna JSONB, coluna comprimida, coluna de texto antiga)
+PAYLOAD_COLUMNS = {
+    'analysis_data': (
+        BusinessOpportunity.analysis_data_json,
+        BusinessOpportunity.analysis_data_compressed,
+        BusinessOpportunity.analysis_data
+    ),
+    'raw_data': (CollectedData.raw_data_json, CollectedData.raw_data_compressed, CollectedData.raw_data),
+    'processed_data': (
+        CollectedData.processed_data_json,
+        CollectedData.processed_data_compressed,
+        CollectedData.processed_data
+    )
+}
+
+# Campos aceitos: chaves separadas por ponto ("demand_analysis.demand_score")
+FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*){0,3}$')
+
+
+def parse_fields(value: str) -> List[str]:
+    """Lista de campos do parâmetro fields (separados por vírgula); ignora nomes inválidos"""
+    fields = [field.strip() for field in (value or '').split(',')]
+    return [field for field in dict.fromkeys(fields) if FIELD_PATTERN.match(field)]
+
+
+def _label(payload: str, field: str) -> str:
+    return f"{payload}__{field.replace('.', '__')}"
+
+
+def payload_field_columns(payload: str, fields: Sequence[str]) -> List[Any]:
+    """
+    Colunas a acrescentar à query para ler campos de um documento. No
+    PostgreSQL, cada campo é extraído do JSONB no servidor; nos demais
+    bancos, o documento é lido uma vez por linha e decodificado em Python.
+    """
+    json_column, compressed_column, text_column = PAYLOAD_COLUMNS[payload]
+    if native_json():
+        return [
+            json_column[tuple(field.split('.')) if '.' in field else field].label(_label(payload, field))
+            for field in fields
+        ]
+    return [
+        compressed_column.label(f'{payload}__compressed'),
+        text_column.label(f'{payload}__text')
+    ]
+
+
+def payload_field_values(row: Any, payload: str, fields: Sequence[str]) -> Dict[str, Any]:
+    """Valores dos campos em uma linha de query com payload_field_columns"""
+    values = row._mapping
+    if native_json():
+        return {field: values[_label(payload, field)] for field in fields}
+
+    document = decompress_json(values[f'{payload}__compressed'], values[f'{payload}__text']) or {}
+    result = {}
+    for field in fields:
+        value = document
+        for key in field.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        result[field] = value
+    return result
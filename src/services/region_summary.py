@@ -0,0 +1,102 @@
+import logging
+from typing import Dict, List, Any, Optional, Sequence
+from sqlalchemy import case
+from src.models.data_models import db, BusinessOpportunity
+from src.services.normalization import fold_name
+from src.services.search_filters import business_type_filter
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Faixas de qualidade por score mínimo, da melhor para a pior
+SCORE_BANDS = (
+    ('excellent', 80),
+    ('good', 65),
+    ('moderate', 50),
+    ('low', None)
+)
+
+
+def _band_counts(score):
+    """Uma contagem condicional (SUM(CASE ...)) por faixa de score"""
+    columns = []
+    upper = None
+    for band, lower in SCORE_BANDS:
+        conditions = []
+        if lower is not None:
+            conditions.append(score >= lower)
+        if upper is not None:
+            conditions.append(score < upper)
+        columns.append(db.func.sum(case((db.and_(*conditions), 1), else_=0)).label(band))
+        upper = lower
+    return columns
+
+
+def summarize_regions(regions: Optional[Sequence[str]] = None, business_type: Optional[str] = None,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Resumo das oportunidades por região em uma única query (GROUP BY
+    region_key): total, score médio, melhor categoria e distribuição por
+    faixa de qualidade. Sem regions, retorna as regiões analisadas mais
+    recentemente (até limit).
+    """
+    ranked = db.session.query(
+        BusinessOpportunity.region_key.label('region_key'),
+        BusinessOpportunity.region.label('region'),
+        BusinessOpportunity.business_type.label('business_type'),
+        BusinessOpportunity.opportunity_score.label('score'),
+        BusinessOpportunity.updated_at.label('updated_at'),
+        db.func.row_number().over(
+            partition_by=BusinessOpportunity.region_key,
+            order_by=(BusinessOpportunity.opportunity_score.desc(), BusinessOpportunity.id)
+        ).label('rank')
+    )
+    if regions is not None:
+        ranked = ranked.filter(BusinessOpportunity.region_key.in_({fold_name(region) for region in regions}))
+    if business_type:
+        ranked = ranked.filter(business_type_filter(BusinessOpportunity.business_type, business_type))
+    ranked = ranked.subquery()
+
+    is_best = ranked.c.rank == 1
+    query = db.session.query(
+        ranked.c.region_key,
+        db.func.max(case((is_best, ranked.c.region))).label('region'),
+        db.func.count().label('total'),
+        db.func.avg(ranked.c.score).label('average_score'),
+        db.func.max(case((is_best, ranked.c.business_type))).label('best_business_type'),
+        db.func.max(ranked.c.score).label('best_score'),
+        db.func.max(ranked.c.updated_at).label('last_analysis'),
+        *_band_counts(ranked.c.score)
+    ).group_by(ranked.c.region_key).order_by(db.func.max(ranked.c.updated_at).desc())
+    if limit:
+        query = query.limit(limit)
+
+    return [
+        {
+            'region_key': row.region_key,
+            'region': row.region,
+            'total_opportunities': row.total,
+            'average_score': round(row.average_score or 0, 1),
+            'best_opportunity': {
+                'business_type': row.best_business_type,
+                'score': row.best_score
+            },
+            'last_analysis': row.last_analysis,
+            'score_distribution': {band: int(getattr(row, band) or 0) for band, _ in SCORE_BANDS}
+        }
+        for row in query.all()
+    ]
+
+
+def empty_summary(region: str) -> Dict[str, Any]:
+    """Resumo de uma região sem oportunidades"""
+    return {
+        'region_key': fold_name(region),
+        'region': region,
+        'total_opportunities': 0,
+        'average_score': 0,
+        'best_opportunity': None,
+        'last_analysis': None,
+        'score_distribution': {band: 0 for band, _ in SCORE_BANDS}
+    }
@@ -3,8 +3,10 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import logging
+from sqlalchemy.orm import undefer_group
 from src.models.data_models import db, BusinessOpportunity, CollectedData
 from src.services.opportunity_analysis import OpportunityAnalysisService
+from src.services.search_filters import region_key_filter, business_type_filter
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
@@ -29,17 +31,18 @@ class ReportGenerationService:
         try:
             logger.info(f"Gerando relatório executivo para {region}")
             
-            # Buscar oportunidades da região
+            # Buscar oportunidades da região (índice region_key, business_type)
             query = BusinessOpportunity.query.filter(
-                BusinessOpportunity.region.ilike(f'%{region}%')
+                region_key_filter(BusinessOpportunity.region_key, region, exact=True)
             )
             
             if business_type:
                 query = query.filter(
-                    BusinessOpportunity.business_type.ilike(f'%{business_type}%')
+                    business_type_filter(BusinessOpportunity.business_type, business_type)
                 )
             
-            opportunities = query.order_by(
+            # analysis_data é usado em _identify_market_gaps: carregar junto
+            opportunities = query.options(undefer_group('analysis_data')).order_by(
                 BusinessOpportunity.opportunity_score.desc()
             ).all()
             
@@ -153,9 +156,9 @@ class ReportGenerationService:
             
             # Buscar oportunidade específica
             opportunity = BusinessOpportunity.query.filter(
-                BusinessOpportunity.region.ilike(f'%{region}%'),
-                BusinessOpportunity.business_type.ilike(f'%{business_type}%')
-            ).first()
+                region_key_filter(BusinessOpportunity.region_key, region, exact=True),
+                business_type_filter(BusinessOpportunity.business_type, business_type)
+            ).options(undefer_group('analysis_data')).first()
             
             if not opportunity:
                 return {
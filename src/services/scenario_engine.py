@@ -0,0 +1,243 @@
+import math
+import itertools
+import threading
+import logging
+import numpy as np
+from typing import Dict, List, Any, Optional
+from sqlalchemy import func
+from src.models.data_models import db, BusinessOpportunity
+from src.services.payload_fields import payload_field_columns, payload_field_values
+from src.services.scoring_engine import ScoringEngine, SCORE_COMPONENTS
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Máximo de cenários por requisição (inclusive os gerados por grade)
+MAX_SCENARIOS = 1000
+
+# Máximo de células (oportunidades × cenários) calculadas por bloco
+MAX_BLOCK_CELLS = 5_000_000
+
+# Componentes lidas de analysis_data (extraídas no servidor no PostgreSQL)
+COMPONENT_FIELDS = [
+    'density_analysis.gap_percentage',
+    'demand_analysis.demand_score',
+    'competition_analysis.competition_score',
+    'sentiment_analysis.sentiment_score'
+]
+
+
+def _component(components: Dict[str, Any], field: str, default: float) -> float:
+    value = components.get(field)
+    return value if value is not None else default
+
+
+def _weight(value: Any, label: str) -> float:
+    """Peso numérico e finito (ValueError caso contrário)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f'Peso inválido para {label}: {value!r} (use um número finito)')
+    return float(value)
+
+
+def parse_top(value: Any) -> int:
+    """Quantidade de oportunidades por cenário: inteiro >= 1 (ValueError caso contrário)"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f'top deve ser um inteiro maior ou igual a 1: {value!r}')
+    return value
+
+
+class ComponentStore:
+    """
+    Matriz em memória das componentes de score (oportunidades × componentes)
+    de business_opportunities. É recarregada apenas quando a tabela muda
+    (contagem ou último updated_at).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.regions = np.array([], dtype=object)
+        self.business_types = np.array([], dtype=object)
+        self.components = np.zeros((0, len(SCORE_COMPONENTS)))
+
+    def snapshot(self):
+        """Retorna (regiões, tipos de negócio, componentes) atualizados"""
+        version = db.session.query(
+            func.count(BusinessOpportunity.id), func.max(BusinessOpportunity.updated_at)
+        ).one()
+        version = (version[0], version[1])
+
+        with self._lock:
+            if version != self._version:
+                self._reload()
+                self._version = version
+            return self.regions, self.business_types, self.components
+
+    def _reload(self):
+        """Lê as componentes salvas em analysis_data de todas as oportunidades"""
+        rows = db.session.query(
+            BusinessOpportunity.region,
+            BusinessOpportunity.business_type,
+            *payload_field_columns('analysis_data', COMPONENT_FIELDS)
+        ).all()
+
+        regions = []
+        business_types = []
+        gap = np.zeros(len(rows))
+        demand = np.zeros(len(rows))
+        competition = np.zeros(len(rows))
+        sentiment = np.zeros(len(rows))
+
+        for i, row in enumerate(rows):
+            components = payload_field_values(row, 'analysis_data', COMPONENT_FIELDS)
+            regions.append(row.region)
+            business_types.append(row.business_type)
+            gap[i] = _component(components, 'density_analysis.gap_percentage', 0)
+            demand[i] = _component(components, 'demand_analysis.demand_score', 0)
+            competition[i] = _component(components, 'competition_analysis.competition_score', 50)
+            sentiment[i] = _component(components, 'sentiment_analysis.sentiment_score', 50)
+
+        self.regions = np.array(regions, dtype=object)
+        self.business_types = np.array(business_types, dtype=object)
+        self.components = ScoringEngine.stack_components(gap, demand, competition, sentiment)
+        logger.info(f"Componentes de score recarregadas: {len(rows)} oportunidades")
+
+
+class ScenarioEngine:
+    """
+    Reavalia todas as oportunidades salvas sob vetores de pesos alternativos
+    (ou uma grade de pesos) de uma só vez, retornando variações de score e
+    de ranking em relação aos pesos atuais.
+    """
+
+    def __init__(self, score_weights: Dict[str, float], store: Optional[ComponentStore] = None):
+        self.score_weights = score_weights
+        self.store = store or ComponentStore()
+
+    def build_scenarios(self, scenarios: Optional[List[Dict[str, Any]]] = None,
+                        grid: Optional[Dict[str, List[float]]] = None) -> List[Dict[str, Any]]:
+        """
+        Normaliza a lista de cenários; pesos omitidos herdam os atuais.
+        A grade gera o produto cartesiano dos valores informados por componente.
+        """
+        if scenarios is not None and not isinstance(scenarios, list):
+            raise ValueError('scenarios deve ser uma lista')
+        if grid is not None and not isinstance(grid, dict):
+            raise ValueError('grid deve ser um objeto {componente: [valores]}')
+
+        built = []
+        for i, scenario in enumerate(scenarios or []):
+            overrides = scenario.get('weights') if isinstance(scenario, dict) else None
+            if not isinstance(scenario, dict) or not isinstance(overrides or {}, dict):
+                raise ValueError(f'Cenário {i + 1} inválido: use {{"name": ..., "weights": {{...}}}}')
+            overrides = {name: _weight(value, name) for name, value in (overrides or {}).items()}
+            weights = dict(self.score_weights, **overrides)
+            built.append({'name': scenario.get('name') or f'scenario_{i + 1}', 'weights': weights})
+
+        if grid:
+            names = [name for name in SCORE_COMPONENTS if name in grid]
+            axes = []
+            for name in names:
+                if not isinstance(grid[name], list) or not grid[name]:
+                    raise ValueError(f'grid.{name} deve ser uma lista não vazia de números')
+                axes.append([_weight(value, name) for value in grid[name]])
+            if math.prod(len(axis) for axis in axes) > MAX_SCENARIOS:
+                raise ValueError(f'Máximo de {MAX_SCENARIOS} cenários por requisição')
+            for values in itertools.product(*axes):
+                overrides = dict(zip(names, values))
+                built.append({
+                    'name': ', '.join(f'{name}={value}' for name, value in overrides.items()),
+                    'weights': dict(self.score_weights, **overrides)
+                })
+
+        unknown = {key for scenario in built for key in scenario['weights']} - set(SCORE_COMPONENTS)
+        if unknown:
+            raise ValueError(f"Pesos desconhecidos: {', '.join(sorted(unknown))}")
+        if not built:
+            raise ValueError('Nenhum cenário informado')
+        if len(built) > MAX_SCENARIOS:
+            raise ValueError(f'Máximo de {MAX_SCENARIOS} cenários por requisição')
+        return built
+
+    def run(self, scenarios: List[Dict[str, Any]], region: Optional[str] = None,
+            business_type: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """Reavalia as oportunidades (opcionalmente filtradas) para cada cenário"""
+        regions, business_types, components = self.store.snapshot()
+
+        mask = np.ones(len(regions), dtype=bool)
+        if region:
+            mask &= np.array([region.lower() in r.lower() for r in regions], dtype=bool)
+        if business_type:
+            mask &= np.array([business_type.lower() in b.lower() for b in business_types], dtype=bool)
+        regions, business_types, components = regions[mask], business_types[mask], components[mask]
+
+        n_opportunities = len(regions)
+        baseline = ScoringEngine.weighted_scores(
+            components, ScoringEngine.weights_vector(self.score_weights)
+        )
+        baseline_ranks = self._ranks(baseline[:, None])[:, 0]
+
+        weights = np.stack([
+            ScoringEngine.weights_vector(scenario['weights']) for scenario in scenarios
+        ], axis=1)
+
+        block = max(1, MAX_BLOCK_CELLS // max(n_opportunities, 1))
+        results = []
+        for start in range(0, len(scenarios), block):
+            # Todas as oportunidades × bloco de cenários em uma operação matricial
+            scores = ScoringEngine.weighted_scores(components, weights[:, start:start + block])
+            ranks = self._ranks(scores)
+            for k in range(scores.shape[1]):
+                results.append(self._summarize(
+                    scenarios[start + k], regions, business_types,
+                    baseline, baseline_ranks, scores[:, k], ranks[:, k], top
+                ))
+
+        return {
+            'total_opportunities': n_opportunities,
+            'baseline_weights': self.score_weights,
+            'scenarios': results
+        }
+
+    @staticmethod
+    def _ranks(scores: np.ndarray) -> np.ndarray:
+        """Posição (1 = melhor) de cada oportunidade em cada coluna de scores"""
+        order = np.argsort(-scores, axis=0, kind='stable')
+        ranks = np.empty_like(order)
+        positions = np.broadcast_to(np.arange(1, scores.shape[0] + 1)[:, None], order.shape)
+        np.put_along_axis(ranks, order, positions, axis=0)
+        return ranks
+
+    @staticmethod
+    def _summarize(scenario: Dict[str, Any], regions: np.ndarray, business_types: np.ndarray,
+                   baseline: np.ndarray, baseline_ranks: np.ndarray, scores: np.ndarray,
+                   ranks: np.ndarray, top: int) -> Dict[str, Any]:
+        """Resume um cenário: estatísticas de variação, melhores e maiores mudanças"""
+        deltas = np.round(scores - baseline, 1)
+        rank_changes = baseline_ranks - ranks  # positivo = subiu no ranking
+
+        def entry(i):
+            return {
+                'region': regions[i],
+                'business_type': business_types[i],
+                'score': float(scores[i]),
+                'baseline_score': float(baseline[i]),
+                'score_delta': float(deltas[i]),
+                'rank': int(ranks[i]),
+                'baseline_rank': int(baseline_ranks[i]),
+                'rank_change': int(rank_changes[i])
+            }
+
+        top_indices = np.argsort(ranks, kind='stable')[:top]
+        mover_indices = np.argsort(-np.abs(rank_changes), kind='stable')[:top]
+
+        return {
+            'name': scenario['name'],
+            'weights': scenario['weights'],
+            'mean_score_delta': round(float(deltas.mean()), 2) if len(deltas) else 0,
+            'max_abs_score_delta': round(float(np.abs(deltas).max()), 1) if len(deltas) else 0,
+            'changed_ranks': int(np.count_nonzero(rank_changes)),
+            'top_opportunities': [entry(i) for i in top_indices],
+            'largest_rank_changes': [entry(i) for i in mover_indices if rank_changes[i] != 0]
+        }
@@ -0,0 +1,365 @@
+import numpy as np
+from typing import Dict, List, Any
+import logging
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ordem das componentes do score (mesma ordem das chaves de score_weights)
+SCORE_COMPONENTS = [
+    'density_gap',
+    'demand_potential',
+    'competition_level',
+    'economic_indicators',
+    'sentiment_score'
+]
+
+# Denominadores dos fatores de demanda (população, densidade, aluguel) por tipo de negócio
+DEMAND_FACTOR_DENOMINATORS = {
+    'Pet Shop': (10000, 15000, 20000),
+    'Barbearia': (5000, 10000, 15000),
+    'Restaurante': (8000, 12000, 25000)
+}
+DEFAULT_DEMAND_FACTOR_DENOMINATORS = (8000, 12000, 18000)
+
+# Densidade média nacional estimada (estabelecimentos por 100k habitantes)
+AVG_DENSITY_NATIONAL = 50
+
+COMPETITION_LEVELS = np.array(['low', 'medium', 'high', 'very_high'])
+COMPETITION_BASE_SCORES = np.array([80.0, 60.0, 40.0, 20.0])
+
+
+def round_like_python(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """
+    Arredonda como o round() do Python. np.round difere em empates decimais
+    (ex.: 84.65), então esses poucos elementos são arredondados um a um.
+    """
+    values = np.asarray(values, dtype=float)
+    scale = 10.0 ** ndigits
+    scaled = values * scale
+    result = np.rint(scaled) / scale
+
+    ties = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < 1e-6
+    if ties.any():
+        result[ties] = [round(float(value), ndigits) for value in values[ties]]
+    return result
+
+
+def index_by_category(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Indexa registros pela categoria (minúscula), mantendo a primeira ocorrência"""
+    index = {}
+    for record in records or []:
+        key = record.get('categoria', '').lower()
+        if key not in index:
+            index[key] = record
+    return index
+
+
+class ScoringEngine:
+    """
+    Motor de scoring colunar: organiza regiões × categorias em arrays NumPy
+    e calcula lacuna, demanda, concorrência, sentimento e score final em uma
+    única passada vetorizada.
+    """
+
+    def __init__(self, business_categories: List[str], population_thresholds: Dict[str, int],
+                 score_weights: Dict[str, float]):
+        self.business_categories = list(business_categories)
+        self.category_keys = [category.lower() for category in self.business_categories]
+
+        self.thresholds = np.array(
+            [population_thresholds.get(category, 5000) for category in self.business_categories],
+            dtype=float
+        )
+
+        denominators = np.array([
+            DEMAND_FACTOR_DENOMINATORS.get(category, DEFAULT_DEMAND_FACTOR_DENOMINATORS)
+            for category in self.business_categories
+        ], dtype=float)
+        self.population_denominators = denominators[:, 0]
+        self.density_denominators = denominators[:, 1]
+        self.rent_denominators = denominators[:, 2]
+
+        self.weights = self.weights_vector(score_weights)
+
+    @staticmethod
+    def weights_vector(score_weights: Dict[str, float]) -> np.ndarray:
+        """Converte um dicionário de pesos para vetor na ordem de SCORE_COMPONENTS"""
+        return np.array([float(score_weights.get(name, 0)) for name in SCORE_COMPONENTS])
+
+    def build_features(self, region_inputs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Monta a matriz de features (regiões × categorias) a partir dos dados brutos
+        de cada região (demographic, business, social, rental)
+        """
+        n_regions = len(region_inputs)
+        n_categories = len(self.business_categories)
+        shape = (n_regions, n_categories)
+
+        features = {
+            'population': np.zeros(n_regions),
+            'density_population': np.zeros(n_regions),
+            'density': np.zeros(n_regions),
+            'avg_rent': np.zeros(n_regions),
+            'vacancy_rate': np.zeros(n_regions),
+            'business_count': np.zeros(shape),
+            'business_found': np.zeros(shape, dtype=bool),
+            'density_per_100k': np.zeros(shape),
+            'growth_rate': np.zeros(shape),
+            'raw_sentiment': np.zeros(shape),
+            'sentiment_found': np.zeros(shape, dtype=bool),
+            # Registros originais, usados apenas na fronteira da API
+            'business_records': [],
+            'social_records': []
+        }
+
+        for r, inputs in enumerate(region_inputs):
+            demographic_data = inputs.get('demographic') or {}
+            rental_data = inputs.get('rental') or {}
+
+            features['population'][r] = demographic_data.get('population', 0)
+            features['density_population'][r] = demographic_data.get('population', 50000)
+            features['density'][r] = demographic_data.get('density', 0)
+            features['avg_rent'][r] = rental_data.get('aluguel_medio_comercial', 0)
+            features['vacancy_rate'][r] = rental_data.get('taxa_vacancia', 0)
+
+            business_index = index_by_category(inputs.get('business'))
+            social_index = index_by_category(inputs.get('social'))
+            business_row = []
+            social_row = []
+
+            for c, key in enumerate(self.category_keys):
+                business = business_index.get(key)
+                if business is not None:
+                    features['business_found'][r, c] = True
+                    features['business_count'][r, c] = business.get('total_estabelecimentos', 0)
+                    features['density_per_100k'][r, c] = business.get('densidade_por_100k_hab', 0)
+                    features['growth_rate'][r, c] = business.get('crescimento_ultimo_ano', 0)
+
+                sentiment = social_index.get(key)
+                if sentiment is not None:
+                    features['sentiment_found'][r, c] = True
+                    features['raw_sentiment'][r, c] = sentiment.get('score_sentimento', 0)
+
+                business_row.append(business)
+                social_row.append(sentiment)
+
+            features['business_records'].append(business_row)
+            features['social_records'].append(social_row)
+
+        return features
+
+    def score(self, features: Dict[str, Any]) -> Dict[str, np.ndarray]:
+        """
+        Calcula todas as componentes e o score final para a matriz de features
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # --- Densidade e lacuna ---
+            density_population = features['density_population'][:, None]
+            count = features['business_count']
+            has_population = density_population > 0
+
+            density_per_1000 = np.where(has_population, count / density_population * 1000, 0.0)
+            density_per_10000 = np.where(has_population, count / density_population * 10000, 0.0)
+
+            ideal_count = density_population / self.thresholds[None, :]
+            gap_percentage = np.where(
+                ideal_count > 0,
+                np.maximum(0, (ideal_count - count) / ideal_count * 100),
+                0.0
+            )
+
+            # --- Potencial de demanda ---
+            population = features['population'][:, None]
+            density = features['density'][:, None]
+            avg_rent = features['avg_rent'][:, None]
+
+            population_factor = np.minimum(population / self.population_denominators[None, :], 1.0)
+            density_factor = np.minimum(density / self.density_denominators[None, :], 1.0)
+            rent_factor = np.maximum(0, 1 - avg_rent / self.rent_denominators[None, :])
+
+            vacancy_adjustment = np.maximum(0, (20 - features['vacancy_rate']) / 20)
+            demand_score = (
+                population_factor * 40 +
+                density_factor * 35 +
+                rent_factor * 25
+            ) * vacancy_adjustment[:, None]
+            estimated_customers = np.rint(population * population_factor * 0.1)
+
+        # --- Concorrência ---
+        business_found = features['business_found']
+        saturation = features['density_per_100k'] / AVG_DENSITY_NATIONAL
+        level_index = np.searchsorted(np.array([0.5, 1.0, 1.5]), saturation, side='right')
+        competition_score = COMPETITION_BASE_SCORES[level_index]
+        growth = features['growth_rate']
+        competition_score = competition_score - 10 * (growth > 10) + 10 * (growth < 0)
+        competition_score = np.clip(competition_score, 0, 100)
+        competition_score = np.where(business_found, competition_score, 50.0)
+        saturation = np.where(business_found, saturation, 0.0)
+
+        # --- Sentimento ---
+        sentiment_found = features['sentiment_found']
+        raw_sentiment = features['raw_sentiment']
+        sentiment_score = np.where(
+            sentiment_found,
+            np.clip((raw_sentiment + 100) / 2, 0, 100),
+            50.0
+        )
+
+        # Componentes arredondadas, como expostas pela API
+        gap_rounded = round_like_python(gap_percentage, 1)
+        demand_rounded = round_like_python(demand_score, 1)
+        competition_rounded = round_like_python(competition_score, 1)
+        sentiment_rounded = round_like_python(sentiment_score, 1)
+
+        components = self.stack_components(
+            gap_rounded, demand_rounded, competition_rounded, sentiment_rounded
+        )
+
+        return {
+            'density_per_1000': round_like_python(density_per_1000, 2),
+            'density_per_10000': round_like_python(density_per_10000, 2),
+            'ideal_count': round_like_python(ideal_count, 1),
+            'gap_percentage': gap_rounded,
+            'has_opportunity': gap_percentage > 20,
+            'demand_score': demand_rounded,
+            'population_factor': round_like_python(population_factor, 2),
+            'density_factor': round_like_python(density_factor, 2),
+            'rent_factor': round_like_python(rent_factor, 2),
+            'vacancy_adjustment': round_like_python(vacancy_adjustment, 2),
+            'estimated_monthly_customers': estimated_customers,
+            'competition_level_index': level_index,
+            'competition_score': competition_rounded,
+            'market_saturation': round_like_python(saturation, 2),
+            'sentiment_score': sentiment_rounded,
+            'components': components,
+            'opportunity_score': self.weighted_scores(components, self.weights)
+        }
+
+    @staticmethod
+    def stack_components(gap: np.ndarray, demand: np.ndarray, competition: np.ndarray,
+                         sentiment: np.ndarray) -> np.ndarray:
+        """
+        Empilha as componentes na ordem de SCORE_COMPONENTS (último eixo).
+        A demanda é usada também como proxy dos indicadores econômicos.
+        """
+        return np.stack([np.minimum(100, gap), demand, competition, demand, sentiment], axis=-1)
+
+    @staticmethod
+    def weighted_scores(components: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """
+        Aplica um vetor de pesos (n_componentes,) ou uma matriz de cenários
+        (n_componentes, n_cenários) às componentes. A soma é acumulada na mesma
+        ordem dos pesos (density_gap, demand_potential, ...) para manter os
+        mesmos arredondamentos entre o score gravado e o dos cenários.
+        """
+        weights = np.asarray(weights, dtype=float)
+        total = 0.0
+        for k in range(components.shape[-1]):
+            component = components[..., k]
+            if weights.ndim > 1:
+                component = component[..., None]
+            total = total + component * weights[k]
+        return round_like_python(total, 1)
+
+    def region_opportunities(self, features: Dict[str, Any], scores: Dict[str, np.ndarray],
+                             r: int) -> List[Dict[str, Any]]:
+        """
+        Converte a linha r dos arrays no formato de dicionários por categoria
+        usado pela API
+        """
+        opportunities = []
+        vacancy_adjustment = float(scores['vacancy_adjustment'][r])
+
+        for c, business_type in enumerate(self.business_categories):
+            business = features['business_records'][r][c]
+            sentiment = features['social_records'][r][c]
+
+            density_analysis = {
+                'current_count': business.get('total_estabelecimentos', 0) if business else 0,
+                'ideal_count': float(scores['ideal_count'][r, c]),
+                'density_per_1000': float(scores['density_per_1000'][r, c]),
+                'density_per_10000': float(scores['density_per_10000'][r, c]),
+                'gap_percentage': float(scores['gap_percentage'][r, c]),
+                'has_opportunity': bool(scores['has_opportunity'][r, c])
+            }
+
+            demand_analysis = {
+                'demand_score': float(scores['demand_score'][r, c]),
+                'population_factor': float(scores['population_factor'][r, c]),
+                'density_factor': float(scores['density_factor'][r, c]),
+                'rent_factor': float(scores['rent_factor'][r, c]),
+                'vacancy_adjustment': vacancy_adjustment,
+                'estimated_monthly_customers': int(scores['estimated_monthly_customers'][r, c])
+            }
+
+            if business:
+                competition_analysis = {
+                    'competition_level': str(COMPETITION_LEVELS[scores['competition_level_index'][r, c]]),
+                    'competition_score': int(scores['competition_score'][r, c]),
+                    'market_saturation': float(scores['market_saturation'][r, c]),
+                    'growth_trend': business.get('crescimento_ultimo_ano', 0),
+                    'establishment_count': business.get('total_estabelecimentos', 0),
+                    'density_per_100k': business.get('densidade_por_100k_hab', 0)
+                }
+            else:
+                competition_analysis = {
+                    'competition_level': 'unknown',
+                    'competition_score': 50,
+                    'market_saturation': 0,
+                    'growth_trend': 0
+                }
+
+            if sentiment:
+                sentiment_analysis = self._sentiment_analysis(
+                    sentiment, float(scores['sentiment_score'][r, c])
+                )
+            else:
+                sentiment_analysis = {
+                    'sentiment_score': 50,
+                    'sentiment_impact': 'neutral',
+                    'main_complaints': [],
+                    'opportunity_indicators': []
+                }
+
+            opportunities.append({
+                'business_type': business_type,
+                'opportunity_score': float(scores['opportunity_score'][r, c]),
+                'density_analysis': density_analysis,
+                'demand_analysis': demand_analysis,
+                'competition_analysis': competition_analysis,
+                'sentiment_analysis': sentiment_analysis
+            })
+
+        return opportunities
+
+    @staticmethod
+    def _sentiment_analysis(sentiment: Dict[str, Any], normalized_score: float) -> Dict[str, Any]:
+        """Monta o dicionário de sentimento para uma categoria encontrada"""
+        raw_score = sentiment.get('score_sentimento', 0)
+        complaints = sentiment.get('principais_reclamacoes', [])
+
+        if raw_score > 20:
+            sentiment_impact = 'positive'
+        elif raw_score > -20:
+            sentiment_impact = 'neutral'
+        else:
+            sentiment_impact = 'negative'
+
+        opportunity_indicators = []
+        if 'Atendimento demorado' in complaints:
+            opportunity_indicators.append('Oportunidade para serviço mais rápido')
+        if 'Preços altos' in complaints:
+            opportunity_indicators.append('Oportunidade para preços competitivos')
+        if 'Falta de variedade' in complaints:
+            opportunity_indicators.append('Oportunidade para maior variedade')
+
+        return {
+            'sentiment_score': normalized_score,
+            'sentiment_impact': sentiment_impact,
+            'main_complaints': complaints,
+            'opportunity_indicators': opportunity_indicators,
+            'total_mentions': sentiment.get('total_mencoes', 0),
+            'raw_sentiment_score': raw_score
+        }
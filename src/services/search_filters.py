@@ -0,0 +1,38 @@
+from src.services.normalization import fold_name
+from src.services.opportunity_analysis import BUSINESS_CATEGORIES
+
+
+def _like_escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def region_key_filter(column, region: str, exact: bool = False):
+    """
+    Filtro de região sobre a coluna region_key (sem acentos, minúscula):
+    igualdade, atendida pelos índices compostos, ou "contém", atendido no
+    PostgreSQL pelo índice de trigramas
+    """
+    key = fold_name(region)
+    if exact:
+        return column == key
+    return column.like(f'%{_like_escape(key)}%', escape='\\')
+
+
+def business_type_filter(column, business_type: str, exact: bool = False):
+    """
+    Filtro de tipo de negócio: o texto é resolvido em Python para as
+    categorias conhecidas (sem acentos e maiúsculas), virando uma lista
+    IN atendida pelos índices; texto que não corresponde a nenhuma
+    categoria mantém a busca "contém" original
+    """
+    key = fold_name(business_type)
+    if exact:
+        matches = [category for category in BUSINESS_CATEGORIES if fold_name(category) == key]
+    else:
+        matches = [category for category in BUSINESS_CATEGORIES if key in fold_name(category)]
+
+    if not matches:
+        return column == business_type if exact else column.ilike(f'%{business_type}%')
+    if len(matches) == 1:
+        return column == matches[0]
+    return column.in_(matches)
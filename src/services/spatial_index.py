@@ -0,0 +1,121 @@
+import math
+import logging
+from typing import Dict, List, Any, Optional, Tuple
+from sqlalchemy import event, and_, or_
+from src.models.data_models import CollectedData, BusinessOpportunity
+from src.services.geo import geohash, cover_bbox, radius_bbox, haversine_km
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Máximo de resultados por consulta espacial
+MAX_SPATIAL_RESULTS = 5000
+
+
+@event.listens_for(CollectedData, 'before_insert')
+@event.listens_for(CollectedData, 'before_update')
+@event.listens_for(BusinessOpportunity, 'before_insert')
+@event.listens_for(BusinessOpportunity, 'before_update')
+def _set_geohash(mapper, connection, target):
+    """Mantém o geohash sincronizado com latitude/longitude nas gravações via ORM"""
+    target.geohash = geohash(target.latitude, target.longitude)
+
+
+class SpatialQueryService:
+    """
+    Consultas por raio e por caixa (viewport) usando o índice B-tree do
+    geohash: a área é coberta por poucos intervalos de células e o filtro
+    exato é aplicado apenas aos candidatos.
+    """
+
+    def filter_bbox(self, query, model, min_lat: float, min_lon: float, max_lat: float,
+                    max_lon: float):
+        """Aplica a query (sobre model) o filtro da caixa, pelos intervalos de geohash"""
+        ranges = cover_bbox(min_lat, min_lon, max_lat, max_lon)
+        return query.filter(
+            or_(*[and_(model.geohash >= start, model.geohash < end) for start, end in ranges]),
+            model.latitude.between(min_lat, max_lat),
+            model.longitude.between(min_lon, max_lon)
+        )
+
+    def within_bbox(self, query, model, min_lat: float, min_lon: float, max_lat: float,
+                    max_lon: float, limit: int = 500) -> Tuple[List[Any], bool]:
+        """
+        Registros de query (sobre model) dentro da caixa e se o resultado foi
+        truncado em limit (há mais registros na caixa)
+        """
+        limit = min(limit, MAX_SPATIAL_RESULTS)
+        query = self.filter_bbox(query, model, min_lat, min_lon, max_lat, max_lon)
+        records = query.limit(limit + 1).all()
+        return records[:limit], len(records) > limit
+
+    def near(self, query, model, latitude: float, longitude: float, radius_km: float,
+             limit: int = 500) -> Tuple[List[Tuple[Any, float]], bool]:
+        """
+        Registros de query a até radius_km do ponto, ordenados por distância,
+        e se o resultado foi truncado em limit. O banco ordena os candidatos
+        pela distância equirretangular ao quadrado antes do LIMIT, então os
+        mais próximos nunca ficam de fora; a distância exata (haversine) é
+        calculada só para eles.
+        """
+        limit = min(limit, MAX_SPATIAL_RESULTS)
+        min_lat, min_lon, max_lat, max_lon = radius_bbox(latitude, longitude, radius_km)
+        lon_scale = math.cos(math.radians(latitude)) ** 2
+        squared_distance = (
+            (model.latitude - latitude) * (model.latitude - latitude)
+            + (model.longitude - longitude) * (model.longitude - longitude) * lon_scale
+        )
+        candidates = self.filter_bbox(
+            query, model, min_lat, min_lon, max_lat, max_lon
+        ).order_by(squared_distance, model.id).limit(limit + 1).all()
+
+        matches = []
+        for record in candidates:
+            distance = haversine_km(latitude, longitude, record.latitude, record.longitude)
+            if distance <= radius_km:
+                matches.append((record, round(distance, 3)))
+
+        matches.sort(key=lambda match: match[1])
+        return matches[:limit], len(matches) > limit
+
+
+def parse_bbox(args) -> Optional[Dict[str, float]]:
+    """Lê min_lat/min_lon/max_lat/max_lon dos parâmetros da requisição"""
+    try:
+        bbox = {key: float(args[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')}
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in bbox.values()):
+        return None
+    if bbox['min_lat'] > bbox['max_lat'] or bbox['min_lon'] > bbox['max_lon']:
+        return None
+    return bbox
+
+
+def parse_point(args) -> Optional[Dict[str, float]]:
+    """Lê lat/lon/radius_km dos parâmetros da requisição"""
+    try:
+        point = {
+            'latitude': float(args['lat']),
+            'longitude': float(args['lon']),
+            'radius_km': float(args.get('radius_km', 1))
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in point.values()):
+        return None
+    if point['radius_km'] <= 0:
+        return None
+    return point
+
+
+def parse_limit(args, default: int = 500) -> Optional[int]:
+    """Lê limit dos parâmetros da requisição (inteiro entre 1 e MAX_SPATIAL_RESULTS)"""
+    try:
+        limit = int(args.get('limit', default))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= limit <= MAX_SPATIAL_RESULTS:
+        return None
+    return limit
@@ -0,0 +1,123 @@
+import time
+import threading
+import logging
+from typing import Dict, List, Any, Optional, Iterable
+from sqlalchemy.orm import load_only
+from src.models.data_models import BusinessOpportunity
+
+# Configurar logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Oportunidades mantidas em memória por categoria
+TOP_CAPACITY = 1000
+
+# Recarga periódica (gravações feitas por outros workers não chegam aqui)
+TOP_TTL_SECONDS = 60
+
+# Chave da lista global (todas as categorias)
+ALL_CATEGORIES = None
+
+
+def serialize_opportunity_summary(opportunity: BusinessOpportunity) -> Dict[str, Any]:
+    """Campos resumidos de uma oportunidade (sem decodificar analysis_data)"""
+    return {
+        'id': opportunity.id,
+        'region': opportunity.region,
+        'business_type': opportunity.business_type,
+        'opportunity_score': opportunity.opportunity_score,
+        'competition_level': opportunity.competition_level,
+        'estimated_demand': opportunity.estimated_demand,
+        'latitude': opportunity.latitude,
+        'longitude': opportunity.longitude,
+        'updated_at': opportunity.updated_at.isoformat() if opportunity.updated_at else None
+    }
+
+
+class _TopList:
+    """Melhores oportunidades de uma categoria, em ordem decrescente de score"""
+
+    def __init__(self, entries: List[Dict[str, Any]], capacity: int):
+        self.entries = entries
+        self.keys = {(entry['region'], entry['business_type']) for entry in entries}
+        self.complete = len(entries) < capacity  # contém todas as linhas da categoria
+        self.loaded_at = time.monotonic()
+        self.stale = False
+
+    def affected_by(self, region: str, business_type: str, score: Optional[float]) -> bool:
+        """Indica se a gravação de uma linha pode alterar esta lista"""
+        if (region, business_type) in self.keys or self.complete:
+            return True
+        return score is not None and score >= self.entries[-1]['opportunity_score']
+
+
+class TopOpportunitiesIndex:
+    """
+    Top-K por categoria (e global) mantido em memória. Cada lista é carregada
+    pelo índice (business_type, opportunity_score DESC) e só é recarregada
+    quando uma gravação pode alterá-la ou quando expira o TTL.
+    """
+
+    def __init__(self, capacity: int = TOP_CAPACITY, ttl_seconds: float = TOP_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._lists = {}
+        self._lock = threading.Lock()
+
+    def top(self, business_type: Optional[str] = ALL_CATEGORIES, k: int = 100,
+            min_score: float = 0) -> List[Dict[str, Any]]:
+        """Retorna as k melhores oportunidades da categoria (ou de todas)"""
+        if k > self.capacity:
+            return self._query(business_type, k, min_score)
+
+        with self._lock:
+            top_list = self._lists.get(business_type)
+            expired = top_list is not None and time.monotonic() - top_list.loaded_at > self.ttl_seconds
+            if top_list is None or top_list.stale or expired:
+                top_list = _TopList(self._query(business_type, self.capacity), self.capacity)
+                self._lists[business_type] = top_list
+
+        entries = top_list.entries[:k]
+        if min_score > 0:
+            entries = [entry for entry in entries if entry['opportunity_score'] >= min_score]
+        return entries
+
+    def apply_writes(self, rows: Iterable[Dict[str, Any]]):
+        """Marca para recarga as listas que as linhas gravadas podem alterar"""
+        with self._lock:
+            for row in rows:
+                region = row['region']
+                business_type = row['business_type']
+                score = row.get('opportunity_score')
+                for key in (business_type, ALL_CATEGORIES):
+                    top_list = self._lists.get(key)
+                    if top_list is not None and not top_list.stale:
+                        top_list.stale = top_list.affected_by(region, business_type, score)
+
+    def invalidate(self):
+        """Descarta todas as listas em memória"""
+        with self._lock:
+            self._lists.clear()
+
+    @staticmethod
+    def _query(business_type: Optional[str], limit: int, min_score: float = 0) -> List[Dict[str, Any]]:
+        """Consulta ordenada pelo índice de score"""
+        query = BusinessOpportunity.query.options(load_only(
+            BusinessOpportunity.id, BusinessOpportunity.region, BusinessOpportunity.business_type,
+            BusinessOpportunity.opportunity_score, BusinessOpportunity.competition_level,
+            BusinessOpportunity.estimated_demand, BusinessOpportunity.latitude,
+            BusinessOpportunity.longitude, BusinessOpportunity.updated_at
+        ))
+        if business_type is not ALL_CATEGORIES:
+            query = query.filter(BusinessOpportunity.business_type == business_type)
+        if min_score > 0:
+            query = query.filter(BusinessOpportunity.opportunity_score >= min_score)
+
+        opportunities = query.order_by(
+            BusinessOpportunity.opportunity_score.desc(), BusinessOpportunity.id
+        ).limit(limit).all()
+        return [serialize_opportunity_summary(opportunity) for opportunity in opportunities]
+
+
+# Índice compartilhado pelas rotas do processo
+top_opportunities_index = TopOpportunitiesIndex()
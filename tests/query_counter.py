@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from typing import List, Optional
+from sqlalchemy import event
+from src.models.data_models import db
+
+
+class QueryCounter:
+    """
+    Conta os comandos SQL enviados ao banco enquanto está ativo. Usado para
+    verificar que um endpoint executa um número fixo de queries, em vez de
+    uma por linha retornada (N+1).
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        if self.engine is None:
+            self.engine = db.engine
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, engine=None):
+    """
+    Falha (AssertionError) se o bloco executar mais de max_queries comandos SQL.
+
+        with app.app_context(), assert_max_queries(2):
+            client.get('/api/data/sources')
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > max_queries:
+        listing = '\n'.join(f'  {index + 1}. {statement}' for index, statement in enumerate(counter.statements))
+        raise AssertionError(f'{counter.count} queries executadas (máximo {max_queries}):\n{listing}')
+
+
+def count_request_queries(client, method: str, url: str, engine: Optional[object] = None, **kwargs):
+    """Executa uma requisição no test client do Flask e retorna (resposta, queries executadas)"""
+    with QueryCounter(engine) as counter:
+        response = client.open(url, method=method, **kwargs)
+    return response, counter.count
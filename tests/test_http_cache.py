@@ -0,0 +1,145 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.services.http_cache import HTTPDiskCache, mount_http_cache
+
+LAST_MODIFIED = 'Wed, 01 Jan 2025 00:00:00 GMT'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve server.resources; responde 304 quando If-None-Match está em resource['valid']"""
+
+    def do_GET(self):
+        resource = self.server.resources.get(self.path)
+        self.server.seen.append((self.path, dict(self.headers)))
+        if resource is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') in resource.get('valid', ()):
+            self.send_response(304)
+            self.send_header('ETag', resource['etag'])
+            self.send_header('Last-Modified', resource['last_modified'])
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', resource['etag'])
+        self.send_header('Last-Modified', resource['last_modified'])
+        self.send_header('Content-Length', str(len(resource['body'])))
+        self.end_headers()
+        self.wfile.write(resource['body'])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    httpd.resources = {}
+    httpd.seen = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base_url = f'http://127.0.0.1:{httpd.server_port}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _resource(body, etag='"v1"'):
+    return {'body': body, 'etag': etag, 'last_modified': LAST_MODIFIED, 'valid': {etag}}
+
+
+def _session(cache):
+    session = requests.Session()
+    mount_http_cache(session, cache)
+    return session
+
+
+def test_not_modified_replays_cached_body(server, tmp_path):
+    server.resources['/data'] = _resource(b'municipios' * 100)
+    session = _session(HTTPDiskCache(str(tmp_path)))
+    url = server.base_url + '/data'
+
+    first = session.get(url)
+    second = session.get(url)
+
+    assert (first.status_code, first.from_cache) == (200, False)
+    assert (second.status_code, second.from_cache) == (200, True)
+    assert second.content == first.content == b'municipios' * 100
+    headers = server.seen[-1][1]
+    assert headers['If-None-Match'] == '"v1"'
+    assert headers['If-Modified-Since'] == LAST_MODIFIED
+
+
+def test_validators_are_refreshed(server, tmp_path):
+    server.resources['/data'] = _resource(b'v1')
+    cache = HTTPDiskCache(str(tmp_path))
+    session = _session(cache)
+    url = server.base_url + '/data'
+    session.get(url)
+
+    # 304 com um novo ETag: o corpo continua o do cache e o validador é atualizado
+    server.resources['/data'].update(etag='"v1b"', valid={'"v1"', '"v1b"'})
+    assert session.get(url).content == b'v1'
+    assert cache.lookup(url)['etag'] == '"v1b"'
+    session.get(url)
+    assert server.seen[-1][1]['If-None-Match'] == '"v1b"'
+
+    # Conteúdo alterado: 200 substitui corpo e validadores
+    server.resources['/data'] = _resource(b'v2', etag='"v2"')
+    response = session.get(url)
+    assert (response.content, response.from_cache) == (b'v2', False)
+    assert cache.lookup(url)['etag'] == '"v2"'
+    assert session.get(url).from_cache
+
+
+def test_least_recently_used_entry_is_evicted(server, tmp_path):
+    for name in ('a', 'b', 'c'):
+        server.resources[f'/{name}'] = _resource(name.encode() * 100)
+    cache = HTTPDiskCache(str(tmp_path), max_bytes=250)
+    session = _session(cache)
+
+    session.get(server.base_url + '/a')
+    session.get(server.base_url + '/b')
+    session.get(server.base_url + '/a')  # 304: a passa a ser a mais recente
+    session.get(server.base_url + '/c')
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['total_bytes'] <= 250
+    assert cache.lookup(server.base_url + '/a') is not None
+    assert cache.lookup(server.base_url + '/b') is None
+    assert cache.lookup(server.base_url + '/c') is not None
+
+
+def test_body_larger_than_limit_is_served_but_not_cached(server, tmp_path):
+    server.resources['/big'] = _resource(b'x' * 1000)
+    cache = HTTPDiskCache(str(tmp_path), max_bytes=100)
+    response = _session(cache).get(server.base_url + '/big')
+
+    assert response.content == b'x' * 1000
+    assert cache.stats()['entries'] == 0
+    assert [path.name for path in tmp_path.iterdir()] == []
+
+
+def test_index_is_rebuilt_from_disk_after_restart(server, tmp_path):
+    for name in ('a', 'b'):
+        server.resources[f'/{name}'] = _resource(name.encode() * 100)
+    session = _session(HTTPDiskCache(str(tmp_path)))
+    session.get(server.base_url + '/a')
+    session.get(server.base_url + '/b')
+    session.get(server.base_url + '/a')
+    (tmp_path / 'orphan.tmp').write_bytes(b'partial')
+
+    # Reinício: o índice vem dos arquivos e o LRU segue o último uso gravado
+    restarted = HTTPDiskCache(str(tmp_path), max_bytes=150)
+    assert restarted.stats()['entries'] == 1
+    assert restarted.lookup(server.base_url + '/a') is not None
+    assert not (tmp_path / 'orphan.tmp').exists()
+
+    response = _session(restarted).get(server.base_url + '/a')
+    assert (response.content, response.from_cache) == (b'a' * 100, True)
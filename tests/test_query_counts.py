@@ -0,0 +1,69 @@
+import os
+import tempfile
+
+import pytest
+
+# src.main lê DATABASE_URL na importação: banco SQLite temporário para os testes
+_DATABASE_FILE = os.path.join(tempfile.mkdtemp(), 'query_counts.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_DATABASE_FILE}'
+
+from src.main import app  # noqa: E402
+from src.models.data_models import db, DataSource, CollectedData  # noqa: E402
+from tests.query_counter import count_request_queries  # noqa: E402
+
+# Queries por requisição, independentemente do número de linhas
+MAX_SOURCES_QUERIES = 1
+MAX_DATA_QUERIES = 2
+
+
+def _add_collections(total):
+    """Grava total coletas repartidas entre duas fontes"""
+    sources = DataSource.query.order_by(DataSource.id).all()
+    if not sources:
+        sources = [DataSource(name='Fonte A', type='api'), DataSource(name='Fonte B', type='api')]
+        db.session.add_all(sources)
+        db.session.flush()
+    for index in range(total):
+        collected = CollectedData(
+            source_id=sources[index % len(sources)].id, data_type='demographic', region=f'Região {index}'
+        )
+        collected.set_raw_data({'data': [{'nome': f'Região {index}'}]})
+        collected.set_processed_data({'total_records': 1})
+        db.session.add(collected)
+    db.session.commit()
+
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app.test_client()
+        db.session.remove()
+
+
+@pytest.mark.parametrize('url, max_queries', [
+    ('/api/data/sources', MAX_SOURCES_QUERIES),
+    ('/api/data/data?count=exact', MAX_DATA_QUERIES),
+    ('/api/data/data?source=Fonte&count=exact', MAX_DATA_QUERIES),
+])
+def test_query_count_does_not_grow_with_rows(client, url, max_queries):
+    counts = []
+    for total in (5, 50):
+        _add_collections(total)
+        response, queries = count_request_queries(client, 'GET', url)
+        assert response.status_code == 200
+        assert response.get_json()['success']
+        counts.append(queries)
+
+    assert counts[0] == counts[1]
+    assert counts[1] <= max_queries
+
+
+def test_sources_report_collection_totals(client):
+    _add_collections(6)
+
+    response = client.get('/api/data/sources')
+
+    totals = {source['name']: source['total_collections'] for source in response.get_json()['sources']}
+    assert totals == {'Fonte A': 3, 'Fonte B': 3}